@@ -1,23 +1,31 @@
 # backend/app/api/dependencies.py
-from fastapi import Depends, HTTPException
+from fastapi import Depends, HTTPException, UploadFile
 import traceback
 import torch
-import torch.nn as nn
 import os
-from typing import Dict, Any
+from typing import Dict, Any, Optional, List, Tuple
+import numpy as np
+import hashlib
 
-# Import Uformer model and its necessary building blocks from the copied Uformer files
-from uformer_model.model import Uformer, Downsample, Upsample
+# Import Uformer model and the registry that describes every servable variant
+from uformer_model.model import Uformer
+from app.engine.model_registry import load_model_registry, build_model, apply_load_time_optimizations, resolve_model_key
+from app.engine.session import InferenceSession
+from app.engine.roi import ROI_BACKGROUNDS, parse_roi_rectangles, decode_roi_mask
+from app.engine.result_cache import result_key
 
 # --- DEFINE THE SHARED STATE DICTIONARY HERE ---
 # app_models will hold model instances or their definitions based on loading strategy.
 # It also stores 'device' and 'load_all_on_startup' flag.
 app_models: Dict[str, Any] = {}
 
-# Dictionary to hold model definitions (callable functions to create a model instance)
-# This prevents re-defining the model architecture every time in on-demand mode.
+# Dictionary to hold model definitions (registry spec and weights path per model key).
+# Instances are built from the spec when a model is actually loaded.
 model_definitions_dict = {}
 
+# The parsed model registry file (speed tiers and every model spec), see app/engine/model_registry.py
+model_registry: Dict[str, Any] = {}
+
 def unload_all_models_from_memory(models_dict: Dict[str, Any]):
     """Clears all loaded model instances from the shared dictionary and CUDA cache."""
     device = models_dict.get("device", torch.device("cpu"))
@@ -27,12 +35,16 @@ def unload_all_models_from_memory(models_dict: Dict[str, Any]):
     keys_to_delete = [k for k in models_dict.keys() if k in model_definitions_dict]
     for key in keys_to_delete:
         del models_dict[key]
+    # Sessions hold a reference to their model, so they must go too for the memory to be freed
+    models_dict.get("inference_sessions", {}).clear()
+    if "buffer_pool" in models_dict:
+        models_dict["buffer_pool"].clear()
     if device.type == 'cuda':
         torch.cuda.empty_cache()
         print("CUDA cache cleared.")
     print("All models unloaded.")
 
-def _load_single_model_weights(model_instance: Uformer, model_path: str, model_key: str, debug_log_dir: str, device: torch.device) -> Uformer:
+def _load_single_model_weights(model_instance: Uformer, model_path: str, model_key: str, debug_log_dir: str, device: torch.device, strict: bool = True) -> Uformer:
     """Helper function to load state dict for a given model instance and log its keys."""
     if not os.path.exists(model_path):
         raise FileNotFoundError(f"Uformer model weights not found at: {model_path}")
@@ -61,123 +73,52 @@ def _load_single_model_weights(model_instance: Uformer, model_path: str, model_k
         print(f"--- DEBUG: FAILED TO WRITE DEBUG FILE FOR '{model_key}': {e} ---")
     # --- END OF DEBUGGING CODE ---
 
-    model_instance.load_state_dict(new_state_dict, strict=True)
+    model_instance.load_state_dict(new_state_dict, strict=strict)
     model_instance.to(device)
     model_instance.eval()
     print(f"Successfully loaded model from {os.path.basename(model_path)} as '{model_key}'.")
     return model_instance
 
 
+def _load_model_from_definition(model_key: str, device: torch.device, debug_log_dir: str) -> torch.nn.Module:
+    """Builds a fresh instance from the model's registry spec, loads its weights and applies load-time options."""
+    spec = model_definitions_dict[model_key]['spec']
+    model_instance = _load_single_model_weights(
+        build_model(spec),
+        model_definitions_dict[model_key]['path'],
+        model_key,
+        debug_log_dir,
+        device,
+        strict=spec['execution']['strict_load']
+    )
+    return apply_load_time_optimizations(model_instance, spec, device)
+
+
 async def load_models(device: torch.device, app_models: Dict[str, Any], load_all: bool = False, load_definitions_only: bool = False):
     """
-    Conditionally loads Uformer models:
+    Conditionally loads Uformer models declared in the model registry file:
     - If load_all=True, loads all models with weights into app_models.
-    - If load_definitions_only=True, only stores model constructors in model_definitions_dict.
+    - If load_definitions_only=True, only stores the registry specs in model_definitions_dict.
     - If neither, implies on-demand loading where get_models will handle it.
     """
-    base_path = os.path.join(os.path.dirname(__file__), '..', '..', 'model_weights', 'official_pretrained')
     debug_log_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'debug_logs'))
 
-    # Helper to define a model and its path
-    def _define_model(key: str, model_instance: Uformer, pth_filename: str):
+    # Define all models (architectures and their paths) from the registry file
+    registry = load_model_registry()
+    model_registry.clear()
+    model_registry.update(registry)
+    model_definitions_dict.clear()
+    for key, spec in registry["models"].items():
         model_definitions_dict[key] = {
-            'instance': model_instance,
-            'path': os.path.join(base_path, pth_filename)
+            'spec': spec,
+            'path': spec['weights_path']
         }
 
-    # Define all models (architectures and their paths)
-    # --- 1. Define Uformer-B (High Quality Denoise) ---
-    _define_model('denoise_b', Uformer(
-        img_size=256,
-        in_chans=3,
-        dd_in=3,
-        embed_dim=32,                              # Uformer-B uses embed_dim 32
-        depths=[1, 2, 8, 8, 2, 8, 8, 2, 1],        # Official depths for Uformer-B
-        num_heads=[1, 2, 4, 8, 16, 16, 8, 4, 2],    # Official heads for Uformer-B
-        win_size=8,
-        mlp_ratio=4.,
-        qkv_bias=True,
-        qk_scale=None,
-        drop_rate=0.,
-        attn_drop_rate=0.,
-        drop_path_rate=0.1,
-        norm_layer=nn.LayerNorm,
-        patch_norm=True,
-        use_checkpoint=False,
-        token_projection='linear',
-        token_mlp='leff',
-        dowsample=Downsample,
-        upsample=Upsample,
-        shift_flag=True,
-        modulator=True,                           # Uformer-B SIDD model USES the modulator
-        cross_modulator=False
-    ), 'Uformer_B_SIDD.pth')
-
-    # --- 2. Define Uformer-16 (Fast Denoise) ---
-    _define_model('denoise_16', Uformer(
-        img_size=256,
-        in_chans=3,
-        dd_in=3,
-        embed_dim=16, # The correct embed_dim for Uformer16
-        depths=[2, 2, 2, 2, 2, 2, 2, 2, 2], # Depths for Uformer-B / Uformer16
-        num_heads=[1, 2, 4, 8, 16, 16, 8, 4, 2], # Adjusted for embed_dim=16
-        win_size=8,
-        mlp_ratio=4.,
-        qkv_bias=True,
-        qk_scale=None,
-        drop_rate=0.,
-        attn_drop_rate=0.,
-        drop_path_rate=0.1,
-        norm_layer=nn.LayerNorm,
-        patch_norm=True,
-        use_checkpoint=False,
-        token_projection='linear',
-        token_mlp='leff',
-        dowsample=Downsample,
-        upsample=Upsample,
-        shift_flag=True,
-        modulator=False, # Adjusted for embed_dim=16
-        cross_modulator=False
-    ), 'uformer16_denoising_sidd.pth')
-
-    # --- 3. Define Uformer-B (Deblur) ---
-    _define_model('deblur_b', Uformer(
-        img_size=256,
-        in_chans=3, dd_in=3,
-        embed_dim=32,                              # Uformer-B uses embed_dim 32
-        depths=[1, 2, 8, 8, 2, 8, 8, 2, 1],        # Official depths for Uformer-B
-        num_heads=[1, 2, 4, 8, 16, 16, 8, 4, 2],    # Official heads for Uformer-B
-        win_size=8,
-        mlp_ratio=4.,
-        qkv_bias=True,
-        qk_scale=None,
-        drop_rate=0.,
-        attn_drop_rate=0.,
-        drop_path_rate=0.1,
-        norm_layer=nn.LayerNorm,
-        patch_norm=True,
-        use_checkpoint=False,
-        token_projection='linear',
-        token_mlp='leff',
-        dowsample=Downsample,
-        upsample=Upsample,
-        shift_flag=True,
-        modulator=True,
-        cross_modulator=False
-    ), 'Uformer_B_GoPro.pth')
-
     if load_all:
-        for key, value in model_definitions_dict.items():
+        for key in model_definitions_dict:
             try:
                 # Instantiate model and load weights
-                loaded_model = _load_single_model_weights(
-                    value['instance'],
-                    value['path'],
-                    key,
-                    debug_log_dir,
-                    device
-                )
-                app_models[key] = loaded_model
+                app_models[key] = _load_model_from_definition(key, device, debug_log_dir)
             except Exception as e:
                 print(f"Error loading model '{key}' at startup: {e}")
 
@@ -246,18 +187,9 @@ def get_model_by_name(model_name: str, models: Dict[str, Any] = Depends(get_mode
         raise HTTPException(status_code=400, detail=f"Model definition for '{model_name}' not found. Invalid model_name.")
     
     print(f"Loading model '{model_name}' on demand...")
-    model_info = model_definitions_dict[model_name]
     try:
-        # We need to create a new instance to avoid modifying the one in model_definitions_dict
-        model_instance_to_load = model_info['instance']
-        
-        loaded_instance = _load_single_model_weights(
-            model_instance_to_load,
-            model_info['path'],
-            model_name,
-            debug_log_dir,
-            device
-        )
+        # A new instance is built from the registry spec every time the model is loaded
+        loaded_instance = _load_model_from_definition(model_name, device, debug_log_dir)
         models[model_name] = loaded_instance # Cache the loaded model
         print(f"Model '{model_name}' loaded successfully on demand.")
         return loaded_instance
@@ -265,3 +197,74 @@ def get_model_by_name(model_name: str, models: Dict[str, Any] = Depends(get_mode
         print(f"ERROR: Failed to load model '{model_name}' on demand: {e}")
         traceback.print_exc() # Print full traceback for debugging
         raise HTTPException(status_code=500, detail=f"Failed to load model '{model_name}': {e}")
+
+def get_inference_session(model_name: str, models: Dict[str, Any]) -> InferenceSession:
+    """
+    Returns the InferenceSession for 'model_name', loading the model on demand if needed.
+    One session is kept per loaded model and is rebuilt if the model was reloaded.
+    """
+    uformer_model = get_model_by_name(model_name=model_name, models=models)
+    sessions = models.setdefault("inference_sessions", {})
+    session = sessions.get(model_name)
+    if session is None or session.model is not uformer_model:
+        execution = model_definitions_dict[model_name]['spec']['execution']
+        session = InferenceSession(
+            model_name,
+            uformer_model,
+            models,
+            precision=os.getenv("INFERENCE_PRECISION") or execution['precision'],
+            execution_defaults=execution
+        )
+        sessions[model_name] = session
+    return session
+
+def resolve_requested_model(model_name: str, task_type: str, speed_tier: Optional[str] = None) -> str:
+    """
+    Returns the model key to run. When a speed_tier is requested, the registry picks the model
+    registered for 'task_type' at that tier instead of the explicit model_name.
+    """
+    if not speed_tier:
+        return model_name
+    try:
+        return resolve_model_key(model_registry, task_type, speed_tier)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def parse_roi_request(roi: Optional[str], roi_mask: Optional[UploadFile], roi_background: str) -> Tuple[Optional[List[Tuple[int, int, int, int]]], Optional[np.ndarray]]:
+    """
+    Validates the optional region-of-interest fields shared by the image and video endpoints.
+    Returns (rectangles, mask), each None when not given. Raises HTTPException(400).
+    """
+    if roi_background not in ROI_BACKGROUNDS:
+        raise HTTPException(status_code=400, detail=f"Unsupported roi_background '{roi_background}'. Use one of {list(ROI_BACKGROUNDS)}.")
+    try:
+        rectangles = parse_roi_rectangles(roi) if roi else None
+        mask = None
+        if roi_mask is not None and roi_mask.filename:
+            mask = decode_roi_mask(roi_mask.file.read())
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return rectangles, mask
+
+
+def build_result_key(
+    input_hash: str,
+    model_name: str,
+    params: Dict[str, Any],
+    roi_rectangles: Optional[List[Tuple[int, int, int, int]]] = None,
+    roi_mask: Optional[np.ndarray] = None,
+    roi_background: str = "passthrough"
+) -> str:
+    """
+    Content address of a submission (see app/engine/result_cache.py) with the region of
+    interest folded into 'params' and the model's tuned execution configs included, so a
+    re-tune invalidates earlier results. Keys both the result cache and in-flight coalescing.
+    """
+    params = dict(params)
+    if roi_rectangles is not None or roi_mask is not None:
+        params["roi"] = roi_rectangles
+        params["roi_mask"] = None if roi_mask is None else [list(roi_mask.shape), hashlib.sha256(np.packbits(roi_mask)).hexdigest()]
+        params["roi_background"] = roi_background
+    autotuner = app_models.get("autotuner")
+    execution_configs = autotuner.configs_for(model_name) if autotuner else None
+    return result_key(input_hash, model_name, model_definitions_dict.get(model_name, {}), params, execution_configs)
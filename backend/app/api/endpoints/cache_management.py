@@ -4,6 +4,7 @@ from fastapi.responses import JSONResponse
 from pydantic import BaseModel, Field
 from typing import List
 import os
+import asyncio
 import shutil
 import traceback
 import torch
@@ -15,10 +16,12 @@ from urllib.parse import unquote
 load_dotenv()
 
 from app.api.dependencies import app_models
-from app.api.dependencies import model_definitions_dict # Import this here
+from app.api.dependencies import model_definitions_dict, model_registry # Import this here
 
 class UnloadModelsRequest(BaseModel):
     model_names: List[str] = Field(default_factory=list)
+    # How long to wait for a leased model to become idle before skipping it (0 = skip immediately)
+    wait_timeout_seconds: float = Field(default=0, ge=0)
 
 class ConfirmDownloadRequest(BaseModel):
     result_path: str
@@ -244,9 +247,10 @@ async def unload_models_endpoint(request: UnloadModelsRequest):
     """
     Unloads specified Uformer models from VRAM. If the 'model_names' list is empty,
     all currently loaded models will be unloaded.
-    This operation will not unload models that are currently in use by background tasks.
+    Models leased by running tasks or live streams are never unloaded mid-inference: each one
+    is waited on for up to 'wait_timeout_seconds' and skipped if it is still leased by then.
     """
-    models_in_use = app_models.get("models_in_use", {})
+    model_leases = app_models["model_leases"]
     try:
         model_names_to_unload = request.model_names
         device = app_models.get("device", torch.device("cpu"))
@@ -263,19 +267,27 @@ async def unload_models_endpoint(request: UnloadModelsRequest):
             print(f"Attempting to unload specific models: {model_names_to_unload}")
             target_models = model_names_to_unload
 
+        def _unload_if_idle(model_name: str) -> bool:
+            # Holding the model exclusively blocks new leases until it has been removed.
+            with model_leases.exclusive(model_name, timeout=request.wait_timeout_seconds) as is_idle:
+                if not is_idle:
+                    return False
+                # Check if the model is actually loaded and is a defined model.
+                if model_name in app_models and model_name in model_definitions_dict:
+                    del app_models[model_name]
+                    app_models.get("inference_sessions", {}).pop(model_name, None)
+                    unloaded_models.append(model_name)
+                    print(f"Model '{model_name}' unloaded.")
+                return True
+
         for model_name in target_models:
-            # Check if the model is currently in use.
-            if models_in_use.get(model_name, 0) > 0:
-                print(f"Skipping unload for '{model_name}': model is in use (count: {models_in_use.get(model_name, 0)}).")
+            # Waiting for a lease to be returned blocks, so it runs in a worker thread.
+            if not await asyncio.to_thread(_unload_if_idle, model_name):
+                print(f"Skipping unload for '{model_name}': model is in use (leases: {model_leases.lease_count(model_name)}).")
                 skipped_models.append(model_name)
-                continue
-            
-            # Check if the model is actually loaded and is a defined model.
-            if model_name in app_models and model_name in model_definitions_dict:
-                del app_models[model_name]
-                unloaded_models.append(model_name)
-                print(f"Model '{model_name}' unloaded.")
 
+        if unloaded_models and "buffer_pool" in app_models:
+            app_models["buffer_pool"].clear() # Idle frame buffers are recreated on demand
         if unloaded_models and device.type == 'cuda':
             torch.cuda.empty_cache()
             print("CUDA cache cleared.")
@@ -294,20 +306,33 @@ async def unload_models_endpoint(request: UnloadModelsRequest):
 @router.get("/api/loaded_models_status", tags=["cache_management"])
 async def get_loaded_models_status():
     """
-    Returns a list of all known model definitions and their current loaded status in VRAM.
+    Returns a list of all models declared in the model registry, with their task type,
+    speed tier, default execution settings and current loaded status in VRAM, plus the
+    residency policy's recent load/unload decisions and their outcomes.
     """
     status_list = []
-    # model_definitions_dict contains all *possible* models with their initial instance and path
+    # model_definitions_dict contains all *possible* models with their registry spec and path
     for model_name, model_info in model_definitions_dict.items():
         # Check if the model instance is actually in app_models (meaning it's loaded)
         is_loaded = model_name in app_models and model_name not in ['device', 'load_all_on_startup']
+        spec = model_info['spec']
         status_list.append({
             "name": model_name,
-            "loaded": is_loaded
+            "loaded": is_loaded,
+            "leases": app_models["model_leases"].lease_count(model_name),
+            "description": spec["description"],
+            "task_type": spec["task_type"],
+            "speed_tier": spec["speed_tier"],
+            "execution": spec["execution"]
         })
     # Sort for consistent display in frontend
     status_list.sort(key=lambda x: x['name'])
-    return JSONResponse(status_code=200, content={"models": status_list})
+    residency = app_models.get("residency")
+    return JSONResponse(status_code=200, content={
+        "models": status_list,
+        "speed_tiers": model_registry.get("speed_tiers", []),
+        "residency": residency.status() if residency else None
+    })
 
 @router.get("/api/model_loading_strategy", tags=["cache_management"])
 async def get_model_loading_strategy():
@@ -0,0 +1,80 @@
+# backend/app/api/endpoints/engine_management.py
+from fastapi import APIRouter
+from fastapi.responses import JSONResponse
+
+from app.api.dependencies import app_models
+
+router = APIRouter()
+
+@router.get("/api/engine/threading", tags=["engine_management"])
+async def get_threading_config():
+    """
+    Returns the CPU threading configuration applied to inference workers
+    (torch threads per job and concurrent job limit) and how it was obtained.
+    """
+    thread_config = app_models.get("thread_config", {})
+    return JSONResponse(status_code=200, content=thread_config)
+
+@router.get("/api/engine/tuning_table", tags=["engine_management"])
+async def get_tuning_table():
+    """
+    Returns the execution autotuner's table: the chosen attention backend, tile size and
+    batch size per (model key, shape bucket), with the measurements behind each choice.
+    """
+    autotuner = app_models.get("autotuner")
+    if autotuner is None:
+        return JSONResponse(status_code=503, content={"detail": "Autotuner not initialized."})
+    return JSONResponse(status_code=200, content=autotuner.get_table())
+
+@router.get("/api/engine/lanes", tags=["engine_management"])
+async def get_execution_lanes():
+    """
+    Returns every execution lane with its routing targets, pinned cores, worker and thread
+    counts, current queue length and active jobs, and utilization since startup.
+    """
+    execution_lanes = app_models.get("execution_lanes")
+    if execution_lanes is None:
+        return JSONResponse(status_code=503, content={"detail": "Execution lanes not initialized."})
+    return JSONResponse(status_code=200, content={"lanes": execution_lanes.stats()})
+
+@router.get("/api/engine/buffers", tags=["engine_management"])
+async def get_buffer_pool_metrics():
+    """
+    Returns the inference buffer pool's metrics: buffer requests, pool hits and hit rate,
+    fresh allocations, evictions, buffers currently in use and the idle memory it holds.
+    """
+    buffer_pool = app_models.get("buffer_pool")
+    if buffer_pool is None:
+        return JSONResponse(status_code=503, content={"detail": "Buffer pool not initialized."})
+    return JSONResponse(status_code=200, content=buffer_pool.metrics())
+
+@router.get("/api/engine/caches", tags=["engine_management"])
+async def get_cache_metrics():
+    """
+    Returns the metrics of the content-addressed caches: lookups that hit and missed and the
+    hit rate of each, plus, for the decoded-input cache, evictions and the memory it holds and,
+    for the result cache, stale entries (result already cleaned up), bypassed submissions and
+    stored results. 'in_flight' reports request coalescing: jobs that ran as leaders,
+    submissions attached to an identical running job, and the flights currently open.
+    """
+    decoded_input_cache = app_models.get("decoded_input_cache")
+    result_cache = app_models.get("result_cache")
+    single_flight = app_models.get("single_flight")
+    if decoded_input_cache is None or result_cache is None or single_flight is None:
+        return JSONResponse(status_code=503, content={"detail": "Caches not initialized."})
+    return JSONResponse(status_code=200, content={
+        "decoded_inputs": decoded_input_cache.metrics(),
+        "results": result_cache.metrics(),
+        "in_flight": single_flight.metrics()
+    })
+
+@router.get("/api/engine/artifacts", tags=["engine_management"])
+async def get_artifact_writer_metrics():
+    """
+    Returns the artifact writer's metrics: artifacts queued, written, dropped because the queue
+    was full, failed and skipped because their type is switched off, plus the current backlog.
+    """
+    artifact_writer = app_models.get("artifact_writer")
+    if artifact_writer is None:
+        return JSONResponse(status_code=503, content={"detail": "Artifact writer not initialized."})
+    return JSONResponse(status_code=200, content=artifact_writer.metrics())
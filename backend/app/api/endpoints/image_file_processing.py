@@ -1,68 +1,119 @@
 # backend/app/api/endpoints/image_file_processing.py
-from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends, BackgroundTasks, Request
 from fastapi.responses import Response, JSONResponse
 from PIL import Image
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, List, Tuple, Union
+import asyncio
 import io
-import torch
-import cv2
 import numpy as np
 import os
 import time
 import uuid
 import traceback
-import rawpy
+import shutil
+import tempfile
+import cv2
+from contextlib import nullcontext
 
-from app.api.dependencies import get_models, get_model_by_name
+from app.api.dependencies import get_models, get_model_by_name, model_definitions_dict, get_inference_session, resolve_requested_model, parse_roi_request, build_result_key
+from app.engine.session import PROCESSING_MODES
+from app.engine.ingest import content_hash, is_raw_filename, raw_preview_image, probe_upload_size, decode_upload_to_file
+from app.engine.roi import build_roi_mask
+from app.engine.result_cache import complete_from_result_cache
+from app.engine.single_flight import mirror_leader_status
+from app.engine.encoders import FILE_EXTENSIONS, encode_image_file, resolve_output_encoding
 
 router = APIRouter()
 
-# Helper function for image padding
-def pad_image_to_multiple(image_np: np.ndarray, multiple: int, mode='reflect') -> Tuple[np.ndarray, Tuple[int, int]]:
+def publish_preview(
+    task_id: str,
+    input_np_8bit: np.ndarray,
+    task_type: str,
+    model_name: str,
+    preview_filepath: str,
+    models: Dict[str, Any]
+) -> Optional[str]:
     """
-    Pads an image to ensure its height and width are multiples of 'multiple'.
-    Returns the padded image and the original dimensions (h, w).
+    Produces a cheap preview of the result (PREVIEW_PROCESSING_MODE, optionally with the model
+    of PREVIEW_SPEED_TIER) at most PREVIEW_MAX_SIDE pixels on its longest side, saves it and
+    returns its /static_results path. Returns None if the preview fails; the full-quality
+    task carries on regardless.
     """
-    original_h, original_w, c = image_np.shape
-
-    pad_h = (multiple - (original_h % multiple)) % multiple
-    pad_w = (multiple - (original_w % multiple)) % multiple
-
-    if pad_h == 0 and pad_w == 0:
-        return image_np, (original_h, original_w)
-
-    padded_image = np.pad(image_np, ((0, pad_h), (0, pad_w), (0, 0)), mode=mode)
-    # Removed original_h, original_w as it's not used
-    # If needed replace teh return with "return padded_image, (original_h, original_w)"
-    return padded_image, (original_h, original_w)
+    preview_mode = os.getenv("PREVIEW_PROCESSING_MODE", "guided")
+    preview_speed_tier = os.getenv("PREVIEW_SPEED_TIER") or None
+    preview_max_side = int(os.getenv("PREVIEW_MAX_SIDE", 2048))
+    try:
+        # Very large inputs are previewed from a downscaled copy so the preview stays cheap
+        scale = preview_max_side / max(input_np_8bit.shape[:2])
+        if scale < 1.0:
+            preview_size = (max(1, round(input_np_8bit.shape[1] * scale)), max(1, round(input_np_8bit.shape[0] * scale)))
+            input_np_8bit = cv2.resize(input_np_8bit, preview_size, interpolation=cv2.INTER_AREA)
+        preview_model_name = resolve_requested_model(model_name, task_type, preview_speed_tier)
+        # The task already leases its own model; a different preview model needs its own lease
+        preview_lease = models["model_leases"].acquire(preview_model_name) if preview_model_name != model_name else nullcontext()
+        with preview_lease:
+            preview_session = get_inference_session(preview_model_name, models)
+            start_time = time.perf_counter()
+            preview_uint8 = preview_session.enhance(input_np_8bit, processing_mode=preview_mode)
+        os.makedirs(os.path.dirname(preview_filepath), exist_ok=True)
+        Image.fromarray(preview_uint8).save(preview_filepath, format='JPEG', quality=85)
+    except Exception as e:
+        print(f"[BG-TASK:{task_id}] Preview failed, continuing with the full-quality result: {getattr(e, 'detail', e)}")
+        return None
 
+    relative_path = os.path.relpath(preview_filepath, "temp").replace("\\", "/")
+    preview_result_path = f"/static_results/{relative_path}"
+    # Tracked without a task_id: the task's heartbeats and download confirmation refer to the
+    # final result, so the preview is cleaned up once the heartbeat timeout has passed
+    current_timestamp = time.time()
+    models.get("tracker_by_path", {})[preview_result_path] = {
+        "status": "active",
+        "task_id": None,
+        "file_type": "image",
+        "created_at": current_timestamp,
+        "downloaded_at": None,
+        "last_heartbeat_at": current_timestamp
+    }
+    print(f"[BG-TASK:{task_id}] Preview ({preview_mode}, model '{preview_model_name}') ready in {time.perf_counter() - start_time:.2f}s at: {preview_result_path}")
+    return preview_result_path
 
 def run_image_enhancement_task(
     task_id: str,
-    file_contents: bytes,
+    file_contents: Optional[Union[bytes, bytearray]],
     original_filename: str,
     task_type: str,
     model_name: str,
     use_patch_processing: bool,
-    models: Dict[str, Any]
+    models: Dict[str, Any],
+    processing_mode: Optional[str] = None,
+    roi_rectangles: Optional[List[Tuple[int, int, int, int]]] = None,
+    roi_mask: Optional[np.ndarray] = None,
+    roi_background: str = "passthrough",
+    input_hash: Optional[str] = None,
+    result_key: Optional[str] = None,
+    output_encoding: Optional[Dict[str, Any]] = None
 ):
     """
     The actual, long-running image processing logic that runs in the background.
+    'file_contents' is None for hash-only resubmissions, whose decoded input must be in the
+    decoded-input cache under 'input_hash'. A bytearray is cleared once a streamed input has
+    been decoded, releasing the upload's memory while the task runs. Identical submissions coalesced with this task
+    under 'result_key' receive its result (or error) when it finishes. 'output_encoding'
+    (see resolve_output_encoding()) selects the result's format; defaults to the deployment's.
     """
     tasks_db = models["tasks_db"]
-    models_in_use = models["models_in_use"]
+    model_lease = None
+    streaming_scratch = None
+    result_filepath = None
 
     try:
-        # --- Reference Counting: Increment ---
-        # Increment the counter for the model we are about to use.
-        models_in_use[model_name] = models_in_use.get(model_name, 0) + 1
-        print(f"[REF_COUNT] INCREMENT: Model '{model_name}' in use count is now {models_in_use[model_name]}.")
-        # ------------------------------------
+        # --- Model Lease: Acquire ---
+        # Holding a lease keeps the model from being unloaded until the task is done.
+        model_lease = models["model_leases"].acquire(model_name)
+        # ----------------------------
 
         tasks_db[task_id] = {"status": "processing", "progress": 0, "message": "Model and data loaded. Starting enhancement."}
-        uformer_model = get_model_by_name(model_name=model_name, models=models)
-        device = models["device"]
-        patch_size = 256
+        inference_session = get_inference_session(model_name, models)
 
         print(f"--- [BG-TASK:{task_id}] Processing: {original_filename} (Task: {task_type}) ---")
 
@@ -77,68 +128,122 @@ def run_image_enhancement_task(
         unique_id = f"{int(time.time())}_{task_id[:8]}"
 
         # --- Save the original uploaded file ---
-        # This restores the functionality to save the pristine, original file.
-        original_saved_filename = f"{unique_id}_original_upload_{original_filename}"
-        original_filepath = os.path.join(image_upload_dir, original_saved_filename)
-        with open(original_filepath, "wb") as f:
-            f.write(file_contents)
-        print(f"[BG-TASK:{task_id}] Saved original uploaded file to: {original_filepath}")
+        # This restores the functionality to save the pristine, original file. It is written
+        # behind the task by the artifact writer (SAVE_UPLOAD_COPIES switches it off).
+        # Hash-only resubmissions carry no bytes; their original was saved by the first upload.
+        # Uploads large enough to be streamed (see Step 1) are saved before their bytes are released.
+        final_mode = processing_mode or ("patch" if use_patch_processing else "resize")
+        has_roi = roi_rectangles is not None or roi_mask is not None
+        streaming_min_pixels = float(os.getenv("STREAMING_MIN_MEGAPIXELS", 40)) * 1e6
+        streamed_upload = False
+        if file_contents is not None and final_mode == "patch" and not has_roi:
+            probe_w, probe_h = probe_upload_size(file_contents, original_filename)
+            streamed_upload = probe_w * probe_h >= streaming_min_pixels
+        artifact_writer = models["artifact_writer"]
+        if file_contents is not None:
+            original_saved_filename = f"{unique_id}_original_upload_{original_filename}"
+            original_filepath = os.path.join(image_upload_dir, original_saved_filename)
+            if streamed_upload:
+                if artifact_writer.write("upload", original_filepath, file_contents):
+                    print(f"[BG-TASK:{task_id}] Saved original uploaded file to: {original_filepath}")
+            elif artifact_writer.submit("upload", original_filepath, file_contents):
+                print(f"[BG-TASK:{task_id}] Queued original uploaded file for: {original_filepath}")
+            input_hash = input_hash or content_hash(file_contents)
 
-        # Step 1: Prepare the input image into a standard NumPy array
-        if original_filename.lower().endswith(('.arw', '.nef', '.cr2', '.dng')):
-            with rawpy.imread(io.BytesIO(file_contents)) as raw:
-                input_np_8bit = raw.postprocess(use_camera_wb=True, output_color=rawpy.ColorSpace.sRGB, output_bps=8)
+        # Step 1: Prepare the input image into a standard NumPy array. Decodes and RAW developments
+        # are shared through the decoded-input cache (populated by /api/generate_preview too).
+        # Only patch and guided processing use full resolution; the resize pipeline gets a reduced
+        # decode (JPEG draft mode, uint8 box reduction, half-size RAW development) and its result
+        # is scaled back to the full size. Uploads to be streamed (patch mode, at least
+        # STREAMING_MIN_MEGAPIXELS) bypass the cache: they are decoded straight into a
+        # memory-mapped file and their bytes are released.
+        if streamed_upload:
+            streaming_scratch = tempfile.mkdtemp(prefix="uformer_image_", dir=os.getenv("STREAMING_SCRATCH_DIR") or None)
+            input_np_8bit, full_size, decode_method = decode_upload_to_file(
+                file_contents, original_filename, os.path.join(streaming_scratch, "input.u8")
+            )
+            cache_hit = False
+            models["decoded_input_cache"].mark_oversized(input_hash, original_filename)
+            if isinstance(file_contents, bytearray):
+                file_contents.clear()
         else:
-            input_np_8bit = np.array(Image.open(io.BytesIO(file_contents)).convert("RGB"))
+            try:
+                input_np_8bit, full_size, decode_method, cache_hit = models["decoded_input_cache"].get_or_decode(
+                    input_hash, reduced=final_mode == "resize", data=file_contents, filename=original_filename
+                )
+            except KeyError:
+                # Hash-only resubmission whose input was evicted after the endpoint checked for it
+                print(f"[BG-TASK:{task_id}] Input {input_hash[:12]} is no longer in the decoded-input cache.")
+                tasks_db[task_id] = {"status": "failed", "error": "The input is no longer cached. Upload the file again."}
+                return
+        output_size = full_size if (input_np_8bit.shape[1], input_np_8bit.shape[0]) != full_size else None
+        raw_development = decode_method if is_raw_filename(original_filename) else None
+        if raw_development:
+            tasks_db[task_id]["raw_development"] = raw_development
+        print(f"[BG-TASK:{task_id}] Input ready ({decode_method}{', cached' if cache_hit else ''}) at {input_np_8bit.shape[1]}x{input_np_8bit.shape[0]}.")
 
-        # Save the "developed" input that the model will see for debugging
-        developed_filename_base = os.path.splitext(original_filename)[0]
-        developed_filename = f"{unique_id}_developed_{developed_filename_base}.jpg"
-        Image.fromarray(input_np_8bit).save(os.path.join(developed_dir, developed_filename))
+        # Save the "developed" input that the model will see for debugging (written behind the
+        # task; SAVE_DEVELOPED_INPUTS switches it off). The array is the cached, unmodified decode.
+        # Inputs large enough to be streamed are skipped: the queued array would keep the whole
+        # decode in memory, which streaming exists to avoid.
+        if input_np_8bit.shape[0] * input_np_8bit.shape[1] < streaming_min_pixels:
+            developed_filename_base = os.path.splitext(original_filename)[0]
+            developed_filename = f"{unique_id}_developed_{developed_filename_base}.jpg"
+            artifact_writer.submit("developed_input", os.path.join(developed_dir, developed_filename), input_np_8bit)
 
-        # Step 2: Normalize the 8-bit image to float[0,1] for the model
-        input_full_res_np = (input_np_8bit / 255.0).astype(np.float32)
-        
-        # Step 3: Process the image
-        final_enhanced_image_np = None
-        if use_patch_processing:
-            padded_input_np, (original_h, original_w) = pad_image_to_multiple(input_full_res_np, patch_size)
-            padded_h, padded_w, _ = padded_input_np.shape
-            padded_output_np = np.zeros_like(padded_input_np)
-            num_patches = (padded_h // patch_size) * (padded_w // patch_size)
-            processed_patches = 0
-            for y in range(0, padded_h, patch_size):
-                for x in range(0, padded_w, patch_size):
-                    patch_np = padded_input_np[y:y+patch_size, x:x+patch_size, :]
-                    patch_tensor = torch.from_numpy(patch_np).permute(2, 0, 1).unsqueeze(0).to(device)
-                    with torch.no_grad():
-                        restored_patch_tensor = uformer_model(patch_tensor)
-                    restored_patch_np = restored_patch_tensor.squeeze(0).permute(1, 2, 0).clamp(0.0, 1.0).cpu().numpy()
-                    padded_output_np[y:y+patch_size, x:x+patch_size, :] = restored_patch_np
-                    processed_patches += 1
-                    tasks_db[task_id]["progress"] = int((processed_patches / num_patches) * 100)
-            final_enhanced_image_np = padded_output_np[0:original_h, 0:original_w, :]
-        else: # Resize processing
-            tasks_db[task_id]["progress"] = 25
-            original_h, original_w, _ = input_full_res_np.shape
-            resized_input_np = cv2.resize(input_full_res_np, (patch_size, patch_size), interpolation=cv2.INTER_LANCZOS4)
-            input_tensor = torch.from_numpy(resized_input_np).permute(2, 0, 1).unsqueeze(0).to(device)
-            tasks_db[task_id]["progress"] = 50
-            with torch.no_grad():
-                restored_tensor = uformer_model(input_tensor)
-            restored_resized_np = restored_tensor.squeeze(0).permute(1, 2, 0).clamp(0.0, 1.0).cpu().numpy()
-            tasks_db[task_id]["progress"] = 75
-            final_enhanced_image_np = cv2.resize(restored_resized_np, (original_w, original_h), interpolation=cv2.INTER_LANCZOS4)
-            tasks_db[task_id]["progress"] = 100
+        # Step 2 (progressive results): for large images in patch mode, publish a fast preview
+        # first so interactive clients can show something while the full-resolution tiles run
+        preview_result_path = None
+        progressive_enabled = os.getenv("ENABLE_PROGRESSIVE_PREVIEW", "True").lower() == "true"
+        # With a region of interest the full-quality pass is already proportionally cheaper
+        if progressive_enabled and final_mode == "patch" and not has_roi and max(input_np_8bit.shape[:2]) >= int(os.getenv("PREVIEW_MIN_SIDE", 1024)):
+            preview_filepath = os.path.join(image_processed_dir, f"{unique_id}_preview_{os.path.splitext(original_filename)[0]}.jpg")
+            preview_result_path = publish_preview(task_id, input_np_8bit, task_type, model_name, preview_filepath, models)
+            if preview_result_path:
+                tasks_db[task_id]["preview_result_path"] = preview_result_path
+                tasks_db[task_id]["message"] = "Preview ready. Computing the full-quality result."
 
-        # Step 4: Prepare and save the final output
-        output_image_uint8 = (final_enhanced_image_np * 255.0).astype(np.uint8)
-        pil_output_image = Image.fromarray(output_image_uint8)
-        img_byte_arr = io.BytesIO()
-        pil_output_image.save(img_byte_arr, format='JPEG', quality=95)
-        
+        # Step 3: Process the image. The session handles normalization, tiling and precision.
+        def update_progress(done_tiles: int, total_tiles: int):
+            tasks_db[task_id]["progress"] = int((done_tiles / total_tiles) * 100)
+
+        tile_stats = {} # Tiles run and flat tiles skipped (see ENABLE_FLAT_TILE_SKIP)
+        image_h, image_w = input_np_8bit.shape[:2]
+        if final_mode == "patch" and not has_roi and image_h * image_w >= streaming_min_pixels:
+            # Out-of-core mode for very large images: the input and output live in memory-mapped
+            # files, the session reads tiles from the input and writes finished rows to the output,
+            # and the result is encoded from the output file (see Step 4)
+            if streamed_upload:
+                source = input_np_8bit
+            else:
+                # A cached decode (hash-only resubmission or an earlier guided/resize task): it is
+                # copied to a memory-mapped file and dropped from the cache, so it is not kept
+                # resident while it streams
+                streaming_scratch = tempfile.mkdtemp(prefix="uformer_image_", dir=os.getenv("STREAMING_SCRATCH_DIR") or None)
+                source = np.memmap(os.path.join(streaming_scratch, "input.u8"), dtype=np.uint8, mode="w+", shape=input_np_8bit.shape)
+                source[:] = input_np_8bit
+                models["decoded_input_cache"].discard(input_hash)
+                models["decoded_input_cache"].mark_oversized(input_hash, original_filename)
+            del input_np_8bit
+            output_image_uint8 = np.memmap(os.path.join(streaming_scratch, "output.u8"), dtype=np.uint8, mode="w+", shape=source.shape)
+            tasks_db[task_id]["streaming"] = True
+            print(f"[BG-TASK:{task_id}] Streaming {image_w}x{image_h} image through memory-mapped buffers in '{streaming_scratch}'.")
+            inference_session.enhance_streaming(source, output_image_uint8, progress_callback=update_progress, scratch_dir=streaming_scratch, tile_stats=tile_stats)
+            del source
+        else:
+            frame_roi_mask = None
+            if has_roi:
+                frame_roi_mask = build_roi_mask(image_h, image_w, roi_rectangles, roi_mask)
+            output_image_uint8 = inference_session.enhance(
+                input_np_8bit, use_patch_processing, progress_callback=update_progress, processing_mode=processing_mode,
+                roi_mask=frame_roi_mask, roi_background=roi_background, output_size=output_size, tile_stats=tile_stats
+            )
+
+        # Step 4: Encode the final output straight into its file. JPEG and PNG are encoded row by
+        # row (from the memory-mapped output when streaming); WebP needs a full in-memory copy.
+        output_encoding = output_encoding or resolve_output_encoding()
         processed_filename_base = os.path.splitext(original_filename)[0]
-        processed_filename = f"{unique_id}_processed_{processed_filename_base}.jpg"
+        processed_filename = f"{unique_id}_processed_{processed_filename_base}{FILE_EXTENSIONS[output_encoding['format']]}"
         processed_filepath = os.path.join(image_processed_dir, processed_filename)
 
         # --- FIX: Ensure the destination directory exists right before writing ---
@@ -146,8 +251,11 @@ def run_image_enhancement_task(
         os.makedirs(os.path.dirname(processed_filepath), exist_ok=True)
         # --- END FIX ---
         
-        with open(processed_filepath, "wb") as f:
-            f.write(img_byte_arr.getvalue())
+        encode_image_file(output_image_uint8, processed_filepath, output_encoding, in_place=True) # The result is not used afterwards
+        del output_image_uint8 # Releases the memory-mapped output in streaming mode
+        if result_key:
+            models["result_cache"].put(result_key, processed_filepath)
+        result_filepath = processed_filepath
         
         relative_path = os.path.relpath(processed_filepath, "temp").replace("\\", "/")
         full_result_path = f"/static_results/{relative_path}"
@@ -176,80 +284,219 @@ def run_image_enhancement_task(
         # ---------------------------------------------
 
         tasks_db[task_id] = {"status": "completed", "result_path": full_result_path}
+        if preview_result_path:
+            tasks_db[task_id]["preview_result_path"] = preview_result_path
+        if raw_development:
+            tasks_db[task_id]["raw_development"] = raw_development
+        if inference_session.flat_tile_threshold > 0 and tile_stats.get("tiles"):
+            tasks_db[task_id]["flat_tiles_skipped"] = round(tile_stats["flat_tiles"] / tile_stats["tiles"], 4)
+            print(f"[BG-TASK:{task_id}] Flat-tile skipping: {tile_stats['flat_tiles']}/{tile_stats['tiles']} tiles skipped.")
 
     except Exception as e:
         print(f"[BG-TASK:{task_id}] ERROR: Failed to process image: {e}")
         traceback.print_exc()
         tasks_db[task_id] = {"status": "failed", "error": f"An unexpected error occurred: {e}"}
     finally:
-        # --- Reference Counting: Decrement ---
-        # Ensure the counter is decremented whether the task succeeds or fails.
-        if model_name in models_in_use:
-            models_in_use[model_name] = max(0, models_in_use.get(model_name, 0) - 1)
-            print(f"[REF_COUNT] DECREMENT: Model '{model_name}' in use count is now {models_in_use[model_name]}.")
-        # ------------------------------------
+        # --- Model Lease: Release ---
+        # Ensure the lease is returned whether the task succeeds or fails.
+        if model_lease:
+            model_lease.release()
+        # ----------------------------
+        if streaming_scratch:
+            shutil.rmtree(streaming_scratch, ignore_errors=True)
+        if result_key:
+            models["single_flight"].finish(result_key, models, result_filepath, "image", tasks_db.get(task_id, {}).get("error"))
+
+def prefetch_decoded_input(input_hash: str, contents: bytes, filename: str, models: Dict[str, Any]):
+    """
+    Decodes (or RAW-develops) an upload at full resolution into the decoded-input cache, then
+    releases the pending entry that /api/generate_preview reserved for it.
+    """
+    decoded_input_cache = models["decoded_input_cache"]
+    try:
+        # Inputs that would be streamed are decoded by their task straight into a memory-mapped
+        # file; a cached full-resolution copy would only hold them in RAM
+        width, height = probe_upload_size(contents, filename)
+        if width * height >= float(os.getenv("STREAMING_MIN_MEGAPIXELS", 40)) * 1e6:
+            decoded_input_cache.mark_oversized(input_hash, filename)
+            return
+        _, _, decode_method, cache_hit = decoded_input_cache.get_or_decode(input_hash, data=contents, filename=filename)
+        if not cache_hit:
+            print(f"[INPUT_CACHE] Prefetched '{filename}' ({decode_method}) as {input_hash[:12]}.")
+    except Exception as e:
+        print(f"[INPUT_CACHE] Could not prefetch '{filename}': {e}")
+    finally:
+        decoded_input_cache.release(input_hash)
 
 @router.post("/api/generate_preview", tags=["image_file_processing"])
-async def generate_preview(image_file: UploadFile = File(...)):
+async def generate_preview(
+    background_tasks: BackgroundTasks,
+    image_file: UploadFile = File(...),
+    models: Dict[str, Any] = Depends(get_models)
+):
+    """
+    Returns an 800 px JPEG preview of an uploaded file. RAW previews come from the embedded
+    camera thumbnail when it is large enough, otherwise from a half-size development; the
+    X-Preview-Source header reports which.
+    The X-Content-Hash header identifies the upload: with ENABLE_DECODE_PREFETCH the file is
+    decoded into the decoded-input cache in the background, so a following /api/process_image
+    (with the same file, or with only 'content_hash') skips the decode / RAW development.
+    """
     contents = await image_file.read()
+    input_hash = content_hash(contents)
+    if os.getenv("ENABLE_DECODE_PREFETCH", "True").lower() == "true":
+        # Reserved before responding, so a hash-only /api/process_image sent right after this
+        # response waits for the prefetch instead of finding nothing cached
+        models["decoded_input_cache"].reserve(input_hash, image_file.filename)
+        background_tasks.add_task(prefetch_decoded_input, input_hash, contents, image_file.filename, models)
     try:
-        if image_file.filename.lower().endswith(('.arw', '.nef', '.cr2', '.dng')):
-            with rawpy.imread(io.BytesIO(contents)) as raw:
-                rgb_array = raw.postprocess(use_camera_wb=True, output_color=rawpy.ColorSpace.sRGB)
-            img = Image.fromarray(rgb_array)
+        preview_source = "decoded"
+        if is_raw_filename(image_file.filename):
+            img, preview_source = raw_preview_image(contents, min_side=int(os.getenv("RAW_THUMBNAIL_MIN_SIDE", 512)))
         else:
             img = Image.open(io.BytesIO(contents))
         img.thumbnail((800, 800), Image.Resampling.LANCZOS)
         buf = io.BytesIO()
-        img.save(buf, format='JPEG', quality=85)
+        img.convert("RGB").save(buf, format='JPEG', quality=85)
         buf.seek(0)
-        return Response(content=buf.getvalue(), media_type="image/jpeg")
+        return Response(content=buf.getvalue(), media_type="image/jpeg", headers={"X-Preview-Source": preview_source, "X-Content-Hash": input_hash})
     except Exception as e:
         raise HTTPException(status_code=500, detail="Could not generate preview from file.")
 
 @router.post("/api/process_image")
 async def process_image(
-    background_tasks: BackgroundTasks,
-    image_file: UploadFile = File(...),
+    request: Request,
+    image_file: Optional[UploadFile] = File(None),
+    content_hash_field: Optional[str] = Form(None, alias="content_hash"),
     task_type: str = Form("denoise"),
     model_name: str = Form("denoise_b"),
     use_patch_processing: bool = Form(True),
+    speed_tier: Optional[str] = Form(None),
+    processing_mode: Optional[str] = Form(None),
+    roi: Optional[str] = Form(None),
+    roi_mask: Optional[UploadFile] = File(None),
+    roi_background: str = Form("passthrough"),
+    bypass_cache: bool = Form(False),
+    output_format: Optional[str] = Form(None),
+    output_quality: Optional[int] = Form(None),
     models: Dict[str, Any] = Depends(get_models)
 ):
     """
     Accepts an image file, starts a background enhancement task, and immediately
     returns a task ID for status polling.
+    If 'speed_tier' is given (e.g. 'fast'), the model registry picks the model for
+    'task_type' at that tier and 'model_name' is ignored.
+    'processing_mode' ('patch', 'guided' or 'resize') overrides 'use_patch_processing'.
+    'roi' (JSON [[x, y, width, height], ...]) and/or 'roi_mask' (an image, non-black = ROI)
+    restrict patch processing to a region of interest; the rest of the image is passed
+    through or, with roi_background='resize', taken from the resize pipeline.
+    Instead of 'image_file', 'content_hash' (the X-Content-Hash of /api/generate_preview)
+    resubmits an input that is still in the decoded-input cache.
+    A submission identical to an earlier one (same content, model, task and settings) is
+    completed immediately from the result cache unless 'bypass_cache' is set; one identical to
+    a task still in progress is attached to it and completes with it.
+    The result is encoded as 'output_format' ('jpeg', 'webp' or 'png', with 'output_quality'
+    for JPEG/WebP); without it, the best format listed in the Accept header, else the
+    deployment default (OUTPUT_IMAGE_FORMAT).
     """
-    # Quick validation and model loading (fast, synchronous)
+    if image_file is None and not content_hash_field:
+        raise HTTPException(status_code=400, detail="Provide either 'image_file' or 'content_hash'.")
+    if processing_mode and processing_mode not in PROCESSING_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported processing_mode '{processing_mode}'. Use one of {list(PROCESSING_MODES)}.")
+    roi_rectangles, roi_mask_array = parse_roi_request(roi, roi_mask, roi_background)
     try:
-        get_model_by_name(model_name=model_name, models=models)
-    except Exception as e:
+        output_encoding = resolve_output_encoding(output_format, output_quality, request.headers.get("accept"))
+    except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
+    final_mode = processing_mode or ("patch" if use_patch_processing else "resize")
+    if (roi_rectangles is not None or roi_mask_array is not None) and final_mode != "patch":
+        raise HTTPException(status_code=400, detail="Region-of-interest processing requires patch processing.")
+    model_name = resolve_requested_model(model_name, task_type, speed_tier)
+    if model_name not in model_definitions_dict:
+        raise HTTPException(status_code=400, detail=f"Model definition for '{model_name}' not found. Invalid model_name.")
     
     # Read file contents once
-    contents = await image_file.read()
+    if image_file is not None:
+        # A bytearray, so that the task can release it once a streamed input is decoded: the
+        # lane's job arguments keep a reference to it until the task ends
+        contents = bytearray(await image_file.read())
+        input_hash = content_hash(contents)
+        original_filename = image_file.filename
+    else:
+        # Hash-only resubmission: served from the result cache, or its decoded input must still
+        # be cached (checked below, once the result cache has missed)
+        contents = None
+        input_hash = content_hash_field
+        original_filename = models["decoded_input_cache"].known_filename(input_hash) or input_hash[:12]
     
     # Create and register the task
     task_id = str(uuid.uuid4())
     tasks_db = models["tasks_db"]
     tasks_db[task_id] = {"status": "pending", "message": "Task received and queued."}
-    
-    # Add the long-running job to the background
-    background_tasks.add_task(
-        run_image_enhancement_task,
-        task_id=task_id,
-        file_contents=contents,
-        original_filename=image_file.filename,
-        task_type=task_type,
-        model_name=model_name,
-        use_patch_processing=use_patch_processing,
-        models=models
+
+    # Identical submissions are answered from the result cache without queueing any work,
+    # or attached to an identical task that is still running
+    result_key = build_result_key(
+        input_hash, model_name, {"kind": "image", "task_type": task_type, "processing_mode": final_mode, "encoding": output_encoding},
+        roi_rectangles, roi_mask_array, roi_background
     )
+    cached_filepath = os.path.join(
+        "temp", "images", task_type, "processed", f"{int(time.time())}_{task_id[:8]}_processed_{os.path.splitext(original_filename)[0]}{FILE_EXTENSIONS[output_encoding['format']]}"
+    )
+    if complete_from_result_cache(result_key, task_id, cached_filepath, "image", models, bypass_cache):
+        return JSONResponse(
+            status_code=200,
+            content={"task_id": task_id, "model_name": model_name, "cached": True, "message": "Result served from the result cache."}
+        )
+    leader_task_id = models["single_flight"].join(result_key, task_id)
+    if leader_task_id:
+        tasks_db[task_id] = {"status": "pending", "coalesced_with": leader_task_id, "message": "Attached to an identical task in progress."}
+        return JSONResponse(
+            status_code=202,
+            content={"task_id": task_id, "model_name": model_name, "coalesced_with": leader_task_id, "message": "Attached to an identical image processing task in progress."}
+        )
+    
+    # Queue the long-running job on the execution lane this model is routed to
+    try:
+        if contents is None:
+            decoded_input_cache = models["decoded_input_cache"]
+            if decoded_input_cache.filename_for(input_hash, reduced=final_mode == "resize") is None:
+                if decoded_input_cache.is_oversized(input_hash):
+                    raise HTTPException(status_code=413, detail="This input is too large to be kept decoded between requests, so it cannot be resubmitted by content_hash. Upload the file again.")
+                if decoded_input_cache.filename_for(input_hash, reduced=True) is not None:
+                    raise HTTPException(status_code=409, detail="Only a reduced-size decode of this content_hash is cached, which the requested processing mode cannot use. Upload the file again.")
+                raise HTTPException(status_code=404, detail="No cached input for this content_hash. Upload the file again.")
+        # Loaded only now that neither the result cache nor a running task can answer the
+        # request, and off the event loop: an on-demand load reads the weights from disk
+        await asyncio.to_thread(get_model_by_name, model_name=model_name, models=models)
+        models["execution_lanes"].submit(
+            model_name,
+            run_image_enhancement_task,
+            task_id=task_id,
+            file_contents=contents,
+            original_filename=original_filename,
+            task_type=task_type,
+            model_name=model_name,
+            use_patch_processing=use_patch_processing,
+            models=models,
+            processing_mode=processing_mode,
+            roi_rectangles=roi_rectangles,
+            roi_mask=roi_mask_array,
+            roi_background=roi_background,
+            input_hash=input_hash,
+            result_key=result_key,
+            output_encoding=output_encoding
+        )
+    except Exception as e:
+        # The task will never run, so its flight must end here or identical submissions would wait forever
+        tasks_db[task_id] = {"status": "failed", "error": f"Could not start the task: {e}"}
+        models["single_flight"].finish(result_key, models, error=tasks_db[task_id]["error"])
+        raise
 
     # Immediately return 202 Accepted
     return JSONResponse(
         status_code=202,
-        content={"task_id": task_id, "message": "Image processing task started."}
+        content={"task_id": task_id, "model_name": model_name, "message": "Image processing task started."}
     )
 
 @router.get("/api/image_status/{task_id}", tags=["image_file_processing"])
@@ -261,4 +508,4 @@ async def get_image_status(task_id: str, models: Dict[str, Any] = Depends(get_mo
     task = tasks_db.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found.")
-    return task
+    return mirror_leader_status(task, tasks_db)
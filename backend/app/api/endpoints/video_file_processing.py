@@ -1,63 +1,59 @@
 # backend/app/api/endpoints/video_file_processing.py
-from fastapi import APIRouter, UploadFile, File, Form, BackgroundTasks, HTTPException, Depends
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
 from fastapi.responses import JSONResponse, FileResponse
-from typing import Dict, Any, Tuple
+from typing import Dict, Any, Optional, List, Tuple
+import numpy as np
 import uuid
 import os
 import time
 import cv2
-import numpy as np
-import torch
 import ffmpeg
 import traceback
 from tqdm import tqdm
 
 # Import shared models from dependencies
-from app.api.dependencies import get_models, get_model_by_name
+from app.api.dependencies import get_models, get_inference_session, model_definitions_dict, resolve_requested_model, parse_roi_request, build_result_key
+from app.engine.roi import build_roi_mask
+from app.engine.ingest import content_hash
+from app.engine.result_cache import complete_from_result_cache
+from app.engine.single_flight import mirror_leader_status
 
 router = APIRouter()
 
 # The local 'tasks' dictionary has been removed.
 # All state is now managed in the central app_models dictionary.
 
-# Helper function for image padding
-def pad_image_to_multiple(image_np: np.ndarray, multiple: int, mode='reflect') -> Tuple[np.ndarray, Tuple[int, int]]:
-    """
-    Pads an image to ensure its height and width are multiples of 'multiple'.
-    Returns the padded image and the original dimensions (h, w).
-    """
-    original_h, original_w, c = image_np.shape
-
-    pad_h = (multiple - (original_h % multiple)) % multiple
-    pad_w = (multiple - (original_w % multiple)) % multiple
-
-    if pad_h == 0 and pad_w == 0:
-        return image_np, (original_h, original_w)
-
-    padded_image = np.pad(image_np, ((0, pad_h), (0, pad_w), (0, 0)), mode=mode)
-    return padded_image, (original_h, original_w)
-
-def video_processing_task(task_id: str, input_path: str, output_path: str, model_name: str, models_container: Dict[str, Any]):
+def video_processing_task(
+    task_id: str,
+    input_path: str,
+    output_path: str,
+    model_name: str,
+    models_container: Dict[str, Any],
+    roi_rectangles: Optional[List[Tuple[int, int, int, int]]] = None,
+    roi_mask: Optional[np.ndarray] = None,
+    roi_background: str = "passthrough",
+    result_key: Optional[str] = None
+):
     """
     Processes a video frame-by-frame, fully integrated with central task,
-    VRAM, and file cache tracking systems.
+    VRAM, and file cache tracking systems. An optional region of interest
+    limits inference to the tiles it touches in every frame. Identical submissions
+    coalesced with this task under 'result_key' receive its result when it finishes.
     """
     tasks_db = models_container.get("tasks_db", {})
-    models_in_use = models_container.get("models_in_use", {})
+    model_lease = None
+    result_filepath = None
     
     tasks_db[task_id] = {'status': 'processing', 'progress': 0, 'message': 'Starting video processing engine.'}
     print(f"[VIDEO_PROCESSOR] Task {task_id}: Starting for {input_path} with model '{model_name}'")
 
     try:
-        # --- VRAM Reference Counting: Increment ---
-        models_in_use[model_name] = models_in_use.get(model_name, 0) + 1
-        print(f"[REF_COUNT] INCREMENT: Model '{model_name}' in use count is now {models_in_use[model_name]}.")
-        # ----------------------------------------
+        # --- VRAM Model Lease: Acquire ---
+        model_lease = models_container["model_leases"].acquire(model_name)
+        # ---------------------------------
         
-        # This get_model_by_name call will also handle on-demand loading if needed
-        uformer_model = get_model_by_name(model_name=model_name, models=models_container)
-        device = models_container["device"]
-        patch_size = 256
+        # This also handles on-demand loading of the model if needed
+        inference_session = get_inference_session(model_name, models_container)
 
         # 1. Open video and get properties
         cap = cv2.VideoCapture(input_path)
@@ -67,6 +63,9 @@ def video_processing_task(task_id: str, input_path: str, output_path: str, model
         total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         if total_frames == 0:
             raise ValueError("Cannot read video file or video has zero frames.")
+        frame_roi_mask = None
+        if roi_rectangles is not None or roi_mask is not None:
+            frame_roi_mask = build_roi_mask(frame_height, frame_width, roi_rectangles, roi_mask)
         
         # 2. Setup video writer
         temp_video_path = output_path.replace(".mp4", ".tmp.mp4")
@@ -74,28 +73,19 @@ def video_processing_task(task_id: str, input_path: str, output_path: str, model
         writer = cv2.VideoWriter(temp_video_path, fourcc, fps, (frame_width, frame_height))
 
         # 3. Process each frame
+        tile_stats = {} # Tiles run and flat tiles skipped over all frames (see ENABLE_FLAT_TILE_SKIP)
         for i in tqdm(range(total_frames), desc=f"Processing Video Task {task_id}", unit="frame"):
             ret, frame_bgr = cap.read()
             if not ret:
                 break
 
-            # Frame processing logic
-            frame_rgb_float = (cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB) / 255.0).astype(np.float32)
-            padded_frame_np, _ = pad_image_to_multiple(frame_rgb_float, patch_size)
-            padded_h, padded_w, _ = padded_frame_np.shape
-            padded_output_np = np.zeros_like(padded_frame_np)
-
-            for y in range(0, padded_h, patch_size):
-                for x in range(0, padded_w, patch_size):
-                    patch_np = padded_frame_np[y:y+patch_size, x:x+patch_size, :]
-                    patch_tensor = torch.from_numpy(patch_np).permute(2, 0, 1).unsqueeze(0).to(device)
-                    with torch.no_grad():
-                        restored_patch_tensor = uformer_model(patch_tensor)
-                    restored_patch_np = restored_patch_tensor.squeeze(0).permute(1, 2, 0).clamp(0.0, 1.0).cpu().numpy()
-                    padded_output_np[y:y+patch_size, x:x+patch_size, :] = restored_patch_np
-            
-            restored_frame_float = padded_output_np[0:frame_height, 0:frame_width, :]
-            final_frame_bgr = cv2.cvtColor((restored_frame_float * 255.0).astype(np.uint8), cv2.COLOR_RGB2BGR)
+            # Frame processing logic (the session holds the inference slot per frame,
+            # so other jobs can interleave with long videos)
+            frame_rgb = cv2.cvtColor(frame_bgr, cv2.COLOR_BGR2RGB)
+            restored_frame_rgb = inference_session.enhance(
+                frame_rgb, use_patch_processing=True, roi_mask=frame_roi_mask, roi_background=roi_background, tile_stats=tile_stats
+            )
+            final_frame_bgr = cv2.cvtColor(restored_frame_rgb, cv2.COLOR_RGB2BGR)
             writer.write(final_frame_bgr)
             
             # Update progress
@@ -119,6 +109,10 @@ def video_processing_task(task_id: str, input_path: str, output_path: str, model
         if os.path.exists(temp_video_path):
             os.remove(temp_video_path)
         
+        if result_key:
+            models_container["result_cache"].put(result_key, output_path)
+        result_filepath = output_path
+
         # 6. Finalize task status and add to file cache tracker
         relative_path = os.path.relpath(output_path, "temp").replace("\\", "/")
         full_result_path = f"/static_results/{relative_path}"
@@ -127,6 +121,9 @@ def video_processing_task(task_id: str, input_path: str, output_path: str, model
             "result_path": full_result_path,
             "message": "Processing complete."
         })
+        if inference_session.flat_tile_threshold > 0 and tile_stats.get("tiles"):
+            tasks_db[task_id]["flat_tiles_skipped"] = round(tile_stats["flat_tiles"] / tile_stats["tiles"], 4)
+            print(f"[VIDEO_PROCESSOR] Task {task_id}: Flat-tile skipping: {tile_stats['flat_tiles']}/{tile_stats['tiles']} tiles skipped.")
 
         # --- File Cache Tracking ---
         tracker_by_path = models_container.get("tracker_by_path", {})
@@ -155,11 +152,10 @@ def video_processing_task(task_id: str, input_path: str, output_path: str, model
             'message': 'An unexpected error occurred during processing.'
         })
     finally:
-        # --- VRAM Reference Counting: Decrement ---
-        if model_name in models_in_use:
-            models_in_use[model_name] = max(0, models_in_use.get(model_name, 0) - 1)
-            print(f"[REF_COUNT] DECREMENT: Model '{model_name}' in use count is now {models_in_use[model_name]}.")
-        # ----------------------------------------
+        # --- VRAM Model Lease: Release ---
+        if model_lease:
+            model_lease.release()
+        # ---------------------------------
         
         # --- Unprotect the in-progress upload ---
         in_progress_uploads = models_container.get("in_progress_uploads", {})
@@ -168,20 +164,36 @@ def video_processing_task(task_id: str, input_path: str, output_path: str, model
             del in_progress_uploads[abs_input_path]
             print(f"[UPLOAD_TRACKER] Unprotected upload (task finished): {input_path}")
         # --------------------------------------
+        if result_key:
+            models_container["single_flight"].finish(result_key, models_container, result_filepath, "video", tasks_db.get(task_id, {}).get("error"))
 
 
 @router.post("/api/process_video")
 async def process_video(
-    background_tasks: BackgroundTasks,
     video_file: UploadFile = File(...),
     task_type: str = Form("denoise"),
     model_name: str = Form("denoise_b"),
+    speed_tier: Optional[str] = Form(None),
+    roi: Optional[str] = Form(None),
+    roi_mask: Optional[UploadFile] = File(None),
+    roi_background: str = Form("passthrough"),
+    bypass_cache: bool = Form(False),
     models_container: Dict[str, Any] = Depends(get_models)
 ):
     """
     Accepts a video file, starts a background enhancement task, and immediately
     returns a task ID for status polling.
+    If 'speed_tier' is given (e.g. 'fast'), the model registry picks the model for
+    'task_type' at that tier and 'model_name' is ignored.
+    'roi' / 'roi_mask' / 'roi_background' work as for /api/process_image, in frame pixels.
+    Repeated submissions of the same video and settings are served from the result cache
+    unless 'bypass_cache' is set, and ones identical to a video still being processed are
+    attached to that task instead of running the model again.
     """
+    roi_rectangles, roi_mask_array = parse_roi_request(roi, roi_mask, roi_background)
+    model_name = resolve_requested_model(model_name, task_type, speed_tier)
+    if model_name not in model_definitions_dict:
+        raise HTTPException(status_code=400, detail=f"Model definition for '{model_name}' not found. Invalid model_name.")
     tasks_db = models_container.get("tasks_db", {})
     
     # Define task-specific subdirectories
@@ -199,23 +211,50 @@ async def process_video(
     output_filename_base, _ = os.path.splitext(sanitized_filename)
     output_path = os.path.join(video_output_dir, f"enhanced_{task_id}_{output_filename_base}.mp4")
 
-    # Save the uploaded file
-    with open(input_path, "wb") as buffer:
-        buffer.write(await video_file.read())
-
-    # --- Protect the in-progress upload ---
-    in_progress_uploads = models_container.get("in_progress_uploads", {})
-    # Store the absolute path for reliable checking
-    in_progress_uploads[os.path.abspath(input_path)] = True
-    print(f"[UPLOAD_TRACKER] Protecting in-progress upload: {input_path}")
-    # ------------------------------------
+    video_contents = await video_file.read()
 
     # Initial entry in the central tasks_db
     tasks_db[task_id] = {"status": "pending", "filename": sanitized_filename, "message": "Task queued."}
+
+    # Identical submissions are answered from the result cache without queueing any work,
+    # or attached to an identical task that is still running
+    result_key = build_result_key(
+        content_hash(video_contents), model_name, {"kind": "video", "task_type": task_type},
+        roi_rectangles, roi_mask_array, roi_background
+    )
+    if complete_from_result_cache(result_key, task_id, output_path, "video", models_container, bypass_cache):
+        tasks_db[task_id]["filename"] = sanitized_filename
+        return JSONResponse(status_code=200, content={"task_id": task_id, "model_name": model_name, "cached": True, "message": "Result served from the result cache."})
+    leader_task_id = models_container["single_flight"].join(result_key, task_id)
+    if leader_task_id:
+        tasks_db[task_id] = {"status": "pending", "filename": sanitized_filename, "coalesced_with": leader_task_id, "message": "Attached to an identical task in progress."}
+        return JSONResponse(status_code=202, content={"task_id": task_id, "model_name": model_name, "coalesced_with": leader_task_id, "message": "Attached to an identical video processing task in progress."})
+
+    in_progress_uploads = models_container.get("in_progress_uploads", {})
+    try:
+        # Save the uploaded file
+        with open(input_path, "wb") as buffer:
+            buffer.write(video_contents)
+
+        # --- Protect the in-progress upload ---
+        # Store the absolute path for reliable checking
+        in_progress_uploads[os.path.abspath(input_path)] = True
+        print(f"[UPLOAD_TRACKER] Protecting in-progress upload: {input_path}")
+        # ------------------------------------
+
+        # Queue the job on the execution lane this model is routed to
+        models_container["execution_lanes"].submit(
+            model_name, video_processing_task, task_id, input_path, output_path, model_name, models_container,
+            roi_rectangles=roi_rectangles, roi_mask=roi_mask_array, roi_background=roi_background, result_key=result_key
+        )
+    except Exception as e:
+        # The task will never run, so its flight must end here or identical submissions would wait forever
+        in_progress_uploads.pop(os.path.abspath(input_path), None)
+        tasks_db[task_id] = {"status": "failed", "filename": sanitized_filename, "error": f"Could not start the task: {e}"}
+        models_container["single_flight"].finish(result_key, models_container, error=tasks_db[task_id]["error"])
+        raise
     
-    background_tasks.add_task(video_processing_task, task_id, input_path, output_path, model_name, models_container)
-    
-    return JSONResponse(status_code=202, content={"task_id": task_id, "message": "Video processing task started."})
+    return JSONResponse(status_code=202, content={"task_id": task_id, "model_name": model_name, "message": "Video processing task started."})
 
 
 @router.get("/api/video_status/{task_id}")
@@ -228,7 +267,7 @@ async def get_video_status(task_id: str, models_container: Dict[str, Any] = Depe
     task = tasks_db.get(task_id)
     if not task:
         raise HTTPException(status_code=404, detail="Task not found")
-    return JSONResponse(content=task)
+    return JSONResponse(content=mirror_leader_status(task, tasks_db))
 
 # The old /api/download_video endpoint has been removed.
 # Results are now served via the static path /static_results/...
@@ -0,0 +1,129 @@
+# backend/app/engine/artifact_writer.py
+import os
+import queue
+import threading
+import traceback
+import numpy as np
+from typing import Dict, Any, Union
+
+from app.engine.encoders import encode_image_file
+
+# Artifact types and the setting that switches each one off
+ARTIFACT_SETTINGS = {
+    "upload": "SAVE_UPLOAD_COPIES",             # The original uploaded file, byte for byte
+    "developed_input": "SAVE_DEVELOPED_INPUTS"  # JPEG of the decoded / RAW-developed model input, for debugging
+}
+
+# Encoding of "developed_input" artifacts (the quality PIL used to save them with)
+DEVELOPED_INPUT_ENCODING = {"format": "jpeg", "quality": 75, "progressive": False}
+
+
+class ArtifactWriter:
+    """
+    Write-behind for files a task keeps for reference but does not need to produce its result
+    (see ARTIFACT_SETTINGS). Tasks hand them over with submit() and carry on; one background
+    thread writes them. The queue holds at most ARTIFACT_QUEUE_SIZE artifacts and
+    ARTIFACT_QUEUE_MAX_MB of payloads (queued arrays are held in memory until written): when
+    the disk falls behind, further artifacts are dropped (and counted) rather than delaying
+    tasks. Payloads are written as-is (bytes) or JPEG-encoded (uint8 RGB arrays), so arrays
+    must not be modified after submission.
+    """
+    def __init__(self, max_queue: int = None, max_bytes: int = None):
+        self.enabled_types = {
+            artifact_type: os.getenv(setting, "True").lower() == "true"
+            for artifact_type, setting in ARTIFACT_SETTINGS.items()
+        }
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_queue if max_queue is not None else int(os.getenv("ARTIFACT_QUEUE_SIZE", 32)))
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("ARTIFACT_QUEUE_MAX_MB", 256)) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._pending_bytes = 0
+        self._metrics = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "disabled": 0}
+        self._thread = threading.Thread(target=self._run, name="artifact-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, artifact_type: str, filepath: str, payload: Union[bytes, np.ndarray]) -> bool:
+        """Queues an artifact for writing. Returns False if its type is switched off or the queue is full."""
+        if not self.enabled_types.get(artifact_type, False):
+            self._count("disabled")
+            return False
+        size = payload.nbytes if isinstance(payload, np.ndarray) else len(payload)
+        with self._lock:
+            has_room = self._pending_bytes + size <= self.max_bytes
+            if has_room:
+                self._pending_bytes += size
+        if has_room:
+            try:
+                self._queue.put_nowait((artifact_type, filepath, payload, size))
+            except queue.Full:
+                with self._lock:
+                    self._pending_bytes -= size
+                has_room = False
+        if not has_room:
+            self._count("dropped")
+            print(f"[ARTIFACTS] Queue full, dropped {artifact_type} artifact '{filepath}'.")
+            return False
+        self._count("queued")
+        return True
+
+    def write(self, artifact_type: str, filepath: str, payload: Union[bytes, np.ndarray]) -> bool:
+        """
+        Writes an artifact right away in the calling thread, for payloads the caller is about
+        to release. Returns False if its type is switched off or writing failed.
+        """
+        if not self.enabled_types.get(artifact_type, False):
+            self._count("disabled")
+            return False
+        return self._write(artifact_type, filepath, payload)
+
+    def _write(self, artifact_type: str, filepath: str, payload: Union[bytes, np.ndarray]) -> bool:
+        try:
+            os.makedirs(os.path.dirname(filepath), exist_ok=True)
+            if isinstance(payload, np.ndarray):
+                encode_image_file(payload, filepath, DEVELOPED_INPUT_ENCODING)
+            else:
+                with open(filepath, "wb") as f:
+                    f.write(payload)
+            self._count("written")
+            return True
+        except Exception as e:
+            self._count("failed")
+            print(f"[ARTIFACTS] Could not write {artifact_type} artifact '{filepath}': {e}")
+            traceback.print_exc()
+            return False
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                self._queue.task_done()
+                return
+            artifact_type, filepath, payload, size = item
+            try:
+                self._write(artifact_type, filepath, payload)
+            finally:
+                with self._lock:
+                    self._pending_bytes -= size
+                self._queue.task_done()
+
+    def _count(self, metric: str):
+        with self._lock:
+            self._metrics[metric] += 1
+
+    def flush(self):
+        """Blocks until every queued artifact has been written."""
+        self._queue.join()
+
+    def shutdown(self, timeout: float = 30.0):
+        """Writes the remaining artifacts and stops the writer thread."""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+        metrics["pending"] = self._queue.qsize()
+        metrics["max_queue"] = self._queue.maxsize
+        metrics["pending_mb"] = round(self._pending_bytes / (1024 * 1024), 2)
+        metrics["max_mb"] = round(self.max_bytes / (1024 * 1024), 2)
+        metrics["enabled_types"] = dict(self.enabled_types)
+        return metrics
@@ -0,0 +1,268 @@
+# backend/app/engine/autotuner.py
+import os
+import json
+import math
+import time
+import argparse
+import threading
+import torch
+import torch.nn.functional as F
+from typing import Dict, Any, List, Optional, Tuple
+
+from uformer_model.model import attention_backend
+from app.engine.tiling import count_tiles
+
+DEFAULT_TUNING_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tuning'))
+
+# Current (untuned) behaviour of the endpoints: reference attention, 256 tiles, one tile per forward.
+DEFAULT_EXECUTION_CONFIG = {"attention_backend": "reference", "tile_size": 256, "batch_size": 1}
+
+# Configs are tuned per coarse size class, not per input shape, so new photo sizes never need
+# a benchmark of their own. Each class is benchmarked on a representative square input.
+SIZE_CLASSES = {"small": 512, "large": 2048}
+
+
+def get_size_class(height: int, width: int) -> str:
+    """'small' for inputs up to AUTOTUNE_SMALL_MAX_SIDE on their longest side, 'large' otherwise."""
+    return "small" if max(height, width) <= int(os.getenv("AUTOTUNE_SMALL_MAX_SIDE", 1024)) else "large"
+
+
+def _parse_csv_env(name: str, default: str) -> List[str]:
+    return [token.strip() for token in os.getenv(name, default).split(",") if token.strip()]
+
+
+class ExecutionAutotuner:
+    """
+    Picks the fastest (attention backend, tile size, batch size) per (model key, size class)
+    by microbenchmarking the candidates, and caches the winners in a JSON tuning table on disk.
+    Tuning happens during startup warmup (tune_missing()) or through the offline CLI; requests
+    never wait for it. Benchmarks select the attention backend per call, so the shared model
+    instance is never modified.
+    """
+    def __init__(self, table_path: Optional[str] = None):
+        self.table_path = table_path or os.getenv("AUTOTUNE_TABLE_PATH", os.path.join(DEFAULT_TUNING_DIR, "execution_table.json"))
+        self.tune_on_first_seen = os.getenv("AUTOTUNE_ON_FIRST_SEEN", "False").lower() == "true"
+        self.max_whole_tile = int(os.getenv("AUTOTUNE_MAX_WHOLE_TILE", 1024))
+        self.attention_backends = [b for b in _parse_csv_env("AUTOTUNE_ATTENTION_BACKENDS", "reference,fused") if b in ("reference", "fused")]
+        if not hasattr(F, "scaled_dot_product_attention") and "fused" in self.attention_backends:
+            self.attention_backends.remove("fused")
+        self.tile_sizes = _parse_csv_env("AUTOTUNE_TILE_SIZES", "256,512,whole")
+        self.batch_sizes = sorted({int(b) for b in _parse_csv_env("AUTOTUNE_BATCH_SIZES", "1,4,8")})
+
+        self._table: Dict[str, Dict[str, Any]] = {}
+        self._table_mtime: Optional[float] = None
+        self._lock = threading.Lock()
+        self._tuning_keys = set() # Keys being tuned (in the background or by tune_missing())
+        self._load_table()
+
+    @staticmethod
+    def table_key(model_key: str, size_class: str) -> str:
+        return f"{model_key}@{size_class}"
+
+    def _load_table(self):
+        """(Re)loads the tuning table from disk, e.g. after the offline CLI updated it."""
+        if not os.path.exists(self.table_path):
+            return
+        try:
+            mtime = os.path.getmtime(self.table_path)
+            if mtime == self._table_mtime:
+                return
+            with open(self.table_path, 'r') as f:
+                self._table = json.load(f)
+            self._table_mtime = mtime
+        except (OSError, ValueError) as e:
+            print(f"[AUTOTUNER] Could not read tuning table at '{self.table_path}': {e}")
+
+    def _save_table(self):
+        os.makedirs(os.path.dirname(self.table_path), exist_ok=True)
+        tmp_path = f"{self.table_path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._table, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.table_path)
+        self._table_mtime = os.path.getmtime(self.table_path)
+
+    def get_table(self) -> Dict[str, Any]:
+        """Returns a copy of the tuning table for inspection."""
+        with self._lock:
+            self._load_table()
+            return {"path": self.table_path, "entries": dict(self._table)}
+
+    def configs_for(self, model_key: str) -> Dict[str, Dict[str, Any]]:
+        """The tuned config of every size class of 'model_key' that has a table entry."""
+        with self._lock:
+            self._load_table()
+            entries = {size_class: self._table.get(self.table_key(model_key, size_class)) for size_class in SIZE_CLASSES}
+        return {size_class: dict(entry["config"]) for size_class, entry in entries.items() if entry is not None}
+
+    def _candidate_tile_sizes(self, bucket: Tuple[int, int]) -> List[int]:
+        tile_sizes = set()
+        for token in self.tile_sizes:
+            if token == "whole":
+                # A single tile only works for square buckets, the model assumes H == W
+                if bucket[0] == bucket[1] and bucket[0] <= self.max_whole_tile:
+                    tile_sizes.add(bucket[0])
+            elif int(token) % 128 == 0 and int(token) <= max(bucket):
+                tile_sizes.add(int(token))
+        return sorted(tile_sizes) or [DEFAULT_EXECUTION_CONFIG["tile_size"]]
+
+    def get_config(
+        self,
+        model_key: str,
+        model: torch.nn.Module,
+        device: torch.device,
+        height: int,
+        width: int,
+        defaults: Optional[Dict[str, Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Returns the execution config for this model and input shape, never blocking on tuning.
+        Size classes without a table entry use 'defaults' (the model's registry execution
+        settings) or the built-in defaults; with AUTOTUNE_ON_FIRST_SEEN they are also tuned in
+        a background thread, and later requests get the result. Tiles larger than the input
+        are shrunk to the smallest multiple of 128 that covers it.
+        """
+        size_class = get_size_class(height, width)
+        key = self.table_key(model_key, size_class)
+        with self._lock:
+            self._load_table()
+            entry = self._table.get(key)
+            start_tuning = entry is None and self.tune_on_first_seen and key not in self._tuning_keys
+            if start_tuning:
+                self._tuning_keys.add(key)
+        if entry is not None:
+            config = dict(entry["config"])
+        else:
+            defaults = defaults or {}
+            config = {k: defaults.get(k, v) for k, v in DEFAULT_EXECUTION_CONFIG.items()}
+        if start_tuning:
+            threading.Thread(
+                target=self._tune_key, args=(key, model_key, model, device, size_class), name=f"autotune-{key}", daemon=True
+            ).start()
+        config["tile_size"] = min(config["tile_size"], max(128, math.ceil(max(height, width) / 128) * 128))
+        return config
+
+    def _tune_key(self, key: str, model_key: str, model: torch.nn.Module, device: torch.device, size_class: str):
+        try:
+            self.tune(model_key, model, device, size_class)
+        except Exception as e:
+            print(f"[AUTOTUNER] Tuning '{key}' failed, defaults stay in use: {e}")
+        finally:
+            with self._lock:
+                self._tuning_keys.discard(key)
+
+    def tune_missing(self, model_key: str, model: torch.nn.Module, device: torch.device, retune: bool = False) -> List[str]:
+        """
+        Tunes every size class of 'model_key' that has no table entry yet (all of them with
+        'retune'). Blocking; meant for startup warmup and the offline CLI. Returns the tuned keys.
+        """
+        tuned = []
+        for size_class in SIZE_CLASSES:
+            key = self.table_key(model_key, size_class)
+            with self._lock:
+                self._load_table()
+                if (key in self._table and not retune) or key in self._tuning_keys:
+                    continue
+                self._tuning_keys.add(key)
+            try:
+                self.tune(model_key, model, device, size_class)
+                tuned.append(key)
+            finally:
+                with self._lock:
+                    self._tuning_keys.discard(key)
+        return tuned
+
+    def _time_forward(self, model: torch.nn.Module, device: torch.device, backend: str, batch_size: int, tile_size: int) -> float:
+        sample = torch.rand(batch_size, 3, tile_size, tile_size, device=device)
+        with torch.no_grad(), attention_backend(backend):
+            model(sample) # Untimed first call absorbs one-off allocation and kernel selection
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+            start_time = time.perf_counter()
+            model(sample)
+            if device.type == 'cuda':
+                torch.cuda.synchronize(device)
+        return time.perf_counter() - start_time
+
+    def tune(self, model_key: str, model: torch.nn.Module, device: torch.device, size_class: str) -> Dict[str, Any]:
+        """
+        Benchmarks every candidate on synthetic input and stores the fastest in the table.
+        Each candidate is timed on one batch; the full-image cost is extrapolated from the
+        number of batches needed to cover the size class's representative input.
+        """
+        key = self.table_key(model_key, size_class)
+        bucket = (SIZE_CLASSES[size_class], SIZE_CLASSES[size_class])
+        print(f"[AUTOTUNER] Tuning '{key}'...")
+        measurements = []
+        for backend in self.attention_backends:
+            for tile_size in self._candidate_tile_sizes(bucket):
+                num_tiles = count_tiles(bucket[0], bucket[1], tile_size)
+                tried_batches = set()
+                for batch_size in self.batch_sizes:
+                    effective_batch = min(batch_size, num_tiles)
+                    if effective_batch in tried_batches:
+                        continue
+                    tried_batches.add(effective_batch)
+                    try:
+                        batch_seconds = self._time_forward(model, device, backend, effective_batch, tile_size)
+                    except RuntimeError as e: # Includes CUDA out-of-memory
+                        print(f"[AUTOTUNER] Skipping {backend}/{tile_size}/{effective_batch}: {e}")
+                        if device.type == 'cuda':
+                            torch.cuda.empty_cache()
+                        continue
+                    estimated_seconds = math.ceil(num_tiles / effective_batch) * batch_seconds
+                    measurements.append({
+                        "attention_backend": backend,
+                        "tile_size": tile_size,
+                        "batch_size": effective_batch,
+                        "estimated_seconds": round(estimated_seconds, 4)
+                    })
+
+        if measurements:
+            best = min(measurements, key=lambda m: m["estimated_seconds"])
+            config = {k: best[k] for k in ("attention_backend", "tile_size", "batch_size")}
+        else:
+            config = dict(DEFAULT_EXECUTION_CONFIG)
+        entry = {
+            "config": config,
+            "device": str(device),
+            "tuned_at": time.time(),
+            "measurements": measurements
+        }
+        with self._lock:
+            self._table[key] = entry
+            try:
+                self._save_table()
+            except OSError as e:
+                print(f"[AUTOTUNER] Could not persist tuning table: {e}")
+        print(f"[AUTOTUNER] '{key}' -> {config}")
+        return entry
+
+
+def main():
+    """Offline tuning CLI. Run from the backend/ directory:
+    python -m app.engine.autotuner --models denoise_16 deblur_b
+    """
+    from dotenv import load_dotenv
+    from app.api.dependencies import load_models, get_model_by_name
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Populate the execution tuning table offline.")
+    parser.add_argument("--models", nargs="+", required=True, help="Model keys to tune, e.g. denoise_16 deblur_b")
+    parser.add_argument("--retune", action="store_true", help="Re-measure size classes that already have an entry")
+    args = parser.parse_args()
+
+    import asyncio
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    models = {"device": device, "load_all_on_startup": False}
+    asyncio.run(load_models(device, app_models=models, load_definitions_only=True))
+    autotuner = ExecutionAutotuner()
+
+    for model_key in args.models:
+        model = get_model_by_name(model_name=model_key, models=models)
+        autotuner.tune_missing(model_key, model, device, retune=args.retune)
+
+    print(json.dumps({k: v["config"] for k, v in autotuner.get_table()["entries"].items()}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
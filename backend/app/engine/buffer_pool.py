@@ -0,0 +1,90 @@
+# backend/app/engine/buffer_pool.py
+import os
+import threading
+import torch
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Any, List, Tuple
+
+BufferKey = Tuple[Tuple[int, ...], torch.dtype, torch.device]
+
+
+class TensorBufferPool:
+    """
+    Shape-keyed pool of preallocated tensors shared by every inference session. Frame-sized
+    input/output/weight buffers and tile-batch buffers are handed out per frame and returned
+    afterwards, so a long video or live stream reuses the same few allocations instead of
+    churning the allocator. Buffers are NOT zeroed on acquire. Idle buffers beyond
+    BUFFER_POOL_MAX_MB are dropped, least recently returned first.
+    """
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("BUFFER_POOL_MAX_MB", 1024)) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._free: "OrderedDict[BufferKey, List[torch.Tensor]]" = OrderedDict()
+        self._free_bytes = 0
+        self._metrics = {"requests": 0, "hits": 0, "allocations": 0, "evictions": 0, "in_use": 0}
+
+    @staticmethod
+    def _key(shape, dtype: torch.dtype, device: torch.device) -> BufferKey:
+        return tuple(shape), dtype, torch.device(device)
+
+    @staticmethod
+    def _nbytes(tensor: torch.Tensor) -> int:
+        return tensor.numel() * tensor.element_size()
+
+    def acquire(self, shape, dtype: torch.dtype = torch.float32, device: torch.device = torch.device("cpu")) -> torch.Tensor:
+        """Returns an uninitialized contiguous tensor, reusing an idle one of the same shape if possible."""
+        key = self._key(shape, dtype, device)
+        with self._lock:
+            self._metrics["requests"] += 1
+            self._metrics["in_use"] += 1
+            free_list = self._free.get(key)
+            if free_list:
+                tensor = free_list.pop()
+                if not free_list:
+                    del self._free[key]
+                self._free_bytes -= self._nbytes(tensor)
+                self._metrics["hits"] += 1
+                return tensor
+            self._metrics["allocations"] += 1
+        return torch.empty(key[0], dtype=dtype, device=key[2])
+
+    def release(self, tensor: torch.Tensor):
+        """Returns a tensor obtained from acquire(). It must not be used afterwards."""
+        key = self._key(tensor.shape, tensor.dtype, tensor.device)
+        with self._lock:
+            self._metrics["in_use"] -= 1
+            self._free.setdefault(key, []).append(tensor)
+            self._free.move_to_end(key)
+            self._free_bytes += self._nbytes(tensor)
+            while self._free_bytes > self.max_bytes and self._free:
+                oldest_key, oldest_list = next(iter(self._free.items()))
+                evicted = oldest_list.pop(0)
+                if not oldest_list:
+                    del self._free[oldest_key]
+                self._free_bytes -= self._nbytes(evicted)
+                self._metrics["evictions"] += 1
+
+    @contextmanager
+    def borrow(self, shape, dtype: torch.dtype = torch.float32, device: torch.device = torch.device("cpu")):
+        """acquire() for the duration of a 'with' block."""
+        tensor = self.acquire(shape, dtype, device)
+        try:
+            yield tensor
+        finally:
+            self.release(tensor)
+
+    def clear(self):
+        """Drops every idle buffer (e.g. after models are unloaded to give memory back)."""
+        with self._lock:
+            self._free.clear()
+            self._free_bytes = 0
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["hit_rate"] = round(metrics["hits"] / metrics["requests"], 4) if metrics["requests"] else 0.0
+            metrics["idle_buffers"] = sum(len(free_list) for free_list in self._free.values())
+            metrics["idle_mb"] = round(self._free_bytes / (1024 * 1024), 2)
+            metrics["max_mb"] = round(self.max_bytes / (1024 * 1024), 2)
+            return metrics
@@ -0,0 +1,124 @@
+# backend/app/engine/encoders.py
+import os
+import cv2
+import mimetypes
+import numpy as np
+from PIL import Image
+from typing import Dict, Any, Optional
+
+OUTPUT_FORMATS = ("jpeg", "webp", "png")
+MEDIA_TYPES = {"jpeg": "image/jpeg", "webp": "image/webp", "png": "image/png"}
+FILE_EXTENSIONS = {"jpeg": ".jpg", "webp": ".webp", "png": ".png"}
+FORMAT_ALIASES = {"jpg": "jpeg"}
+
+# /static_results takes the Content-Type from the extension; older Pythons do not know .webp
+mimetypes.add_type("image/webp", ".webp")
+
+# When an Accept header ranks formats equally, the one giving the smallest files wins
+NEGOTIATION_PREFERENCE = ("webp", "jpeg", "png")
+
+
+def normalize_output_format(output_format: str) -> str:
+    """Lower-cases and de-aliases a format name ('JPG' -> 'jpeg'). Raises ValueError if unsupported."""
+    name = FORMAT_ALIASES.get(output_format.strip().lower(), output_format.strip().lower())
+    if name not in OUTPUT_FORMATS:
+        raise ValueError(f"Unsupported output_format '{output_format}'. Use one of {list(OUTPUT_FORMATS)}.")
+    return name
+
+
+def negotiate_output_format(accept: Optional[str]) -> Optional[str]:
+    """
+    Picks the output format from an HTTP Accept header, honouring q-values. Returns None when
+    the header names none of OUTPUT_FORMATS explicitly (e.g. '*/*' or 'image/*'), so the
+    deployment default applies.
+    """
+    if not accept:
+        return None
+    ranked = {}
+    for part in accept.split(","):
+        media_range, *params = [token.strip() for token in part.split(";")]
+        quality = 1.0
+        for param in params:
+            if param.startswith("q="):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        for name, media_type in MEDIA_TYPES.items():
+            if media_range.lower() == media_type:
+                ranked[name] = quality
+    ranked = {name: quality for name, quality in ranked.items() if quality > 0}
+    if not ranked:
+        return None
+    return max(ranked, key=lambda name: (ranked[name], -NEGOTIATION_PREFERENCE.index(name)))
+
+
+def resolve_output_encoding(
+    output_format: Optional[str] = None,
+    output_quality: Optional[int] = None,
+    accept: Optional[str] = None,
+    prefix: str = "OUTPUT"
+) -> Dict[str, Any]:
+    """
+    Encoding settings for one result: an explicit 'output_format' wins, then the format
+    negotiated from 'accept' (if ENABLE_ACCEPT_NEGOTIATION), then <prefix>_IMAGE_FORMAT.
+    'output_quality' (1-100) overrides <prefix>_JPEG_QUALITY / <prefix>_WEBP_QUALITY. The
+    remaining knobs (<prefix>_JPEG_PROGRESSIVE, <prefix>_WEBP_METHOD, <prefix>_PNG_COMPRESSION)
+    are per deployment. Raises ValueError for an unsupported format or quality.
+    """
+    if output_format:
+        name = normalize_output_format(output_format)
+    else:
+        negotiated = negotiate_output_format(accept) if os.getenv("ENABLE_ACCEPT_NEGOTIATION", "True").lower() == "true" else None
+        name = negotiated or normalize_output_format(os.getenv(f"{prefix}_IMAGE_FORMAT", "jpeg"))
+    if output_quality is not None and not 1 <= output_quality <= 100:
+        raise ValueError("output_quality must be between 1 and 100.")
+    encoding = {"format": name}
+    if name == "jpeg":
+        encoding["quality"] = output_quality or int(os.getenv(f"{prefix}_JPEG_QUALITY", 95))
+        encoding["progressive"] = os.getenv(f"{prefix}_JPEG_PROGRESSIVE", "False").lower() == "true"
+    elif name == "webp":
+        encoding["quality"] = output_quality or int(os.getenv(f"{prefix}_WEBP_QUALITY", 90))
+        encoding["method"] = int(os.getenv(f"{prefix}_WEBP_METHOD", 0))
+    else:
+        encoding["compression"] = int(os.getenv(f"{prefix}_PNG_COMPRESSION", 1))
+    return encoding
+
+
+def _opencv_params(encoding: Dict[str, Any]) -> list:
+    if encoding["format"] == "jpeg":
+        return [cv2.IMWRITE_JPEG_QUALITY, encoding["quality"], cv2.IMWRITE_JPEG_PROGRESSIVE, int(encoding["progressive"])]
+    if encoding["format"] == "png":
+        return [cv2.IMWRITE_PNG_COMPRESSION, encoding["compression"]]
+    return [cv2.IMWRITE_WEBP_QUALITY, encoding["quality"]]
+
+
+def encode_image_file(image_rgb: np.ndarray, filepath: str, encoding: Dict[str, Any], in_place: bool = False):
+    """
+    Encodes a uint8 RGB HWC image straight into 'filepath'. JPEG and PNG go through OpenCV
+    (libjpeg-turbo, noticeably faster than PIL), which encodes row by row into the file, WebP
+    through PIL, whose 'method' speed knob OpenCV does not expose (and which copies the frame).
+    OpenCV wants BGR: with in_place=True the channels are swapped in the caller's array
+    (which is left BGR, e.g. a result about to be discarded) instead of in a full-frame copy.
+    """
+    if encoding["format"] == "webp":
+        Image.fromarray(image_rgb).save(filepath, format="WEBP", quality=encoding["quality"], method=encoding["method"])
+        return
+    image_bgr = cv2.cvtColor(image_rgb, cv2.COLOR_RGB2BGR, dst=image_rgb if in_place else None)
+    if os.name != "nt" or filepath.isascii():
+        if not cv2.imwrite(filepath, image_bgr, _opencv_params(encoding)):
+            raise RuntimeError(f"Could not encode the result as {encoding['format']}.")
+        return
+    # imwrite cannot open non-ASCII paths on Windows: encode in memory, then write the buffer
+    is_success, buffer = cv2.imencode(FILE_EXTENSIONS[encoding["format"]], image_bgr, _opencv_params(encoding))
+    if not is_success:
+        raise RuntimeError(f"Could not encode the result as {encoding['format']}.")
+    buffer.tofile(filepath)
+
+
+def encode_image_bytes(image_bgr: np.ndarray, encoding: Dict[str, Any]) -> np.ndarray:
+    """Encodes a uint8 BGR frame (OpenCV order, e.g. live stream frames) to an in-memory buffer."""
+    is_success, buffer = cv2.imencode(FILE_EXTENSIONS[encoding["format"]], image_bgr, _opencv_params(encoding))
+    if not is_success:
+        raise RuntimeError(f"Could not encode the frame as {encoding['format']}.")
+    return buffer
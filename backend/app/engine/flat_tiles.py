@@ -0,0 +1,162 @@
+# backend/app/engine/flat_tiles.py
+import os
+import json
+import time
+import argparse
+import torch
+import torch.nn.functional as F
+from typing import Dict, List, Tuple
+
+from app.engine.guided_upsampling import box_filter
+
+# How a tile's activity is measured, in 0-255 luma units:
+# - "std": standard deviation of the luma (flat colour, letterbox bars)
+# - "gradient": RMS of the luma gradient (also treats smooth gradients such as skies as flat)
+FLAT_TILE_METRICS = ("std", "gradient")
+
+# What flat tiles get instead of the model: the input itself, or a 3x3 box filter of it
+FLAT_TILE_FILTERS = ("passthrough", "box")
+
+LUMA_WEIGHTS = (0.299, 0.587, 0.114)
+
+Coords = List[Tuple[int, int]]
+
+
+def _luma(image: torch.Tensor) -> torch.Tensor:
+    """Luma (..., H, W) in 0-255 of a (..., 3, H, W) float RGB tensor in [0, 1]."""
+    weights = torch.tensor(LUMA_WEIGHTS, dtype=image.dtype, device=image.device).view(3, 1, 1)
+    return (image * weights).sum(-3) * 255.0
+
+
+def _squared_gradient(luma: torch.Tensor) -> torch.Tensor:
+    """Per-pixel squared forward-difference gradient of (..., H, W) luma; 0 past the last row/column."""
+    grad_sq = torch.zeros_like(luma)
+    grad_sq[..., :, :-1] += (luma[..., :, 1:] - luma[..., :, :-1]) ** 2
+    grad_sq[..., :-1, :] += (luma[..., 1:, :] - luma[..., :-1, :]) ** 2
+    return grad_sq
+
+
+def _summed_area(values: torch.Tensor) -> torch.Tensor:
+    """Zero-padded (H+1, W+1) summed-area table of an (H, W) map, in float64 for exact large sums."""
+    return F.pad(values.double().cumsum(0).cumsum(1), (1, 0, 1, 0))
+
+
+def _tile_sums(table: torch.Tensor, coords: Coords, tile_size: int) -> torch.Tensor:
+    corners = torch.tensor(coords, device=table.device)
+    y0, x0 = corners[:, 0], corners[:, 1]
+    y1, x1 = y0 + tile_size, x0 + tile_size
+    return table[y1, x1] - table[y0, x1] - table[y1, x0] + table[y0, x0]
+
+
+def tile_activity(image: torch.Tensor, coords: Coords, tile_size: int, metric: str = "std") -> torch.Tensor:
+    """
+    Activity of every (tile_size x tile_size) tile at 'coords' of a CHW float RGB image in
+    [0, 1], in one vectorized pass: per-pixel quantities are integrated into summed-area
+    tables once and every tile is read off its four corners. Returns (len(coords),) float64.
+    """
+    luma = _luma(image)
+    pixels = tile_size * tile_size
+    if metric == "gradient":
+        return (_tile_sums(_summed_area(_squared_gradient(luma)), coords, tile_size) / pixels).sqrt()
+    mean = _tile_sums(_summed_area(luma), coords, tile_size) / pixels
+    mean_sq = _tile_sums(_summed_area(luma * luma), coords, tile_size) / pixels
+    return (mean_sq - mean * mean).clamp_(min=0.0).sqrt()
+
+
+def batch_activity(batch: torch.Tensor, metric: str = "std") -> torch.Tensor:
+    """tile_activity() for tiles that are already batched: (N, 3, t, t) float in [0, 1] -> (N,)."""
+    luma = _luma(batch.float())
+    if metric == "gradient":
+        return _squared_gradient(luma).mean((-2, -1)).sqrt()
+    return luma.flatten(1).std(1, correction=0)
+
+
+def split_flat_tiles(
+    image: torch.Tensor,
+    tile_groups: Dict[int, Coords],
+    threshold: float,
+    metric: str = "std"
+) -> Tuple[Dict[int, Coords], Dict[int, Coords]]:
+    """Splits plan_tiles() groups into (tiles for the model, flat tiles below 'threshold')."""
+    model_groups, flat_groups = {}, {}
+    for tile_size, coords in tile_groups.items():
+        is_flat = (tile_activity(image, coords, tile_size, metric) < threshold).tolist()
+        model_groups[tile_size] = [c for c, flat in zip(coords, is_flat) if not flat]
+        flat_groups[tile_size] = [c for c, flat in zip(coords, is_flat) if flat]
+    return (
+        {size: coords for size, coords in model_groups.items() if coords},
+        {size: coords for size, coords in flat_groups.items() if coords}
+    )
+
+
+def flat_tile_fill(image: torch.Tensor, flat_filter: str) -> torch.Tensor:
+    """What flat tiles are taken from: the (C, H, W) or (N, C, H, W) input itself or its 3x3 box filter."""
+    if flat_filter == "box":
+        return box_filter(image if image.dim() == 4 else image.unsqueeze(0), 1).view_as(image)
+    return image
+
+
+def main():
+    """Threshold benchmark. Run from the backend/ directory:
+    python -m app.engine.flat_tiles --model denoise_16 --images a.jpg b.png --thresholds 1 2 4 8
+    For each threshold, patch-mode results with flat-tile skipping are compared against the same
+    model without skipping: PSNR (uformer_model.utils.image_utils.myPSNR), share of tiles
+    skipped and speed-up. Pick the largest threshold whose PSNR stays above what is visible
+    (about 45 dB is indistinguishable in practice).
+    """
+    import asyncio
+    import numpy as np
+    from PIL import Image
+    from dotenv import load_dotenv
+    from app.api.dependencies import load_models, get_inference_session
+    from app.engine.autotuner import ExecutionAutotuner
+    from app.engine.buffer_pool import TensorBufferPool
+    from app.engine.thread_tuner import InferenceJobGate
+    from uformer_model.utils.image_utils import myPSNR
+
+    load_dotenv()
+    parser = argparse.ArgumentParser(description="Measure the PSNR cost and speed-up of flat-tile skipping.")
+    parser.add_argument("--model", required=True, help="Model key, e.g. denoise_16")
+    parser.add_argument("--images", nargs="+", required=True, help="Test images (photos / video frames)")
+    parser.add_argument("--thresholds", nargs="+", type=float, default=[1.0, 2.0, 4.0, 8.0], help="FLAT_TILE_THRESHOLD values to try")
+    parser.add_argument("--metric", choices=FLAT_TILE_METRICS, default=os.getenv("FLAT_TILE_METRIC", "std"))
+    parser.add_argument("--filter", choices=FLAT_TILE_FILTERS, default=os.getenv("FLAT_TILE_FILTER", "passthrough"))
+    args = parser.parse_args()
+
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+    models = {
+        "device": device, "load_all_on_startup": False, "autotuner": ExecutionAutotuner(),
+        "buffer_pool": TensorBufferPool(), "inference_gate": InferenceJobGate(torch.get_num_threads())
+    }
+    asyncio.run(load_models(device, app_models=models, load_definitions_only=True))
+    session = get_inference_session(args.model, models)
+    session.flat_tile_metric, session.flat_tile_filter = args.metric, args.filter
+
+    def run(frame: np.ndarray, threshold: float):
+        session.flat_tile_threshold = threshold
+        tile_stats = {}
+        start_time = time.perf_counter()
+        restored = session.enhance(frame, processing_mode="patch", tile_stats=tile_stats)
+        return restored, time.perf_counter() - start_time, tile_stats
+
+    report = []
+    for image_path in args.images:
+        frame = np.array(Image.open(image_path).convert("RGB"))
+        run(frame, 0.0) # Warm-up: autotuning and buffer allocation are not part of the timings
+        reference, reference_seconds, _ = run(frame, 0.0)
+        reference_tensor = torch.from_numpy(reference).float() / 255.0
+        for threshold in args.thresholds:
+            restored, seconds, tile_stats = run(frame, threshold)
+            psnr = float(myPSNR(reference_tensor, torch.from_numpy(restored).float() / 255.0))
+            report.append({
+                "image": os.path.basename(image_path),
+                "threshold": threshold,
+                "psnr_vs_full_model": round(psnr, 2) if psnr != float("inf") else "identical",
+                "skipped_fraction": round(tile_stats["flat_tiles"] / tile_stats["tiles"], 4) if tile_stats["tiles"] else 0.0,
+                "speedup": round(reference_seconds / seconds, 2)
+            })
+            print(json.dumps(report[-1]))
+
+
+if __name__ == "__main__":
+    main()
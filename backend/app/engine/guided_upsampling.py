@@ -0,0 +1,29 @@
+# backend/app/engine/guided_upsampling.py
+import torch
+import torch.nn.functional as F
+
+
+def box_filter(image: torch.Tensor, radius: int) -> torch.Tensor:
+    """Mean over a (2r+1) x (2r+1) window for NCHW tensors; windows are cropped at the borders."""
+    return F.avg_pool2d(image, 2 * radius + 1, stride=1, padding=radius, count_include_pad=False)
+
+
+def guided_upsample(guide_low: torch.Tensor, target_low: torch.Tensor, guide_full: torch.Tensor, radius: int, eps: float) -> torch.Tensor:
+    """
+    Fast guided filter upsampling (He & Sun, 2015). Fits 'target_low' as a local affine
+    function of 'guide_low' in every (2r+1) window, then evaluates the smoothed coefficients,
+    bilinearly upsampled, on the full-resolution 'guide_full'. Channels are fitted independently.
+    All tensors are NCHW; the low-resolution pair must have the same size. 'eps' regularizes
+    the fit: larger values give smoother, less edge-following results.
+    """
+    mean_guide = box_filter(guide_low, radius)
+    mean_target = box_filter(target_low, radius)
+    covariance = box_filter(guide_low * target_low, radius) - mean_guide * mean_target
+    variance = box_filter(guide_low * guide_low, radius) - mean_guide * mean_guide
+    scale = covariance / (variance + eps)
+    offset = mean_target - scale * mean_guide
+
+    full_size = guide_full.shape[-2:]
+    scale = F.interpolate(box_filter(scale, radius), size=full_size, mode='bilinear', align_corners=False)
+    offset = F.interpolate(box_filter(offset, radius), size=full_size, mode='bilinear', align_corners=False)
+    return scale.mul_(guide_full).add_(offset)
@@ -0,0 +1,136 @@
+# backend/app/engine/ingest.py
+import io
+import hashlib
+import numpy as np
+import rawpy
+from PIL import Image, ImageOps
+from typing import Optional, Tuple
+
+from app.engine.session import RESIZE_INPUT_SIZE
+
+RAW_EXTENSIONS = ('.arw', '.nef', '.cr2', '.dng')
+
+# Rows copied at a time when a decode is written to a memory-mapped file
+DECODE_STRIP_ROWS = 256
+
+
+def is_raw_filename(filename: str) -> bool:
+    return filename.lower().endswith(RAW_EXTENSIONS)
+
+
+def decode_image(data: bytes, min_side: Optional[int] = None) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Decodes encoded image bytes into a uint8 RGB HWC array and returns it with the image's
+    original (width, height).
+    With 'min_side', the image only needs to be at least that large on both sides (e.g. for
+    the 256x256 resize pipeline), so it is shrunk as cheaply as possible while decoding:
+    - JPEGs use the decoder's draft mode, which decodes directly at 1/2, 1/4 or 1/8 scale.
+    - Anything still at least twice too large is box-reduced by an integer factor in uint8.
+    The remaining (less than 2x) resampling is left to the caller.
+    """
+    image = Image.open(io.BytesIO(data))
+    original_size = image.size
+    if min_side:
+        if image.format == "JPEG":
+            image.draft("RGB", (min_side, min_side)) # Keeps both sides >= min_side
+        image = image.convert("RGB")
+        factor = min(image.size) // min_side
+        if factor >= 2:
+            image = image.reduce(factor)
+    else:
+        image = image.convert("RGB")
+    return np.array(image), original_size
+
+
+def _developed_size(raw: "rawpy.RawPy") -> Tuple[int, int]:
+    """(width, height) of a full-resolution postprocess() of 'raw', after its orientation flip."""
+    sizes = raw.sizes
+    if sizes.flip in (5, 6): # Rotated by 90 degrees
+        return sizes.height, sizes.width
+    return sizes.width, sizes.height
+
+
+def develop_raw(data: bytes, half_size: bool = False) -> Tuple[np.ndarray, Tuple[int, int], str]:
+    """
+    Develops a camera RAW file into a uint8 sRGB HWC array. Returns the array, the (width,
+    height) of a full-resolution development and the method used ("full" or "half_size").
+    half_size=True takes each 2x2 Bayer block as one pixel, which skips demosaicing and is
+    several times faster; use it when the pipeline does not need full resolution.
+    """
+    with rawpy.imread(io.BytesIO(data)) as raw:
+        full_size = _developed_size(raw)
+        rgb = raw.postprocess(use_camera_wb=True, output_color=rawpy.ColorSpace.sRGB, output_bps=8, half_size=half_size)
+    return rgb, full_size, "half_size" if half_size else "full"
+
+
+def raw_preview_image(data: bytes, min_side: int) -> Tuple[Image.Image, str]:
+    """
+    Returns a preview of a camera RAW file and where it came from. The embedded JPEG/bitmap
+    thumbnail is used when its longest side is at least 'min_side' (no development at all);
+    otherwise the file is developed at half size.
+    """
+    with rawpy.imread(io.BytesIO(data)) as raw:
+        try:
+            thumb = raw.extract_thumb()
+            if thumb.format == rawpy.ThumbFormat.JPEG:
+                # Embedded JPEGs carry the camera orientation in their EXIF data
+                image = ImageOps.exif_transpose(Image.open(io.BytesIO(thumb.data)))
+            else:
+                image = Image.fromarray(thumb.data)
+            if max(image.size) >= min_side:
+                return image.convert("RGB"), "embedded_thumbnail"
+        except (rawpy.LibRawNoThumbnailError, rawpy.LibRawUnsupportedThumbnailError):
+            pass
+        rgb = raw.postprocess(use_camera_wb=True, output_color=rawpy.ColorSpace.sRGB, output_bps=8, half_size=True)
+    return Image.fromarray(rgb), "half_size"
+
+
+def content_hash(data: bytes) -> str:
+    """Hex SHA-256 of uploaded file bytes, the key of the decoded-input cache."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def probe_upload_size(data: bytes, filename: str) -> Tuple[int, int]:
+    """(width, height) of the full-resolution decode of an upload, read from its header only."""
+    if is_raw_filename(filename):
+        with rawpy.imread(io.BytesIO(data)) as raw:
+            return _developed_size(raw)
+    with Image.open(io.BytesIO(data)) as image:
+        return image.size
+
+
+def decode_upload_to_file(data: bytes, filename: str, filepath: str) -> Tuple[np.memmap, Tuple[int, int], str]:
+    """
+    Full-resolution decode_upload() into a uint8 RGB HWC memory-mapped file at 'filepath', for
+    inputs too large to keep in RAM. The decoder's own full-frame buffer (PIL's image, LibRaw's
+    output) is copied over in strips of DECODE_STRIP_ROWS rows and released before returning,
+    so no further full-size array is allocated. Returns the memmap, (width, height) and method.
+    """
+    if is_raw_filename(filename):
+        rgb, full_size, method = develop_raw(data)
+        target = np.memmap(filepath, dtype=np.uint8, mode="w+", shape=rgb.shape)
+        for y in range(0, rgb.shape[0], DECODE_STRIP_ROWS):
+            target[y:y + DECODE_STRIP_ROWS] = rgb[y:y + DECODE_STRIP_ROWS]
+        return target, full_size, method
+    with Image.open(io.BytesIO(data)) as image:
+        image.load()
+        width, height = image.size
+        target = np.memmap(filepath, dtype=np.uint8, mode="w+", shape=(height, width, 3))
+        for y in range(0, height, DECODE_STRIP_ROWS):
+            # Converting strip by strip avoids a second full-frame image for non-RGB modes
+            strip = image.crop((0, y, width, min(y + DECODE_STRIP_ROWS, height))).convert("RGB")
+            target[y:y + strip.height] = np.asarray(strip)
+    return target, (width, height), "full"
+
+
+def decode_upload(data: bytes, filename: str, reduced: bool = False) -> Tuple[np.ndarray, Tuple[int, int], str]:
+    """
+    Decodes an uploaded image or camera RAW file into a uint8 RGB HWC array. Returns the array,
+    the (width, height) of the full-resolution image and the method used: "full", or, with
+    reduced=True (inputs for the resize pipeline), "reduced" (shrunk while decoding) or
+    "half_size" (RAW developed without demosaicing).
+    """
+    if is_raw_filename(filename):
+        return develop_raw(data, half_size=reduced)
+    array, full_size = decode_image(data, min_side=RESIZE_INPUT_SIZE if reduced else None)
+    return array, full_size, "reduced" if (array.shape[1], array.shape[0]) != full_size else "full"
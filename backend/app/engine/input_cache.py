@@ -0,0 +1,163 @@
+# backend/app/engine/input_cache.py
+import os
+import threading
+import numpy as np
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+from app.engine.ingest import decode_upload
+
+# How many inputs too large to cache are remembered, to tell hash-only resubmissions why
+# they cannot be served
+OVERSIZED_RECORDS = 256
+
+
+class DecodedInputCache:
+    """
+    Memory-bounded LRU cache of decoded / RAW-developed inputs keyed by the SHA-256 of the
+    uploaded bytes, so the same file uploaded to /api/generate_preview and then to
+    /api/process_image (or resubmitted by hash only) is decoded once. Full-resolution and
+    reduced ("resize" pipeline) decodes are cached separately; a reduced lookup also accepts
+    a full-resolution entry. Cached arrays are shared, callers must not modify them.
+    Inputs being prefetched are "pending" (see reserve()) and count as cached for hash-only
+    lookups, which wait for them. Inputs too large to keep decoded are recorded as oversized.
+    """
+    def __init__(self, max_bytes: int = None):
+        self.max_bytes = max_bytes if max_bytes is not None else int(float(os.getenv("DECODED_INPUT_CACHE_MAX_MB", 1024)) * 1024 * 1024)
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Tuple[str, bool], Dict[str, Any]]" = OrderedDict()
+        self._decode_locks: Dict[Tuple[str, bool], threading.Lock] = {}
+        self._pending: Dict[str, Dict[str, Any]] = {}
+        self._oversized: "OrderedDict[str, str]" = OrderedDict()
+        self.pending_timeout = float(os.getenv("DECODE_PREFETCH_WAIT_SECONDS", 120))
+        self._bytes = 0
+        self._metrics = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def _lookup(self, content_hash: str, reduced: bool) -> Optional[Dict[str, Any]]:
+        """Returns the best cached entry (moving it to the LRU end) or None. Call with the lock held."""
+        for key in ([(content_hash, True)] if reduced else []) + [(content_hash, False)]:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                return self._entries[key]
+        return None
+
+    def contains(self, content_hash: str, reduced: bool = False) -> bool:
+        with self._lock:
+            return self._lookup(content_hash, reduced) is not None
+
+    def get_or_decode(
+        self,
+        content_hash: str,
+        reduced: bool = False,
+        data: Optional[bytes] = None,
+        filename: str = ""
+    ) -> Tuple[np.ndarray, Tuple[int, int], str, bool]:
+        """
+        Returns (array, full (width, height), decode method, cache hit). On a miss the upload
+        is decoded with decode_upload() and cached; concurrent misses for the same input wait
+        for one decode. Without 'data' (hash-only resubmission) a pending prefetch of the input
+        is waited for (up to DECODE_PREFETCH_WAIT_SECONDS); raises KeyError if it is still missing.
+        """
+        if data is None:
+            with self._lock:
+                pending = self._pending.get(content_hash)
+            if pending is not None:
+                pending["event"].wait(self.pending_timeout)
+        key = (content_hash, reduced)
+        with self._lock:
+            decode_lock = self._decode_locks.setdefault(key, threading.Lock())
+        try:
+            with decode_lock:
+                with self._lock:
+                    entry = self._lookup(content_hash, reduced)
+                    self._metrics["hits" if entry else "misses"] += 1
+                if entry:
+                    return entry["array"], entry["full_size"], entry["method"], True
+                if data is None:
+                    raise KeyError(content_hash)
+                array, full_size, method = decode_upload(data, filename, reduced)
+                self._put(key, {"array": array, "full_size": full_size, "method": method, "filename": filename})
+                return array, full_size, method, False
+        finally:
+            with self._lock:
+                self._decode_locks.pop(key, None)
+
+    def filename_for(self, content_hash: str, reduced: bool = False) -> Optional[str]:
+        """
+        The original filename of a cached input, if a decode usable with 'reduced' is cached
+        (a reduced lookup also accepts a full-resolution entry, not the other way round) or a
+        full-resolution prefetch of it is pending.
+        """
+        with self._lock:
+            entry = self._lookup(content_hash, reduced) or self._pending.get(content_hash)
+            return entry["filename"] if entry else None
+
+    def known_filename(self, content_hash: str) -> Optional[str]:
+        """The original filename of an input that is cached, pending or recorded as oversized."""
+        with self._lock:
+            entry = self._lookup(content_hash, True) or self._pending.get(content_hash)
+            return entry["filename"] if entry else self._oversized.get(content_hash)
+
+    def reserve(self, content_hash: str, filename: str):
+        """
+        Marks a full-resolution decode of an input as pending, before the response that hands
+        out its hash; the prefetch must call release() when it is done, whatever the outcome.
+        """
+        with self._lock:
+            if (content_hash, False) not in self._entries and content_hash not in self._pending:
+                self._pending[content_hash] = {"filename": filename, "event": threading.Event()}
+
+    def release(self, content_hash: str):
+        """Ends a pending prefetch (cached, recorded as oversized or failed) and wakes its waiters."""
+        with self._lock:
+            pending = self._pending.pop(content_hash, None)
+        if pending is not None:
+            pending["event"].set()
+
+    def mark_oversized(self, content_hash: str, filename: str):
+        """Records an input that is too large to keep decoded (not cached, or streamed)."""
+        with self._lock:
+            self._oversized[content_hash] = filename
+            self._oversized.move_to_end(content_hash)
+            while len(self._oversized) > OVERSIZED_RECORDS:
+                self._oversized.popitem(last=False)
+
+    def is_oversized(self, content_hash: str) -> bool:
+        with self._lock:
+            return content_hash in self._oversized
+
+    def discard(self, content_hash: str, reduced: bool = False):
+        """Drops a cached decode, e.g. one too large to keep resident while it is streamed."""
+        with self._lock:
+            entry = self._entries.pop((content_hash, reduced), None)
+            if entry is not None:
+                self._bytes -= entry["array"].nbytes
+                self._metrics["evictions"] += 1
+
+    def _put(self, key: Tuple[str, bool], entry: Dict[str, Any]):
+        size = entry["array"].nbytes
+        if size > self.max_bytes:
+            # Would evict everything else; such inputs are not cached
+            self.mark_oversized(key[0], entry["filename"])
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= self._entries.pop(key)["array"].nbytes
+            self._entries[key] = entry
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted["array"].nbytes
+                self._metrics["evictions"] += 1
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics["hits"] + metrics["misses"]
+            metrics["hit_rate"] = round(metrics["hits"] / lookups, 4) if lookups else 0.0
+            metrics["entries"] = len(self._entries)
+            metrics["pending"] = len(self._pending)
+            metrics["oversized"] = len(self._oversized)
+            metrics["size_mb"] = round(self._bytes / (1024 * 1024), 2)
+            metrics["max_mb"] = round(self.max_bytes / (1024 * 1024), 2)
+            return metrics
@@ -0,0 +1,231 @@
+# backend/app/engine/lanes.py
+import os
+import math
+import time
+import threading
+import traceback
+import torch
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from typing import Dict, Any, List, Optional, Callable
+
+DEFAULT_LANE_NAME = "default"
+
+# Set in every lane worker thread so code running inside a lane can find it.
+_lane_context = threading.local()
+
+
+def get_current_lane() -> Optional["ExecutionLane"]:
+    """Returns the lane whose worker thread is calling, or None outside of lanes."""
+    return getattr(_lane_context, "lane", None)
+
+
+def get_usable_cores() -> List[int]:
+    """The CPU core ids this process may run on."""
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError: # sched_getaffinity is Linux-only
+        return list(range(os.cpu_count() or 1))
+
+
+def parse_core_list(value: str) -> List[int]:
+    """Parses a core list such as "0-3,8,10-11" into sorted core ids."""
+    cores = set()
+    for token in str(value).split(","):
+        token = token.strip()
+        if not token:
+            continue
+        if "-" in token:
+            first, last = (int(v) for v in token.split("-", 1))
+            cores.update(range(first, last + 1))
+        else:
+            cores.add(int(token))
+    return sorted(cores)
+
+
+class ExecutionLane:
+    """
+    A dedicated worker pool for the models routed to it. When 'cores' is given, every worker
+    thread is pinned to those cores and runs torch with 'threads_per_worker' intra-op threads,
+    so jobs in different lanes never compete for the same cores. Unpinned lanes leave thread
+    placement to the OS and the shared inference gate.
+    Latency-sensitive jobs (live stream frames) go through submit_interactive() to the lane's
+    own interactive worker(s), on the same cores, so they never queue behind long image or
+    video jobs.
+    """
+    def __init__(self, name: str, targets: List[str], workers: int, cores: Optional[List[int]] = None, threads_per_worker: Optional[int] = None):
+        self.name = name
+        self.targets = targets
+        self.workers = workers
+        self.cores = cores
+        self.pinned = bool(cores)
+        self.threads_per_worker = threads_per_worker or (max(1, len(cores) // workers) if cores else None)
+
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._active = 0
+        self._completed = 0
+        self._failed = 0
+        self._busy_seconds = 0.0
+        self._created_at = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"lane-{name}", initializer=self._init_worker)
+        self.interactive_workers = max(1, int(os.getenv("EXECUTION_LANE_INTERACTIVE_WORKERS", 1)))
+        self._interactive_executor = ThreadPoolExecutor(
+            max_workers=self.interactive_workers, thread_name_prefix=f"lane-{name}-interactive", initializer=self._init_worker
+        )
+
+    def _init_worker(self):
+        _lane_context.lane = self
+        if self.pinned:
+            try:
+                os.sched_setaffinity(0, self.cores) # pid 0 pins only the calling thread on Linux
+            except (AttributeError, OSError) as e:
+                print(f"[LANES] Could not pin lane '{self.name}' to cores {self.cores}: {e}")
+        if self.threads_per_worker:
+            torch.set_num_threads(self.threads_per_worker)
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """Queues fn(*args, **kwargs) on this lane and returns its Future."""
+        with self._lock:
+            self._queued += 1
+        return self._executor.submit(self._run, fn, args, kwargs)
+
+    def submit_interactive(self, fn: Callable, *args, **kwargs) -> Future:
+        """Like submit(), on the interactive worker(s): short jobs that must not wait behind long ones."""
+        with self._lock:
+            self._queued += 1
+        return self._interactive_executor.submit(self._run, fn, args, kwargs)
+
+    def _run(self, fn: Callable, args: tuple, kwargs: Dict[str, Any]):
+        with self._lock:
+            self._queued -= 1
+            self._active += 1
+        start_time = time.perf_counter()
+        failed = False
+        try:
+            return fn(*args, **kwargs)
+        except Exception:
+            failed = True
+            traceback.print_exc()
+            raise
+        finally:
+            with self._lock:
+                self._active -= 1
+                self._completed += 1
+                self._failed += int(failed)
+                self._busy_seconds += time.perf_counter() - start_time
+
+    def slot(self):
+        """
+        Inference slot for pinned lanes: the lane's worker count already bounds concurrency,
+        so only the lane's thread count is (re)applied. Unpinned lanes return a no-op context.
+        """
+        if not self.pinned:
+            return nullcontext()
+        return self._pinned_slot()
+
+    @contextmanager
+    def _pinned_slot(self):
+        torch.set_num_threads(self.threads_per_worker)
+        yield
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            elapsed = time.monotonic() - self._created_at
+            busy_seconds = self._busy_seconds
+            return {
+                "targets": self.targets,
+                "cores": self.cores,
+                "workers": self.workers,
+                "interactive_workers": self.interactive_workers,
+                "threads_per_worker": self.threads_per_worker,
+                "queued": self._queued,
+                "active": self._active,
+                "completed": self._completed,
+                "failed": self._failed,
+                "busy_seconds": round(busy_seconds, 3),
+                # Share of the lane's total worker time spent running jobs since it was created
+                "utilization": round(busy_seconds / (elapsed * (self.workers + self.interactive_workers)), 4) if elapsed > 0 else 0.0
+            }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        self._interactive_executor.shutdown(wait=False, cancel_futures=True)
+
+
+class ExecutionLanes:
+    """
+    Routes jobs to execution lanes by model key, then by the model's speed tier (from the
+    model registry), falling back to the default lane.
+    """
+    def __init__(self, lanes: List[ExecutionLane], registry: Dict[str, Any]):
+        self.lanes = {lane.name: lane for lane in lanes}
+        self.registry = registry
+
+    def lane_for(self, model_key: str) -> ExecutionLane:
+        speed_tier = self.registry.get("models", {}).get(model_key, {}).get("speed_tier")
+        for target in (model_key, speed_tier):
+            for lane in self.lanes.values():
+                if target is not None and target in lane.targets:
+                    return lane
+        return self.lanes[DEFAULT_LANE_NAME]
+
+    def submit(self, model_key: str, fn: Callable, *args, **kwargs) -> Future:
+        """Queues a job that runs 'model_key' on the lane that model is routed to."""
+        return self.lane_for(model_key).submit(fn, *args, **kwargs)
+
+    def submit_interactive(self, model_key: str, fn: Callable, *args, **kwargs) -> Future:
+        """Queues a latency-sensitive job (a live stream frame) on its lane's interactive worker(s)."""
+        return self.lane_for(model_key).submit_interactive(fn, *args, **kwargs)
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
+
+    def shutdown(self):
+        for lane in self.lanes.values():
+            lane.shutdown()
+
+
+def build_execution_lanes(registry: Dict[str, Any]) -> ExecutionLanes:
+    """
+    Builds the lanes declared under "execution_lanes" in the model registry when
+    ENABLE_EXECUTION_LANES is set. Each lane takes explicit 'cores' ("0-3") or a 'core_share'
+    of the usable cores, assigned in declaration order; lanes may not share cores. A lane named
+    "default" catches unrouted models. Otherwise a default lane is added on the unclaimed cores,
+    and at least one core (the last usable one) is kept back for it, so unrouted jobs never
+    run on the cores of the declared lanes. Raises ValueError for an impossible layout.
+    """
+    default_workers = max(1, int(os.getenv("EXECUTION_LANE_DEFAULT_WORKERS", 8)))
+    lane_specs = registry.get("execution_lanes", []) if os.getenv("ENABLE_EXECUTION_LANES", "False").lower() == "true" else []
+
+    usable_cores = get_usable_cores()
+    free_cores = list(usable_cores)
+    # Without a declared default lane, the implicit one needs cores of its own
+    reserved_cores = free_cores[-1:] if lane_specs and not any(spec["name"] == DEFAULT_LANE_NAME for spec in lane_specs) else []
+    free_cores = [core for core in free_cores if core not in reserved_cores]
+    shareable_count = len(free_cores)
+    lanes = []
+    for lane_spec in lane_specs:
+        name = lane_spec["name"]
+        workers = max(1, int(lane_spec.get("workers", 1)))
+        if "cores" in lane_spec:
+            cores = parse_core_list(lane_spec["cores"])
+        elif "core_share" in lane_spec:
+            cores = free_cores[:max(1, math.floor(float(lane_spec["core_share"]) * shareable_count))]
+        else:
+            raise ValueError(f"Execution lane '{name}' needs either 'cores' or 'core_share'.")
+        unavailable = [core for core in cores if core not in free_cores]
+        if unavailable or not cores:
+            raise ValueError(
+                f"Execution lane '{name}' requests cores {unavailable or cores} that are unusable, already assigned to another "
+                f"lane or reserved for the default lane ({reserved_cores}; declare a 'default' lane to assign it explicitly)."
+            )
+        free_cores = [core for core in free_cores if core not in cores]
+        lanes.append(ExecutionLane(name, lane_spec.get("targets", []), workers, cores, lane_spec.get("threads_per_worker")))
+        print(f"[LANES] Lane '{name}' -> targets {lanes[-1].targets}, cores {cores}, {workers} worker(s) x {lanes[-1].threads_per_worker} thread(s).")
+
+    if not any(lane.name == DEFAULT_LANE_NAME for lane in lanes):
+        # With configured lanes, unrouted models get the reserved core and any cores no lane claimed
+        default_cores = (free_cores + reserved_cores) if lanes else None
+        lanes.append(ExecutionLane(DEFAULT_LANE_NAME, [], default_workers, default_cores))
+    return ExecutionLanes(lanes, registry)
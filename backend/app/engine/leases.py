@@ -0,0 +1,108 @@
+# backend/app/engine/leases.py
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, Optional
+
+
+class ModelLease:
+    """
+    A handle on one model held by one user (a background task or a WebSocket connection).
+    While at least one lease is held the model cannot be unloaded. Release it exactly once,
+    either explicitly with release() or by using the lease as a context manager.
+    """
+    def __init__(self, manager: "ModelLeaseManager", model_name: str):
+        self.manager = manager
+        self.model_name = model_name
+        self._released = False
+
+    def release(self):
+        """Returns the lease. Calling it more than once is a no-op."""
+        if not self._released:
+            self._released = True
+            self.manager._release(self.model_name)
+
+    def __enter__(self) -> "ModelLease":
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        self.release()
+
+
+class ModelLeaseManager:
+    """
+    Thread-safe reference counting for loaded models, shared by the worker threads that run
+    inference and the endpoints that unload models. All counts are read and changed under a
+    single condition variable, so a model is either leased or being unloaded, never both:
+    - acquire() waits while the model is being unloaded, then takes a lease.
+    - exclusive() waits (up to a timeout) until no leases are held and blocks new ones
+      while the caller unloads the model.
+    """
+    def __init__(self):
+        self._condition = threading.Condition()
+        self._lease_counts: Dict[str, int] = {}
+        self._exclusive: set = set()
+        # Optional observer of model usage (see ModelResidencyManager), notified outside the lock
+        self.usage_listener = None
+
+    def acquire(self, model_name: str, track_usage: bool = True) -> ModelLease:
+        """
+        Takes a lease on 'model_name', waiting for an unload of that model to finish first.
+        Internal users (e.g. preloading) pass track_usage=False so they do not count as demand.
+        """
+        with self._condition:
+            while model_name in self._exclusive:
+                self._condition.wait()
+            self._lease_counts[model_name] = self._lease_counts.get(model_name, 0) + 1
+            count = self._lease_counts[model_name]
+        print(f"[MODEL_LEASE] ACQUIRE: Model '{model_name}' lease count is now {count}.")
+        if track_usage and self.usage_listener:
+            self.usage_listener.on_lease_acquired(model_name)
+        return ModelLease(self, model_name)
+
+    def _release(self, model_name: str):
+        with self._condition:
+            count = self._lease_counts.get(model_name, 0) - 1
+            if count > 0:
+                self._lease_counts[model_name] = count
+            else:
+                count = 0
+                self._lease_counts.pop(model_name, None)
+                self._condition.notify_all() # Wake unloads waiting for this model to go idle
+        print(f"[MODEL_LEASE] RELEASE: Model '{model_name}' lease count is now {count}.")
+        if self.usage_listener:
+            self.usage_listener.on_lease_released(model_name)
+
+    def lease_count(self, model_name: str) -> int:
+        with self._condition:
+            return self._lease_counts.get(model_name, 0)
+
+    def snapshot(self) -> Dict[str, int]:
+        """Returns a copy of the current lease counts of all leased models."""
+        with self._condition:
+            return dict(self._lease_counts)
+
+    @contextmanager
+    def exclusive(self, model_name: str, timeout: Optional[float] = 0):
+        """
+        Yields True once 'model_name' has no leases, and keeps new leases out until the 'with'
+        block ends. Waits at most 'timeout' seconds (0 = do not wait, None = wait forever) and
+        yields False if the model is still leased by then, in which case nothing is blocked.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._condition:
+            while self._lease_counts.get(model_name, 0) > 0 or model_name in self._exclusive:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    break
+                self._condition.wait(remaining)
+            acquired = self._lease_counts.get(model_name, 0) == 0 and model_name not in self._exclusive
+            if acquired:
+                self._exclusive.add(model_name)
+        try:
+            yield acquired
+        finally:
+            if acquired:
+                with self._condition:
+                    self._exclusive.discard(model_name)
+                    self._condition.notify_all() # Wake tasks waiting to lease this model
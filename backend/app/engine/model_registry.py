@@ -0,0 +1,130 @@
+# backend/app/engine/model_registry.py
+import os
+import json
+import torch
+import torch.nn as nn
+from typing import Dict, Any, Optional
+
+from uformer_model.model import Uformer, Downsample, Upsample
+
+BACKEND_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+DEFAULT_REGISTRY_PATH = os.path.join(BACKEND_DIR, 'model_registry.json')
+
+DEFAULT_SPEED_TIERS = ["fast", "balanced", "quality"]
+
+# Constructor arguments shared by every released Uformer checkpoint. Registry entries only
+# need to list what differs (embed_dim, depths, num_heads, modulator, ...).
+DEFAULT_ARCHITECTURE = {
+    "img_size": 256,
+    "in_chans": 3,
+    "dd_in": 3,
+    "embed_dim": 32,
+    "depths": [1, 2, 8, 8, 2, 8, 8, 2, 1],
+    "num_heads": [1, 2, 4, 8, 16, 16, 8, 4, 2],
+    "win_size": 8,
+    "mlp_ratio": 4.,
+    "qkv_bias": True,
+    "qk_scale": None,
+    "drop_rate": 0.,
+    "attn_drop_rate": 0.,
+    "drop_path_rate": 0.1,
+    "patch_norm": True,
+    "use_checkpoint": False,
+    "token_projection": 'linear',
+    "token_mlp": 'leff',
+    "shift_flag": True,
+    "modulator": False,
+    "cross_modulator": False
+}
+
+DEFAULT_EXECUTION = {
+    "precision": "fp32",
+    "attention_backend": "reference",
+    "tile_size": 256,
+    "batch_size": 1,
+    "quantization": None, # "dynamic_int8" quantizes nn.Linear layers (CPU only)
+    "strict_load": True   # Set to false for depth-truncated profiles that load a subset of the weights
+}
+
+REQUIRED_FIELDS = ("task_type", "speed_tier", "weights")
+
+
+def load_model_registry(path: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Reads and validates the model registry file (MODEL_REGISTRY_PATH, defaults to
+    backend/model_registry.json). Returns {"speed_tiers": [...], "models": {key: spec},
+    "execution_lanes": [...]} where every spec has its architecture/execution defaults filled in
+    and an absolute weights path.
+    """
+    path = path or os.getenv("MODEL_REGISTRY_PATH", DEFAULT_REGISTRY_PATH)
+    with open(path, 'r') as f:
+        raw_registry = json.load(f)
+
+    registry_dir = os.path.dirname(os.path.abspath(path))
+    weights_dir = os.path.join(registry_dir, raw_registry.get("weights_dir", "model_weights/official_pretrained"))
+    speed_tiers = raw_registry.get("speed_tiers", DEFAULT_SPEED_TIERS)
+
+    models = {}
+    for key, entry in raw_registry.get("models", {}).items():
+        missing = [field for field in REQUIRED_FIELDS if field not in entry]
+        if missing:
+            raise ValueError(f"Model registry entry '{key}' is missing required fields: {missing}")
+        if entry["speed_tier"] not in speed_tiers:
+            raise ValueError(f"Model registry entry '{key}' has unknown speed_tier '{entry['speed_tier']}'. Known tiers: {speed_tiers}")
+        models[key] = {
+            "key": key,
+            "description": entry.get("description", ""),
+            "task_type": entry["task_type"],
+            "speed_tier": entry["speed_tier"],
+            "weights_path": os.path.join(weights_dir, entry["weights"]),
+            "architecture": {**DEFAULT_ARCHITECTURE, **entry.get("architecture", {})},
+            "execution": {**DEFAULT_EXECUTION, **entry.get("execution", {})}
+        }
+
+    execution_lanes = raw_registry.get("execution_lanes", [])
+    for lane in execution_lanes:
+        if "name" not in lane:
+            raise ValueError(f"Execution lane {lane} is missing its 'name'.")
+
+    return {"path": path, "speed_tiers": speed_tiers, "models": models, "execution_lanes": execution_lanes}
+
+
+def build_model(spec: Dict[str, Any]) -> Uformer:
+    """Instantiates the (untrained) Uformer architecture described by a registry spec."""
+    return Uformer(
+        **spec["architecture"],
+        norm_layer=nn.LayerNorm,
+        dowsample=Downsample,
+        upsample=Upsample
+    )
+
+
+def apply_load_time_optimizations(model: nn.Module, spec: Dict[str, Any], device: torch.device) -> nn.Module:
+    """Applies registry execution options that transform the model after its weights are loaded."""
+    if spec["execution"].get("quantization") == "dynamic_int8":
+        if device.type != 'cpu':
+            print(f"[MODEL_REGISTRY] Skipping dynamic_int8 quantization for '{spec['key']}': only supported on CPU.")
+        else:
+            model = torch.ao.quantization.quantize_dynamic(model, {nn.Linear}, dtype=torch.qint8)
+            print(f"[MODEL_REGISTRY] Applied dynamic_int8 quantization to '{spec['key']}'.")
+    return model
+
+
+def resolve_model_key(registry: Dict[str, Any], task_type: str, speed_tier: str) -> str:
+    """
+    Picks the model for a task at the requested speed tier. If no model exists at that tier,
+    the closest tier is used, preferring faster tiers over slower ones.
+    """
+    speed_tiers = registry["speed_tiers"]
+    if speed_tier not in speed_tiers:
+        raise ValueError(f"Unknown speed_tier '{speed_tier}'. Known tiers: {speed_tiers}")
+    candidates = [spec for spec in registry["models"].values() if spec["task_type"] == task_type]
+    if not candidates:
+        raise ValueError(f"No model registered for task_type '{task_type}'.")
+
+    requested_index = speed_tiers.index(speed_tier)
+    def tier_distance(spec):
+        index = speed_tiers.index(spec["speed_tier"])
+        return (abs(index - requested_index), index > requested_index, spec["key"])
+    return min(candidates, key=tier_distance)["key"]
+
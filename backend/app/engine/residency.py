@@ -0,0 +1,204 @@
+# backend/app/engine/residency.py
+import os
+import json
+import time
+import threading
+import torch
+from collections import deque
+from datetime import datetime
+from typing import Dict, Any, List, Optional
+
+DEFAULT_TUNING_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tuning'))
+
+# How many days of per-hour usage are kept for the time-of-day predictor
+HOURLY_HISTORY_DAYS = 14
+
+
+class ModelResidencyManager:
+    """
+    Decides which models stay in memory. It observes every model lease (see ModelLeaseManager)
+    and, on each cycle:
+    - unloads models that have been idle for longer than MODEL_IDLE_TTL_SECONDS,
+    - preloads models that the request history predicts will be needed soon, either because
+      they usually follow the most recently used model ("transition") or because they are
+      usually used at this hour of the day ("time_of_day").
+    Every decision and its outcome is kept in a short log for /api/loaded_models_status.
+    """
+    def __init__(self, models: Dict[str, Any], model_definitions: Dict[str, Any]):
+        self.models = models # Shared state: loaded models, device, leases, sessions
+        self.model_definitions = model_definitions
+        self.idle_ttl_seconds = float(os.getenv("MODEL_IDLE_TTL_SECONDS", 1800))
+        self.enable_preload = os.getenv("ENABLE_PREDICTIVE_PRELOAD", "True").lower() == "true"
+        self.transition_window_seconds = float(os.getenv("PRELOAD_TRANSITION_WINDOW_SECONDS", 300))
+        self.transition_threshold = float(os.getenv("PRELOAD_TRANSITION_THRESHOLD", 0.5))
+        self.hourly_threshold = float(os.getenv("PRELOAD_HOURLY_THRESHOLD", 0.5))
+        self.min_observations = max(1, int(os.getenv("PRELOAD_MIN_OBSERVATIONS", 3)))
+        self.max_preloads_per_cycle = max(0, int(os.getenv("PRELOAD_MAX_PER_CYCLE", 1)))
+        self.history_path = os.getenv("RESIDENCY_HISTORY_PATH", os.path.join(DEFAULT_TUNING_DIR, "residency_history.json"))
+
+        self._lock = threading.Lock()
+        self._last_used_at: Dict[str, float] = {}
+        self._last_model: Optional[str] = None
+        self._last_model_at = 0.0
+        # Persisted history: transition counts {from: {to: n}} and the dates each model was used per hour
+        self._transitions: Dict[str, Dict[str, int]] = {}
+        self._hourly_dates: Dict[str, Dict[str, List[str]]] = {}
+        self._history_dirty = False
+        self._decisions = deque(maxlen=int(os.getenv("RESIDENCY_DECISION_LOG_SIZE", 50)))
+        self._load_history()
+
+    # --- Usage observation (called by ModelLeaseManager) ---
+
+    def on_lease_acquired(self, model_name: str):
+        now = time.time()
+        today, hour = datetime.fromtimestamp(now).strftime("%Y-%m-%d"), str(datetime.fromtimestamp(now).hour)
+        with self._lock:
+            self._last_used_at[model_name] = now
+            previous = self._last_model
+            if previous and previous != model_name and now - self._last_model_at <= self.transition_window_seconds:
+                successors = self._transitions.setdefault(previous, {})
+                successors[model_name] = successors.get(model_name, 0) + 1
+            self._last_model, self._last_model_at = model_name, now
+            dates = self._hourly_dates.setdefault(model_name, {}).setdefault(hour, [])
+            if today not in dates:
+                dates.append(today)
+                del dates[:-HOURLY_HISTORY_DAYS]
+            self._history_dirty = True
+
+    def on_lease_released(self, model_name: str):
+        with self._lock:
+            self._last_used_at[model_name] = time.time()
+
+    # --- History persistence ---
+
+    def _load_history(self):
+        if not os.path.exists(self.history_path):
+            return
+        try:
+            with open(self.history_path, 'r') as f:
+                history = json.load(f)
+            self._transitions = history.get("transitions", {})
+            self._hourly_dates = history.get("hourly_dates", {})
+        except (OSError, ValueError) as e:
+            print(f"[RESIDENCY] Could not read usage history at '{self.history_path}': {e}")
+
+    def _save_history(self):
+        with self._lock:
+            if not self._history_dirty:
+                return
+            history = {"transitions": self._transitions, "hourly_dates": self._hourly_dates}
+            self._history_dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.history_path), exist_ok=True)
+            tmp_path = f"{self.history_path}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(history, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.history_path)
+        except OSError as e:
+            print(f"[RESIDENCY] Could not persist usage history: {e}")
+
+    # --- Decisions ---
+
+    def _loaded_model_names(self) -> List[str]:
+        return [name for name in self.model_definitions if name in self.models]
+
+    def _record_decision(self, action: str, model_name: str, reason: str, outcome: str, started_at: float):
+        decision = {
+            "at": time.time(),
+            "action": action,
+            "model": model_name,
+            "reason": reason,
+            "outcome": outcome,
+            "duration_seconds": round(time.perf_counter() - started_at, 3)
+        }
+        self._decisions.append(decision)
+        print(f"[RESIDENCY] {action} '{model_name}' ({reason}): {outcome}.")
+
+    def _unload_idle_models(self):
+        if self.idle_ttl_seconds <= 0:
+            return
+        leases = self.models["model_leases"]
+        # Models the history expects to be needed are kept, otherwise they would be unloaded and preloaded again
+        predicted = {p["model"] for p in self.predict_models(include_loaded=True)}
+        now = time.time()
+        for model_name in self._loaded_model_names():
+            if model_name in predicted:
+                continue
+            with self._lock:
+                last_used_at = self._last_used_at.setdefault(model_name, now) # Loaded but never seen: start its clock now
+            idle_seconds = now - last_used_at
+            if idle_seconds < self.idle_ttl_seconds:
+                continue
+            started_at = time.perf_counter()
+            reason = f"idle for {idle_seconds:.0f}s (ttl {self.idle_ttl_seconds:.0f}s)"
+            with leases.exclusive(model_name, timeout=0) as is_idle:
+                if not is_idle:
+                    continue # Leased right now, so it is not idle after all
+                self.models.pop(model_name, None)
+                self.models.get("inference_sessions", {}).pop(model_name, None)
+            if "buffer_pool" in self.models:
+                self.models["buffer_pool"].clear()
+            device = self.models.get("device")
+            if device is not None and device.type == 'cuda':
+                torch.cuda.empty_cache()
+            self._record_decision("unload", model_name, reason, "unloaded", started_at)
+
+    def predict_models(self, include_loaded: bool = False) -> List[Dict[str, Any]]:
+        """Returns the (not yet loaded) models the usage history predicts, most likely first."""
+        now = time.time()
+        hour = str(datetime.fromtimestamp(now).hour)
+        loaded = set(self._loaded_model_names())
+        predictions = {}
+        with self._lock:
+            # Models that usually follow the most recently used one
+            if self._last_model and now - self._last_model_at <= self.transition_window_seconds:
+                successors = self._transitions.get(self._last_model, {})
+                total = sum(successors.values())
+                if total >= self.min_observations:
+                    for model_name, count in successors.items():
+                        probability = count / total
+                        if probability >= self.transition_threshold:
+                            predictions[model_name] = {"model": model_name, "score": probability, "reason": f"transition from '{self._last_model}' (p={probability:.2f})"}
+            # Models that are usually used at this hour of the day
+            observed_days = {day for per_hour in self._hourly_dates.values() for dates in per_hour.values() for day in dates}
+            if len(observed_days) >= self.min_observations:
+                for model_name, per_hour in self._hourly_dates.items():
+                    share = len(per_hour.get(hour, [])) / len(observed_days)
+                    if share >= self.hourly_threshold and share > predictions.get(model_name, {}).get("score", 0):
+                        predictions[model_name] = {"model": model_name, "score": share, "reason": f"time_of_day (used at {hour}h on {share:.0%} of days)"}
+        candidates = [p for p in predictions.values() if p["model"] in self.model_definitions and (include_loaded or p["model"] not in loaded)]
+        return sorted(candidates, key=lambda p: p["score"], reverse=True)
+
+    def _preload_predicted_models(self):
+        if not self.enable_preload:
+            return
+        from app.api.dependencies import get_model_by_name # Imported here to avoid a circular import
+        for prediction in self.predict_models()[:self.max_preloads_per_cycle]:
+            model_name = prediction["model"]
+            started_at = time.perf_counter()
+            try:
+                # The lease keeps the fresh model from being unloaded while it loads
+                with self.models["model_leases"].acquire(model_name, track_usage=False):
+                    get_model_by_name(model_name=model_name, models=self.models)
+                self._record_decision("preload", model_name, prediction["reason"], "loaded", started_at)
+            except Exception as e:
+                self._record_decision("preload", model_name, prediction["reason"], f"failed: {getattr(e, 'detail', e)}", started_at)
+
+    def run_cycle(self):
+        """One residency pass: unload idle models, then preload predicted ones. Blocking."""
+        self._unload_idle_models()
+        self._preload_predicted_models()
+        self._save_history()
+
+    def status(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            idle_seconds = {name: round(now - at, 1) for name, at in self._last_used_at.items()}
+            decisions = list(self._decisions)
+        return {
+            "idle_ttl_seconds": self.idle_ttl_seconds,
+            "predictive_preload": self.enable_preload,
+            "idle_seconds": idle_seconds,
+            "predicted": [p["model"] for p in self.predict_models(include_loaded=True)],
+            "recent_decisions": decisions
+        }
@@ -0,0 +1,179 @@
+# backend/app/engine/result_cache.py
+import os
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# Bump whenever a change to the engine alters the pixels it produces, so results computed by
+# an older engine are never served for new submissions
+ENGINE_VERSION = "1"
+
+# Settings that change the output of a model; they are part of every result key
+OUTPUT_AFFECTING_SETTINGS = (
+    "TILE_OVERLAP", "EDGE_TILE_MIN_SIZE", "INFERENCE_BATCH_SIZE", "AUTOTUNE_SMALL_MAX_SIDE",
+    "GUIDED_MAX_SIDE", "GUIDED_FILTER_RADIUS", "GUIDED_FILTER_EPS", "INFERENCE_PRECISION",
+    "ENABLE_FLAT_TILE_SKIP", "FLAT_TILE_THRESHOLD", "FLAT_TILE_METRIC", "FLAT_TILE_FILTER"
+)
+
+
+def result_key(
+    input_hash: str,
+    model_name: str,
+    model_definition: Dict[str, Any],
+    params: Dict[str, Any],
+    execution_configs: Optional[Dict[str, Any]] = None
+) -> str:
+    """
+    Content address of a result: SHA-256 over the input's content hash, the model (its registry
+    spec, including the execution block, and the size / modification time of its weights file),
+    the request parameters that shape the output ('params', e.g. task type, processing mode,
+    ROI), the model's tuned execution configs (tile size, batch size and attention backend per
+    size class), the output-affecting settings and ENGINE_VERSION.
+    """
+    weights_path = model_definition.get("path")
+    try:
+        weights_stat = os.stat(weights_path)
+        weights_id = [weights_stat.st_size, int(weights_stat.st_mtime)]
+    except (OSError, TypeError):
+        weights_id = None
+    fingerprint = {
+        "engine_version": ENGINE_VERSION,
+        "input": input_hash,
+        "model": model_name,
+        "spec": model_definition.get("spec"),
+        "weights": weights_id,
+        "params": params,
+        "execution": execution_configs,
+        "settings": {name: os.getenv(name) for name in OUTPUT_AFFECTING_SETTINGS}
+    }
+    return hashlib.sha256(json.dumps(fingerprint, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def link_result_file(source_path: str, destination_path: str):
+    """Hard-links a result file to a new path (copies it where links are not supported). Raises OSError."""
+    os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+    try:
+        os.link(source_path, destination_path)
+    except OSError:
+        if not os.path.exists(source_path):
+            raise
+        shutil.copyfile(source_path, destination_path) # Filesystem without hard links
+
+
+def register_result_file(task_id: str, result_filepath: str, file_type: str, models: Dict[str, Any]) -> str:
+    """Adds a result file under temp/ to the cache tracker for 'task_id' and returns its /static_results path."""
+    relative_path = os.path.relpath(result_filepath, "temp").replace("\\", "/")
+    full_result_path = f"/static_results/{relative_path}"
+    current_timestamp = time.time()
+    models.get("tracker_by_path", {})[full_result_path] = {
+        "status": "active",
+        "task_id": task_id,
+        "file_type": file_type,
+        "created_at": current_timestamp,
+        "downloaded_at": None,
+        "last_heartbeat_at": current_timestamp
+    }
+    models.get("path_by_task_id", {})[task_id] = full_result_path
+    return full_result_path
+
+
+class ResultCache:
+    """
+    Content-addressed index of finished results: result key -> result file on disk. A repeated
+    submission (retry, or another user with the same asset and settings) gets a hard link to
+    the existing file (a copy where links are not supported) under its own task, which is
+    registered with the cache tracker like any other result, so heartbeats, download
+    confirmation and cleanup apply to each task's file independently. Entries whose file was
+    cleaned up are dropped when looked up. At most RESULT_CACHE_MAX_ENTRIES keys are kept (LRU).
+    """
+    def __init__(self, max_entries: int = None):
+        self.enabled = os.getenv("ENABLE_RESULT_CACHE", "True").lower() == "true"
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv("RESULT_CACHE_MAX_ENTRIES", 4096))
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[str, str]" = OrderedDict()
+        self._metrics = {"hits": 0, "misses": 0, "stale": 0, "bypassed": 0, "stores": 0}
+
+    def materialize(self, key: str, destination_path: str) -> bool:
+        """
+        On a hit, links (or copies) the cached result to 'destination_path' and returns True.
+        The new file becomes the entry's result, since it is the one most recently handed out.
+        """
+        with self._lock:
+            source_path = self._entries.get(key)
+        if source_path is not None:
+            try:
+                link_result_file(source_path, destination_path)
+                with self._lock:
+                    self._entries[key] = destination_path
+                    self._entries.move_to_end(key)
+                    self._metrics["hits"] += 1
+                return True
+            except OSError:
+                # The result was cleaned up since it was cached
+                with self._lock:
+                    if self._entries.get(key) == source_path:
+                        del self._entries[key]
+                    self._metrics["stale"] += 1
+        with self._lock:
+            self._metrics["misses"] += 1
+        return False
+
+    def put(self, key: str, result_filepath: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = result_filepath
+            self._entries.move_to_end(key)
+            self._metrics["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record_bypass(self):
+        with self._lock:
+            self._metrics["bypassed"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            lookups = metrics["hits"] + metrics["misses"]
+            metrics["hit_rate"] = round(metrics["hits"] / lookups, 4) if lookups else 0.0
+            metrics["entries"] = len(self._entries)
+            metrics["max_entries"] = self.max_entries
+            metrics["enabled"] = self.enabled
+            return metrics
+
+
+def complete_from_result_cache(
+    key: str,
+    task_id: str,
+    result_filepath: str,
+    file_type: str,
+    models: Dict[str, Any],
+    bypass_cache: bool = False
+) -> Optional[str]:
+    """
+    Completes 'task_id' immediately if the result of 'key' is cached: materializes it at
+    'result_filepath' (under temp/), registers it with the cache tracker and marks the task
+    completed. Returns its /static_results path, or None on a miss, when the result cache is
+    disabled or when the client asked to bypass it.
+    """
+    result_cache = models["result_cache"]
+    if not result_cache.enabled:
+        return None
+    if bypass_cache:
+        result_cache.record_bypass()
+        return None
+    if not result_cache.materialize(key, result_filepath):
+        return None
+    full_result_path = register_result_file(task_id, result_filepath, file_type, models)
+    models["tasks_db"][task_id] = {"status": "completed", "result_path": full_result_path, "cached": True, "message": "Result served from the result cache."}
+    print(f"[RESULT_CACHE] Task '{task_id}' served from cache at '{full_result_path}'.")
+    return full_result_path
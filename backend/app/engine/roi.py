@@ -0,0 +1,72 @@
+# backend/app/engine/roi.py
+import io
+import json
+import numpy as np
+from PIL import Image
+from typing import List, Tuple, Optional
+
+# What the pixels outside the region of interest become
+ROI_BACKGROUNDS = ("passthrough", "resize")
+
+Rectangle = Tuple[int, int, int, int]
+
+
+def parse_roi_rectangles(roi: str) -> List[Rectangle]:
+    """
+    Parses the 'roi' request field: a JSON list of [x, y, width, height] rectangles in pixels
+    of the input image (or video frame), e.g. "[[10, 20, 300, 200]]". Raises ValueError.
+    """
+    try:
+        rectangles = json.loads(roi)
+    except ValueError as e:
+        raise ValueError(f"'roi' must be a JSON list of [x, y, width, height] rectangles: {e}")
+    if isinstance(rectangles, list) and len(rectangles) == 4 and all(isinstance(v, (int, float)) for v in rectangles):
+        rectangles = [rectangles] # A single rectangle
+    if not isinstance(rectangles, list) or not rectangles:
+        raise ValueError("'roi' must be a non-empty JSON list of [x, y, width, height] rectangles.")
+    parsed = []
+    for rectangle in rectangles:
+        if not isinstance(rectangle, list) or len(rectangle) != 4 or not all(isinstance(v, (int, float)) for v in rectangle):
+            raise ValueError(f"Invalid ROI rectangle {rectangle!r}, expected [x, y, width, height].")
+        x, y, width, height = (int(round(v)) for v in rectangle)
+        if width <= 0 or height <= 0:
+            raise ValueError(f"Invalid ROI rectangle {rectangle!r}, width and height must be positive.")
+        parsed.append((x, y, width, height))
+    return parsed
+
+
+def decode_roi_mask(mask_bytes: bytes) -> np.ndarray:
+    """Decodes an uploaded mask image into a bool (H, W) array; non-black pixels are in the ROI."""
+    try:
+        return np.array(Image.open(io.BytesIO(mask_bytes)).convert("L")) > 127
+    except Exception as e:
+        raise ValueError(f"Could not decode the ROI mask image: {e}")
+
+
+def build_roi_mask(height: int, width: int, rectangles: Optional[List[Rectangle]] = None, mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Combines ROI rectangles (clipped to the frame) and a mask image (resized to the frame with
+    nearest-neighbour sampling if needed) into one bool (height, width) mask.
+    """
+    roi_mask = np.zeros((height, width), dtype=bool)
+    for x, y, rect_w, rect_h in rectangles or []:
+        roi_mask[max(0, y):max(0, y + rect_h), max(0, x):max(0, x + rect_w)] = True
+    if mask is not None:
+        if mask.shape != (height, width):
+            mask = np.array(Image.fromarray(mask).resize((width, height), Image.Resampling.NEAREST))
+        roi_mask |= mask
+    return roi_mask
+
+
+def select_roi_tiles(roi_mask: np.ndarray, coords: List[Tuple[int, int]], tile_size: int) -> List[Tuple[int, int]]:
+    """Keeps the tiles (top-left corners) that contain at least one ROI pixel, using a summed-area table."""
+    height, width = roi_mask.shape
+    area = np.zeros((height + 1, width + 1), dtype=np.int64)
+    area[1:, 1:] = roi_mask.cumsum(0).cumsum(1)
+    selected = []
+    for y, x in coords:
+        y0, x0 = min(y, height), min(x, width)
+        y1, x1 = min(y + tile_size, height), min(x + tile_size, width)
+        if area[y1, x1] - area[y0, x1] - area[y1, x0] + area[y0, x0] > 0:
+            selected.append((y, x))
+    return selected
@@ -0,0 +1,431 @@
+# backend/app/engine/session.py
+import os
+import cv2
+import tempfile
+import torch
+import numpy as np
+from contextlib import nullcontext
+from typing import Dict, Any, Optional, Callable, Tuple
+
+from uformer_model.model import attention_backend
+from app.engine.tiling import plan_tiles, pad_to_size, blend_window, tile_pixel_index, extract_tiles, accumulate_tiles
+from app.engine.lanes import get_current_lane
+from app.engine.guided_upsampling import guided_upsample
+from app.engine.roi import ROI_BACKGROUNDS, select_roi_tiles
+from app.engine.flat_tiles import FLAT_TILE_METRICS, FLAT_TILE_FILTERS, split_flat_tiles, batch_activity, flat_tile_fill
+
+# Input size of the non-patch "resize" pipeline (the models' training resolution)
+RESIZE_INPUT_SIZE = 256
+
+# Rows of the streaming accumulator finalized (divided, quantized, written out) per step
+STREAMING_FLUSH_ROWS = 256
+
+# Pipelines InferenceSession.enhance() can run, from highest quality to fastest
+PROCESSING_MODES = ("patch", "guided", "resize")
+
+PRECISION_DTYPES = {"fp32": None, "fp16": torch.float16, "bf16": torch.bfloat16}
+
+
+class InferenceSession:
+    """
+    The single inference entry point for one loaded model. Takes uint8 RGB HWC frames and
+    returns uint8 RGB HWC frames of the same size, and owns everything in between: tiling,
+    batching, padding, precision, the CPU threading gate and inference mode.
+    The image, video and live stream endpoints all go through this object.
+    """
+    def __init__(
+        self,
+        model_key: str,
+        model: torch.nn.Module,
+        models: Dict[str, Any],
+        precision: Optional[str] = None,
+        execution_defaults: Optional[Dict[str, Any]] = None
+    ):
+        self.model_key = model_key
+        self.model = model
+        self.models = models # Shared state: device, autotuner, buffer pool and the current inference gate
+        self.execution_defaults = execution_defaults # Registry defaults used until the autotuner has an entry
+        self.device = models["device"]
+        # Pixels neighbouring tiles share; the shared band is cross-faded to hide seams
+        self.tile_overlap = max(0, int(os.getenv("TILE_OVERLAP", 0)))
+        # Smallest tile used to cover the bottom/right bands (tile_size = only shift full tiles inside)
+        self.min_edge_tile_size = int(os.getenv("EDGE_TILE_MIN_SIZE", 128))
+        # "guided" mode: longest side of the reduced frame the model runs on, and the guided filter's
+        # window radius (in reduced-frame pixels) and regularization
+        self.guided_max_side = max(128, int(os.getenv("GUIDED_MAX_SIDE", 512)))
+        self.guided_radius = max(1, int(os.getenv("GUIDED_FILTER_RADIUS", 2)))
+        self.guided_eps = float(os.getenv("GUIDED_FILTER_EPS", 1e-5))
+        # Operator override for the number of tiles per forward (otherwise tuned / registry default)
+        self.batch_size_override = int(os.getenv("INFERENCE_BATCH_SIZE", 0)) or None
+        self.precision = (precision or os.getenv("INFERENCE_PRECISION", "fp32")).lower()
+        if self.precision not in PRECISION_DTYPES:
+            raise ValueError(f"Unsupported INFERENCE_PRECISION '{self.precision}'. Use one of {list(PRECISION_DTYPES)}.")
+        # Flat-tile skipping (tiled modes only): tiles whose activity is below the threshold (0-255
+        # luma units, 0 = off) get the input, or a 3x3 box filter of it, instead of the model
+        flat_tile_skip = os.getenv("ENABLE_FLAT_TILE_SKIP", "False").lower() == "true"
+        self.flat_tile_threshold = float(os.getenv("FLAT_TILE_THRESHOLD", 2.0)) if flat_tile_skip else 0.0
+        self.flat_tile_metric = os.getenv("FLAT_TILE_METRIC", "std")
+        self.flat_tile_filter = os.getenv("FLAT_TILE_FILTER", "passthrough")
+        if self.flat_tile_metric not in FLAT_TILE_METRICS or self.flat_tile_filter not in FLAT_TILE_FILTERS:
+            raise ValueError(f"Unsupported FLAT_TILE_METRIC / FLAT_TILE_FILTER. Use one of {list(FLAT_TILE_METRICS)} / {list(FLAT_TILE_FILTERS)}.")
+
+    def _autocast(self):
+        dtype = PRECISION_DTYPES[self.precision]
+        if dtype is None:
+            return nullcontext()
+        return torch.autocast(device_type=self.device.type, dtype=dtype)
+
+    def _forward(self, batch_tensor: torch.Tensor, backend: str) -> torch.Tensor:
+        """
+        Runs one NCHW float batch through the model with the given attention backend (selected
+        for this call only; the model is shared with concurrent jobs) and returns a clamped
+        float32 result.
+        """
+        with self._autocast(), attention_backend(backend):
+            restored = self.model(batch_tensor)
+        return restored.float().clamp(0.0, 1.0)
+
+    def _apply_execution_config(self, height: int, width: int) -> Dict[str, Any]:
+        execution_config = self.models["autotuner"].get_config(
+            self.model_key, self.model, self.device, height, width, defaults=self.execution_defaults
+        )
+        if self.batch_size_override:
+            execution_config["batch_size"] = self.batch_size_override
+        return execution_config
+
+    def _to_model_input(self, frame: np.ndarray, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+        """
+        uint8 HWC array -> contiguous float CHW tensor in [0, 1] on the model's device, written
+        into 'out' (a (3, H, W) float buffer) when given. Only uint8 is transferred.
+        """
+        uint8_frame = torch.from_numpy(frame).to(self.device).permute(2, 0, 1)
+        if out is None:
+            return uint8_frame.contiguous().float().div_(255.0)
+        return out.copy_(uint8_frame).div_(255.0)
+
+    @staticmethod
+    def _to_uint8_frame(restored: torch.Tensor) -> np.ndarray:
+        """
+        Float CHW tensor -> uint8 HWC array. Clamped and quantized in place on the device, so
+        only uint8 is transferred back; the returned array is freshly allocated and owned by the caller.
+        """
+        quantized = restored.clamp_(0.0, 1.0).mul_(255.0).round_().permute(1, 2, 0)
+        frame = torch.empty(quantized.shape, dtype=torch.uint8, device=restored.device)
+        return frame.copy_(quantized).cpu().numpy()
+
+    def _run_tiled(
+        self,
+        frame: np.ndarray,
+        progress_callback: Optional[Callable[[int, int], None]],
+        finish: Callable[[torch.Tensor], Any],
+        roi_mask: Optional[np.ndarray] = None,
+        tile_stats: Optional[Dict[str, int]] = None
+    ) -> Any:
+        """
+        Tiled full-resolution inference of a uint8 frame. The restored float CHW tensor lives
+        in a pooled buffer, so it is only valid inside finish(restored), whose result is returned.
+        With a bool 'roi_mask', only tiles containing ROI pixels are run; pixels no tile covers
+        are left undefined for finish() to replace. With flat-tile skipping on, a vectorized
+        pre-pass routes low-activity tiles around the model; 'tile_stats' accumulates the
+        number of tiles and of flat tiles.
+        """
+        original_h, original_w, _ = frame.shape
+        execution_config = self._apply_execution_config(original_h, original_w)
+        batch_size = execution_config["batch_size"]
+        buffer_pool = self.models["buffer_pool"]
+
+        # Tiles are gathered from and scattered back into CHW tensors on the model's device,
+        # one same-sized batch at a time, with overlapping tiles cross-faded by the blend window.
+        # Edge tiles are shifted inside or shrunk, so only images smaller than a tile get padded.
+        # Frame-sized and tile-batch buffers come from the shared pool and are reused by later frames.
+        padded_h, padded_w, tile_groups = plan_tiles(
+            original_h, original_w, execution_config["tile_size"], self.tile_overlap, self.min_edge_tile_size
+        )
+        if roi_mask is not None:
+            tile_groups = {size: select_roi_tiles(roi_mask, coords, size) for size, coords in tile_groups.items()}
+            tile_groups = {size: coords for size, coords in tile_groups.items() if coords}
+        borrowed = []
+        def borrow(shape, dtype=torch.float32) -> torch.Tensor:
+            borrowed.append(buffer_pool.acquire(shape, dtype, self.device))
+            return borrowed[-1]
+
+        try:
+            padded_input = self._to_model_input(frame, out=borrow((3, original_h, original_w)))
+            if (padded_h, padded_w) != (original_h, original_w):
+                padded_input = pad_to_size(padded_input, padded_h, padded_w)
+            output = borrow((3, padded_h, padded_w)).zero_()
+            weights = borrow((padded_h, padded_w)).zero_()
+            flat_groups = {}
+            if self.flat_tile_threshold > 0:
+                tile_groups, flat_groups = split_flat_tiles(padded_input, tile_groups, self.flat_tile_threshold, self.flat_tile_metric)
+            num_flat_tiles = sum(len(coords) for coords in flat_groups.values())
+            num_tiles = sum(len(coords) for coords in tile_groups.values()) + num_flat_tiles
+            if tile_stats is not None:
+                tile_stats["tiles"] = tile_stats.get("tiles", 0) + num_tiles
+                tile_stats["flat_tiles"] = tile_stats.get("flat_tiles", 0) + num_flat_tiles
+            flat_source = flat_tile_fill(padded_input, self.flat_tile_filter) if flat_groups else None
+            done_tiles = 0
+
+            # Model tiles first, then flat tiles, which are blended in the same way without a forward
+            work = [(size, coords, True) for size, coords in tile_groups.items()] + [(size, coords, False) for size, coords in flat_groups.items()]
+            for tile_size, tile_coords, run_model in work:
+                window = blend_window(tile_size, min(self.tile_overlap, tile_size // 2), self.device)
+                for start in range(0, len(tile_coords), batch_size):
+                    batch_coords = tile_coords[start:start + batch_size]
+                    batch_shape = (len(batch_coords), tile_size, tile_size)
+                    index = tile_pixel_index(batch_coords, tile_size, padded_w, self.device, out=borrow(batch_shape, torch.int64))
+                    # The gathered batch is no longer needed once the model has run, so it doubles as scratch
+                    batch_buffer = borrow((3, len(batch_coords) * tile_size * tile_size))
+                    if run_model:
+                        restored_batch = self._forward(extract_tiles(padded_input, batch_coords, tile_size, index=index, out=batch_buffer), execution_config["attention_backend"])
+                    else:
+                        restored_batch = extract_tiles(flat_source, batch_coords, tile_size, index=index, out=batch_buffer)
+                    accumulate_tiles(output, weights, restored_batch, batch_coords, window, index=index, scratch=batch_buffer)
+                    buffer_pool.release(borrowed.pop())
+                    buffer_pool.release(borrowed.pop())
+                    done_tiles += len(batch_coords)
+                    if progress_callback:
+                        progress_callback(done_tiles, num_tiles)
+
+            restored = output[:, :original_h, :original_w].div_(weights[:original_h, :original_w])
+            return finish(restored)
+        finally:
+            for buffer in borrowed:
+                buffer_pool.release(buffer)
+
+    def _enhance_patches(
+        self,
+        frame: np.ndarray,
+        progress_callback: Optional[Callable[[int, int], None]],
+        tile_stats: Optional[Dict[str, int]] = None
+    ) -> np.ndarray:
+        return self._run_tiled(frame, progress_callback, self._to_uint8_frame, tile_stats=tile_stats)
+
+    def _enhance_roi(
+        self,
+        frame: np.ndarray,
+        roi_mask: np.ndarray,
+        roi_background: str,
+        progress_callback: Optional[Callable[[int, int], None]],
+        tile_stats: Optional[Dict[str, int]] = None
+    ) -> np.ndarray:
+        original_h, original_w, _ = frame.shape
+        if roi_mask.shape != (original_h, original_w):
+            raise ValueError(f"ROI mask shape {roi_mask.shape} does not match the frame ({original_h}, {original_w}).")
+        # Pixels outside the ROI come from the input itself or from the cheap resize pipeline
+        background_frame = self._enhance_resized(frame, None) if roi_background == "resize" else frame
+        if not roi_mask.any():
+            return background_frame.copy() if background_frame is frame else background_frame
+        buffer_pool = self.models["buffer_pool"]
+        roi = torch.from_numpy(np.ascontiguousarray(roi_mask)).to(self.device)
+
+        def composite(restored: torch.Tensor) -> np.ndarray:
+            with buffer_pool.borrow((3, original_h, original_w), device=self.device) as background:
+                background = self._to_model_input(background_frame, out=background)
+                return self._to_uint8_frame(torch.where(roi, restored, background, out=background))
+
+        return self._run_tiled(frame, progress_callback, composite, roi_mask=roi_mask, tile_stats=tile_stats)
+
+    def _enhance_resized(
+        self,
+        frame: np.ndarray,
+        progress_callback: Optional[Callable[[int, int], None]],
+        output_size: Optional[Tuple[int, int]] = None
+    ) -> np.ndarray:
+        original_h, original_w, _ = frame.shape
+        if output_size:
+            original_w, original_h = output_size
+        execution_config = self._apply_execution_config(RESIZE_INPUT_SIZE, RESIZE_INPUT_SIZE)
+        # Resampling stays in uint8; cv2 saturates Lanczos overshoot instead of wrapping
+        resized_input = cv2.resize(frame, (RESIZE_INPUT_SIZE, RESIZE_INPUT_SIZE), interpolation=cv2.INTER_LANCZOS4)
+        restored = self._forward(self._to_model_input(resized_input).unsqueeze(0), execution_config["attention_backend"]).squeeze(0)
+        if progress_callback:
+            progress_callback(1, 1)
+        return cv2.resize(self._to_uint8_frame(restored), (original_w, original_h), interpolation=cv2.INTER_LANCZOS4)
+
+    def _enhance_guided(
+        self,
+        frame: np.ndarray,
+        progress_callback: Optional[Callable[[int, int], None]],
+        tile_stats: Optional[Dict[str, int]] = None
+    ) -> np.ndarray:
+        original_h, original_w, _ = frame.shape
+        scale = self.guided_max_side / max(original_h, original_w)
+        if scale >= 1.0:
+            return self._enhance_patches(frame, progress_callback, tile_stats) # Already small enough to run at full resolution
+        low_w, low_h = max(1, round(original_w * scale)), max(1, round(original_h * scale))
+        # INTER_AREA averages the dropped pixels, so the model sees a clean (and less noisy) low-res frame
+        low_frame = cv2.resize(frame, (low_w, low_h), interpolation=cv2.INTER_AREA)
+        buffer_pool = self.models["buffer_pool"]
+
+        def transfer_residual(restored_low: torch.Tensor) -> np.ndarray:
+            # The model's correction (restored - input) is carried to full resolution by a guided
+            # filter fitted against the input, so it follows the full-resolution edges
+            with buffer_pool.borrow((3, low_h, low_w), device=self.device) as input_low, \
+                 buffer_pool.borrow((3, original_h, original_w), device=self.device) as full_input:
+                input_low = self._to_model_input(low_frame, out=input_low)
+                full_input = self._to_model_input(frame, out=full_input)
+                residual_low = (restored_low - input_low).unsqueeze(0)
+                residual = guided_upsample(
+                    input_low.unsqueeze(0), residual_low, full_input.unsqueeze(0), self.guided_radius, self.guided_eps
+                ).squeeze(0)
+                return self._to_uint8_frame(residual.add_(full_input))
+
+        return self._run_tiled(low_frame, progress_callback, transfer_residual, tile_stats=tile_stats)
+
+    def _flush_streamed_rows(self, accumulator: torch.Tensor, weights: torch.Tensor, output: np.ndarray, start: int, end: int):
+        """Divides accumulated rows [start, end) by their weights and writes them to 'output' as uint8."""
+        for row in range(start, end, STREAMING_FLUSH_ROWS):
+            rows = slice(row, min(row + STREAMING_FLUSH_ROWS, end))
+            restored = accumulator[:, rows].div(weights[rows])
+            output[rows] = self._to_uint8_frame(restored)
+
+    def _enhance_streaming(
+        self,
+        source: np.ndarray,
+        output: np.ndarray,
+        progress_callback: Optional[Callable[[int, int], None]],
+        scratch_dir: Optional[str],
+        tile_stats: Optional[Dict[str, int]] = None
+    ):
+        height, width, _ = source.shape
+        execution_config = self._apply_execution_config(height, width)
+        batch_size = execution_config["batch_size"]
+        padded_h, padded_w, tile_groups = plan_tiles(height, width, execution_config["tile_size"], self.tile_overlap, self.min_edge_tile_size)
+        if (padded_h, padded_w) != (height, width):
+            raise ValueError(f"Streaming needs an image of at least one tile, got {height}x{width}.")
+
+        # Tiles run in row-major order, so every row above the next tile's top edge is final
+        # and can be written out. Consecutive tiles of the same size share a batch.
+        schedule = sorted((y, x, size) for size, coords in tile_groups.items() for y, x in coords)
+        batches = []
+        for y, x, size in schedule:
+            if batches and batches[-1][0] == size and len(batches[-1][1]) < batch_size:
+                batches[-1][1].append((y, x))
+            else:
+                batches.append((size, [(y, x)]))
+        windows = {size: blend_window(size, min(self.tile_overlap, size // 2), self.device) for size in tile_groups}
+        buffer_pool = self.models["buffer_pool"]
+        done_tiles, flushed_rows = 0, 0
+
+        # The float accumulators are file-backed: the OS pages them out as needed, so resident
+        # memory is bounded by the tile batch rather than by the image
+        with tempfile.TemporaryDirectory(prefix="uformer_stream_", dir=scratch_dir) as scratch:
+            accumulator = torch.from_numpy(np.memmap(os.path.join(scratch, "accumulator.f32"), dtype=np.float32, mode="w+", shape=(3, height, width)))
+            weights = torch.from_numpy(np.memmap(os.path.join(scratch, "weights.f32"), dtype=np.float32, mode="w+", shape=(height, width)))
+            for index, (tile_size, batch_coords) in enumerate(batches):
+                with buffer_pool.borrow((len(batch_coords), 3, tile_size, tile_size), device=self.device) as batch:
+                    for i, (y, x) in enumerate(batch_coords):
+                        # Only this tile's rows of the source are read (and paged in)
+                        batch[i].copy_(torch.from_numpy(source[y:y + tile_size, x:x + tile_size]).permute(2, 0, 1))
+                    restored_batch = self._forward_skipping_flat_tiles(batch.div_(255.0), execution_config["attention_backend"], tile_stats).mul_(windows[tile_size]).cpu()
+                window = windows[tile_size].cpu()
+                for i, (y, x) in enumerate(batch_coords):
+                    accumulator[:, y:y + tile_size, x:x + tile_size].add_(restored_batch[i])
+                    weights[y:y + tile_size, x:x + tile_size].add_(window)
+                done_tiles += len(batch_coords)
+                if progress_callback:
+                    progress_callback(done_tiles, len(schedule))
+
+                final_rows = min(y for y, _ in batches[index + 1][1]) if index + 1 < len(batches) else height
+                if final_rows > flushed_rows:
+                    self._flush_streamed_rows(accumulator, weights, output, flushed_rows, final_rows)
+                    flushed_rows = final_rows
+        return output
+
+    def _forward_skipping_flat_tiles(self, batch: torch.Tensor, backend: str, tile_stats: Optional[Dict[str, int]] = None) -> torch.Tensor:
+        """
+        _forward() for the streaming path, whose tiles are only read batch by batch: flat tiles
+        are detected per batch and only the others run through the model.
+        """
+        if tile_stats is not None:
+            tile_stats["tiles"] = tile_stats.get("tiles", 0) + len(batch)
+            tile_stats.setdefault("flat_tiles", 0)
+        if self.flat_tile_threshold <= 0:
+            return self._forward(batch, backend)
+        is_flat = batch_activity(batch, self.flat_tile_metric) < self.flat_tile_threshold
+        if not is_flat.any():
+            return self._forward(batch, backend)
+        if tile_stats is not None:
+            tile_stats["flat_tiles"] += int(is_flat.sum())
+        restored = flat_tile_fill(batch, self.flat_tile_filter).clone()
+        model_tiles = (~is_flat).nonzero().squeeze(1)
+        if len(model_tiles):
+            restored[model_tiles] = self._forward(batch[model_tiles], backend)
+        return restored
+
+    def enhance(
+        self,
+        frame: np.ndarray,
+        use_patch_processing: bool = True,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        processing_mode: Optional[str] = None,
+        roi_mask: Optional[np.ndarray] = None,
+        roi_background: str = "passthrough",
+        output_size: Optional[Tuple[int, int]] = None,
+        tile_stats: Optional[Dict[str, int]] = None
+    ) -> np.ndarray:
+        """
+        Enhances one uint8 RGB HWC frame and returns a uint8 RGB HWC frame of the same size.
+        Normalization, clamping and rounding happen in torch next to the model, so only uint8
+        data crosses the host/device boundary.
+        processing_mode selects the pipeline (defaults to "patch" or "resize" following use_patch_processing):
+        - "patch": full-resolution tiled inference (high quality).
+        - "guided": tiled inference at a reduced, aspect-preserving size whose residual is
+          applied to the full-resolution frame by guided upsampling (fast, keeps detail).
+        - "resize": the 256x256 resize pipeline (fastest).
+        roi_mask (bool HxW, patch mode only) restricts inference to the tiles that contain ROI
+        pixels, so cost scales with the ROI; pixels outside it are copied from the input
+        (roi_background="passthrough") or taken from the resize pipeline ("resize").
+        output_size (width, height), resize mode only, is the size of the returned frame when
+        the input was decoded at reduced size (see app/engine/ingest.py); default: the input size.
+        progress_callback(done, total) is called as tiles complete.
+        With ENABLE_FLAT_TILE_SKIP, tiled modes route low-activity tiles (sky, walls, letterbox
+        bars) around the model; a 'tile_stats' dict accumulates "tiles" and "flat_tiles" counts.
+        """
+        if frame.dtype != np.uint8:
+            raise ValueError(f"InferenceSession.enhance expects a uint8 frame, got {frame.dtype}.")
+        processing_mode = processing_mode or ("patch" if use_patch_processing else "resize")
+        if processing_mode not in PROCESSING_MODES:
+            raise ValueError(f"Unsupported processing mode '{processing_mode}'. Use one of {PROCESSING_MODES}.")
+        if roi_mask is not None and processing_mode != "patch":
+            raise ValueError("Region-of-interest processing requires the 'patch' processing mode.")
+        if output_size is not None and processing_mode != "resize":
+            raise ValueError("output_size is only supported by the 'resize' processing mode.")
+        if roi_background not in ROI_BACKGROUNDS:
+            raise ValueError(f"Unsupported ROI background '{roi_background}'. Use one of {ROI_BACKGROUNDS}.")
+        # Hold an inference slot so concurrent jobs do not oversubscribe the CPU cores.
+        # Jobs in a core-pinned execution lane are already isolated and use the lane's threads.
+        lane = get_current_lane()
+        slot = lane.slot() if lane and lane.pinned else self.models["inference_gate"].slot()
+        with slot, torch.inference_mode():
+            if roi_mask is not None:
+                return self._enhance_roi(frame, roi_mask, roi_background, progress_callback, tile_stats)
+            if processing_mode == "patch":
+                return self._enhance_patches(frame, progress_callback, tile_stats)
+            if processing_mode == "guided":
+                return self._enhance_guided(frame, progress_callback, tile_stats)
+            return self._enhance_resized(frame, progress_callback, output_size)
+
+    def enhance_streaming(
+        self,
+        source: np.ndarray,
+        output: np.ndarray,
+        progress_callback: Optional[Callable[[int, int], None]] = None,
+        scratch_dir: Optional[str] = None,
+        tile_stats: Optional[Dict[str, int]] = None
+    ) -> np.ndarray:
+        """
+        Out-of-core patch processing for very large images. 'source' and 'output' are uint8 RGB
+        HWC arrays of the same shape, typically np.memmap files: tiles are read from 'source'
+        lazily, blended in file-backed float accumulators under 'scratch_dir' and written to
+        'output' band by band, so peak memory depends on the tile batch, not the image size.
+        The result matches enhance() in patch mode (up to float summation order where tiles
+        overlap). Returns 'output'. Flat-tile skipping and 'tile_stats' work as for enhance().
+        """
+        if source.dtype != np.uint8 or output.dtype != np.uint8 or source.shape != output.shape:
+            raise ValueError("enhance_streaming expects uint8 source and output arrays of the same shape.")
+        lane = get_current_lane()
+        slot = lane.slot() if lane and lane.pinned else self.models["inference_gate"].slot()
+        with slot, torch.inference_mode():
+            return self._enhance_streaming(source, output, progress_callback, scratch_dir, tile_stats)
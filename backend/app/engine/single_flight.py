@@ -0,0 +1,108 @@
+# backend/app/engine/single_flight.py
+import os
+import threading
+from typing import Dict, Any, Optional
+
+from app.engine.result_cache import link_result_file, register_result_file
+
+# Leader fields a coalesced task shows while the leader is still running
+MIRRORED_FIELDS = ("status", "progress", "message", "preview_result_path", "streaming", "raw_development")
+
+
+class SingleFlight:
+    """
+    Coalesces identical in-flight jobs (same result key, see build_result_key()). The first
+    submission becomes the leader and runs; identical submissions made while it runs join it
+    as followers with their own task_id instead of running the model again. While the leader
+    runs, a follower's status mirrors the leader's progress (see mirror_leader_status()); when
+    it finishes, every follower gets its own hard link of the result, registered with the
+    cache tracker under its own task_id, or the leader's error.
+    """
+    def __init__(self):
+        self.enabled = os.getenv("ENABLE_REQUEST_COALESCING", "True").lower() == "true"
+        self._lock = threading.Lock()
+        self._flights: Dict[str, Dict[str, Any]] = {}
+        self._metrics = {"leaders": 0, "coalesced": 0}
+
+    def join(self, key: str, task_id: str) -> Optional[str]:
+        """
+        Registers 'task_id' for 'key'. Returns the leader's task_id if an identical job is
+        already running ('task_id' is now its follower), or None if 'task_id' must run itself.
+        """
+        if not self.enabled:
+            return None
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is not None:
+                flight["followers"].append(task_id)
+                self._metrics["coalesced"] += 1
+                return flight["leader"]
+            self._flights[key] = {"leader": task_id, "followers": []}
+            self._metrics["leaders"] += 1
+            return None
+
+    def finish(
+        self,
+        key: str,
+        models: Dict[str, Any],
+        result_filepath: Optional[str] = None,
+        file_type: str = "image",
+        error: Optional[str] = None
+    ):
+        """
+        Ends the flight of 'key' and completes its followers with links to 'result_filepath',
+        or fails them with 'error' if the leader produced no result. Call once the leader's own
+        status is final; later identical submissions start (or hit the result cache) afresh.
+        """
+        with self._lock:
+            flight = self._flights.pop(key, None)
+        if flight is None:
+            return
+        tasks_db = models["tasks_db"]
+        leader_task_id = flight["leader"]
+        for follower_task_id in flight["followers"]:
+            follower_status = dict(tasks_db.get(follower_task_id, {}), coalesced_with=leader_task_id)
+            try:
+                if result_filepath is None:
+                    raise RuntimeError(error or "The task it was coalesced with failed.")
+                follower_filepath = _follower_filepath(result_filepath, leader_task_id, follower_task_id)
+                link_result_file(result_filepath, follower_filepath)
+                full_result_path = register_result_file(follower_task_id, follower_filepath, file_type, models)
+                follower_status.update({"status": "completed", "result_path": full_result_path, "progress": 100, "message": "Processing complete."})
+                print(f"[SINGLE_FLIGHT] Task '{follower_task_id}' completed with the result of '{leader_task_id}' at '{full_result_path}'.")
+            except Exception as e:
+                follower_status.update({"status": "failed", "error": str(e), "message": "The task it was coalesced with failed."})
+            tasks_db[follower_task_id] = follower_status
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._lock:
+            metrics = dict(self._metrics)
+            metrics["in_flight"] = len(self._flights)
+            metrics["waiting_followers"] = sum(len(flight["followers"]) for flight in self._flights.values())
+            metrics["enabled"] = self.enabled
+            return metrics
+
+
+def _follower_filepath(result_filepath: str, leader_task_id: str, follower_task_id: str) -> str:
+    """The follower's copy of the result, named like the leader's with the follower's task id."""
+    directory, filename = os.path.split(result_filepath)
+    for leader_id in (leader_task_id, leader_task_id[:8]):
+        if leader_id in filename:
+            return os.path.join(directory, filename.replace(leader_id, follower_task_id[:len(leader_id)], 1))
+    return os.path.join(directory, f"{follower_task_id[:8]}_{filename}")
+
+
+def mirror_leader_status(task: Dict[str, Any], tasks_db: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The status to report for a task: a follower that is not final yet shows its leader's
+    progress. A leader that just finished shows as still processing until finish() has
+    completed its followers.
+    """
+    leader_task_id = task.get("coalesced_with")
+    if not leader_task_id or task.get("status") in ("completed", "failed"):
+        return task
+    leader = tasks_db.get(leader_task_id, {})
+    mirrored = {field: leader[field] for field in MIRRORED_FIELDS if field in leader}
+    if mirrored.get("status") in ("completed", "failed"):
+        mirrored.update({"status": "processing", "progress": 100})
+    return {**task, **mirrored}
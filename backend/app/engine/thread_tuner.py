@@ -0,0 +1,197 @@
+# backend/app/engine/thread_tuner.py
+import os
+import json
+import time
+import platform
+import threading
+import torch
+from contextlib import contextmanager
+from typing import Dict, Any, List, Optional, Tuple
+
+# Persisted calibration results live next to debug_logs/ in the backend directory.
+DEFAULT_TUNING_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..', 'tuning'))
+
+
+class InferenceJobGate:
+    """
+    Limits how many inference jobs run torch forwards at the same time and applies the
+    per-job intra-op thread count in the calling worker thread. With concurrent_jobs=None
+    the gate is unbounded and only the thread count is applied.
+    """
+    def __init__(self, threads_per_job: int, concurrent_jobs: Optional[int] = None):
+        self.threads_per_job = threads_per_job
+        self.concurrent_jobs = concurrent_jobs
+        self._semaphore = threading.BoundedSemaphore(concurrent_jobs) if concurrent_jobs else None
+
+    @contextmanager
+    def slot(self):
+        """Holds one inference slot for the duration of the 'with' block."""
+        if self._semaphore:
+            self._semaphore.acquire()
+        try:
+            torch.set_num_threads(self.threads_per_job)
+            yield
+        finally:
+            if self._semaphore:
+                self._semaphore.release()
+
+
+def get_hardware_fingerprint() -> Dict[str, Any]:
+    """Identifies the hardware/software combination a calibration is valid for."""
+    try:
+        usable_cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        usable_cores = os.cpu_count() or 1
+    return {
+        "usable_cores": usable_cores,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "torch_version": torch.__version__,
+    }
+
+
+def get_candidate_configs(usable_cores: int, max_concurrent_jobs: int) -> List[Tuple[int, int]]:
+    """
+    Builds (threads_per_job, concurrent_jobs) pairs that never oversubscribe the cores:
+    powers of two plus an even split of the cores for every job count.
+    """
+    candidates = set()
+    for jobs in range(1, max_concurrent_jobs + 1):
+        even_split = usable_cores // jobs
+        if even_split >= 1:
+            candidates.add((even_split, jobs))
+        threads = 1
+        while threads * jobs <= usable_cores:
+            candidates.add((threads, jobs))
+            threads *= 2
+    return sorted(candidates, key=lambda c: (c[1], c[0]))
+
+
+def measure_throughput(model: torch.nn.Module, threads_per_job: int, concurrent_jobs: int, sample_size: int, iterations: int) -> float:
+    """
+    Runs 'concurrent_jobs' worker threads, each doing 'iterations' forwards with
+    'threads_per_job' intra-op threads, and returns the aggregate forwards per second.
+    """
+    start_barrier = threading.Barrier(concurrent_jobs + 1)
+    errors = []
+
+    def worker():
+        try:
+            torch.set_num_threads(threads_per_job)
+            sample = torch.rand(1, 3, sample_size, sample_size)
+            start_barrier.wait()
+            with torch.no_grad():
+                for _ in range(iterations):
+                    model(sample)
+        except Exception as e:
+            errors.append(e)
+
+    workers = [threading.Thread(target=worker, daemon=True) for _ in range(concurrent_jobs)]
+    for w in workers:
+        w.start()
+    start_barrier.wait()
+    start_time = time.perf_counter()
+    for w in workers:
+        w.join()
+    elapsed = time.perf_counter() - start_time
+    if errors:
+        raise errors[0]
+    return (concurrent_jobs * iterations) / elapsed
+
+
+def calibrate_threading(model: torch.nn.Module) -> Dict[str, Any]:
+    """
+    Measures throughput for every candidate (threads_per_job, concurrent_jobs) combination
+    on this machine and returns the best one along with all measurements.
+    """
+    fingerprint = get_hardware_fingerprint()
+    max_concurrent_jobs = max(1, int(os.getenv("THREAD_TUNER_MAX_CONCURRENT_JOBS", 4)))
+    sample_size = int(os.getenv("THREAD_TUNER_SAMPLE_SIZE", 128))
+    iterations = max(1, int(os.getenv("THREAD_TUNER_ITERATIONS", 2)))
+    original_threads = torch.get_num_threads()
+
+    measurements = []
+    try:
+        for threads_per_job, concurrent_jobs in get_candidate_configs(fingerprint["usable_cores"], max_concurrent_jobs):
+            throughput = measure_throughput(model, threads_per_job, concurrent_jobs, sample_size, iterations)
+            measurements.append({
+                "threads_per_job": threads_per_job,
+                "concurrent_jobs": concurrent_jobs,
+                "forwards_per_second": round(throughput, 3)
+            })
+            print(f"[THREAD_TUNER] threads_per_job={threads_per_job}, concurrent_jobs={concurrent_jobs}: {throughput:.3f} forwards/s")
+    finally:
+        torch.set_num_threads(original_threads)
+
+    best = max(measurements, key=lambda m: m["forwards_per_second"])
+    return {
+        "threads_per_job": best["threads_per_job"],
+        "concurrent_jobs": best["concurrent_jobs"],
+        "source": "calibrated",
+        "calibrated_at": time.time(),
+        "sample_size": sample_size,
+        "fingerprint": fingerprint,
+        "measurements": measurements
+    }
+
+
+def load_persisted_config(path: str) -> Optional[Dict[str, Any]]:
+    """Returns the persisted calibration if it exists and was made on identical hardware."""
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'r') as f:
+            config = json.load(f)
+    except (OSError, ValueError) as e:
+        print(f"[THREAD_TUNER] Could not read persisted config at '{path}': {e}")
+        return None
+    if config.get("fingerprint") != get_hardware_fingerprint():
+        print("[THREAD_TUNER] Persisted config was calibrated on different hardware, ignoring it.")
+        return None
+    return config
+
+
+def persist_config(config: Dict[str, Any], path: str):
+    """Writes the calibration to disk atomically."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(config, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def apply_thread_config(models: Dict[str, Any], config: Dict[str, Any]):
+    """Installs the chosen configuration as the process-wide inference job gate."""
+    torch.set_num_threads(config["threads_per_job"])
+    # Inter-op threads can only be set once, before any inter-op work has started.
+    try:
+        torch.set_num_interop_threads(max(1, config["concurrent_jobs"]))
+    except RuntimeError:
+        pass
+    models["thread_config"] = config
+    models["inference_gate"] = InferenceJobGate(config["threads_per_job"], config["concurrent_jobs"])
+    print(f"[THREAD_TUNER] Applied threads_per_job={config['threads_per_job']}, concurrent_jobs={config['concurrent_jobs']} ({config['source']}).")
+
+
+def tune_cpu_threading(models: Dict[str, Any], model: torch.nn.Module) -> Dict[str, Any]:
+    """
+    Startup entry point: reuses a persisted calibration for this hardware when available,
+    otherwise calibrates on 'model', persists the result and applies it.
+    """
+    tuning_path = os.getenv("THREAD_TUNER_CONFIG_PATH", os.path.join(DEFAULT_TUNING_DIR, "thread_config.json"))
+    force_recalibrate = os.getenv("THREAD_TUNER_RECALIBRATE", "False").lower() == "true"
+
+    config = None if force_recalibrate else load_persisted_config(tuning_path)
+    if config is not None:
+        config["source"] = "persisted"
+    else:
+        print("[THREAD_TUNER] Calibrating CPU threading, this may take a moment...")
+        config = calibrate_threading(model)
+        try:
+            persist_config(config, tuning_path)
+            print(f"[THREAD_TUNER] Persisted calibration to '{tuning_path}'.")
+        except OSError as e:
+            print(f"[THREAD_TUNER] Could not persist calibration: {e}")
+
+    apply_thread_config(models, config)
+    return config
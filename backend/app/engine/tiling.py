@@ -0,0 +1,163 @@
+# backend/app/engine/tiling.py
+import math
+import torch
+import torch.nn.functional as F
+from typing import Dict, List, Optional, Tuple
+
+
+# Uformer downsamples four times and attends in 8x8 windows, so tile sides must be multiples of 128.
+TILE_SIZE_MULTIPLE = 128
+
+
+def _legal_size_at_least(length: int, min_tile_size: int) -> int:
+    return max(min_tile_size, math.ceil(length / TILE_SIZE_MULTIPLE) * TILE_SIZE_MULTIPLE)
+
+
+def _axis_positions(length: int, tile_size: int, overlap: int) -> List[int]:
+    """Tile starts along one axis (length >= tile_size); the last tile is shifted back inside."""
+    stride = tile_size - overlap
+    positions = list(range(0, length - tile_size, stride))
+    positions.append(length - tile_size)
+    return positions
+
+
+def _split_axis(length: int, tile_size: int, overlap: int, min_tile_size: int) -> Tuple[List[int], int]:
+    """
+    Places full tiles along one axis and returns (positions, edge_size). If the remainder is
+    thin enough for a smaller legal tile, the full tiles stop short and edge_size > 0 is the
+    side of the square tiles that cover the band at the end; otherwise the last full tile is
+    shifted back inside and edge_size is 0.
+    """
+    stride = tile_size - overlap
+    full_tiles = max(1, (length - overlap) // stride)
+    remainder = length - (stride * (full_tiles - 1) + tile_size)
+    if remainder <= 0:
+        return [i * stride for i in range(full_tiles)], 0
+    edge_size = _legal_size_at_least(remainder + overlap, min_tile_size)
+    if edge_size >= tile_size:
+        return _axis_positions(length, tile_size, overlap), 0
+    return [i * stride for i in range(full_tiles)], edge_size
+
+
+def plan_tiles(height: int, width: int, tile_size: int, overlap: int = 0, min_tile_size: int = TILE_SIZE_MULTIPLE) -> Tuple[int, int, Dict[int, List[Tuple[int, int]]]]:
+    """
+    Lays out square tiles over a (height, width) image without padding it up to a multiple of
+    'tile_size'. Full tiles cover the interior; a thin band left at the bottom/right is covered
+    by smaller legal tiles (down to 'min_tile_size'), or by shifting the last full tile back
+    inside the image so it overlaps its neighbour. Only images smaller than 'min_tile_size'
+    are padded. Returns the padded (height, width) and the top-left (y, x) corners of the tiles
+    grouped by tile side, so each group can be batched.
+    """
+    min_tile_size = min(max(TILE_SIZE_MULTIPLE, min_tile_size), tile_size)
+    padded_h, padded_w = max(height, min_tile_size), max(width, min_tile_size)
+    # The main tile cannot be larger than the shorter side (rounded down to a legal size)
+    tile_size = max(min_tile_size, min(tile_size, min(padded_h, padded_w) // TILE_SIZE_MULTIPLE * TILE_SIZE_MULTIPLE))
+
+    groups: Dict[int, set] = {}
+    def add(size: int, ys: List[int], xs: List[int]):
+        groups.setdefault(size, set()).update((y, x) for y in ys for x in xs)
+
+    ys, edge_h = _split_axis(padded_h, tile_size, overlap, min_tile_size)
+    xs, edge_w = _split_axis(padded_w, tile_size, overlap, min_tile_size)
+    add(tile_size, ys, xs)
+    covered_h = ys[-1] + tile_size
+    covered_w = xs[-1] + tile_size
+    if edge_h: # Bottom band
+        edge_overlap = min(overlap, edge_h // 2)
+        add(edge_h, [padded_h - edge_h], _axis_positions(covered_w, edge_h, edge_overlap))
+    if edge_w: # Right band
+        edge_overlap = min(overlap, edge_w // 2)
+        add(edge_w, _axis_positions(covered_h, edge_w, edge_overlap), [padded_w - edge_w])
+    if edge_h and edge_w: # Corner, covered by one square tile of the larger band's size
+        corner = max(edge_h, edge_w)
+        add(corner, [padded_h - corner], [padded_w - corner])
+
+    return padded_h, padded_w, {size: sorted(coords) for size, coords in sorted(groups.items(), reverse=True)}
+
+
+def count_tiles(height: int, width: int, tile_size: int, overlap: int = 0, min_tile_size: int = TILE_SIZE_MULTIPLE) -> int:
+    """Work plan_tiles() schedules for a (height, width) image, in full 'tile_size' tiles."""
+    _, _, groups = plan_tiles(height, width, tile_size, overlap, min_tile_size)
+    processed_pixels = sum(size * size * len(coords) for size, coords in groups.items())
+    return math.ceil(processed_pixels / (tile_size * tile_size))
+
+
+def pad_to_size(image: torch.Tensor, height: int, width: int) -> torch.Tensor:
+    """
+    Reflect-pads a CHW tensor on the bottom/right to (height, width). Pads larger than the
+    image are applied in several reflections, like np.pad(mode='reflect').
+    """
+    while image.shape[1] < height or image.shape[2] < width:
+        h, w = image.shape[1:]
+        if (h < height and h == 1) or (w < width and w == 1):
+            # A 1-pixel edge cannot be reflected, replicate it instead
+            image = F.pad(image.unsqueeze(0), (0, width - w, 0, height - h), mode='replicate').squeeze(0)
+            continue
+        pad_h, pad_w = min(height - h, h - 1), min(width - w, w - 1)
+        image = F.pad(image.unsqueeze(0), (0, pad_w, 0, pad_h), mode='reflect').squeeze(0)
+    return image.contiguous()
+
+
+def blend_window(tile_size: int, overlap: int, device: torch.device) -> torch.Tensor:
+    """
+    (tile_size, tile_size) weights that fade linearly across the 'overlap' border so that
+    overlapping tiles are cross-faded instead of leaving hard seams. All ones without overlap.
+    """
+    ramp = torch.ones(tile_size, device=device)
+    if overlap > 0:
+        fade = torch.arange(1, overlap + 1, device=device, dtype=torch.float32) / (overlap + 1)
+        ramp[:overlap] = fade
+        ramp[-overlap:] = fade.flip(0)
+    return ramp[:, None] * ramp[None, :]
+
+
+def tile_pixel_index(coords: List[Tuple[int, int]], tile_size: int, width: int, device: torch.device, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Flat (y * width + x) indices of every pixel of every tile, shaped (tiles, tile_size, tile_size).
+    Written into 'out' (an int64 buffer of that shape) when given.
+    """
+    corners = torch.tensor([y * width + x for y, x in coords], device=device)
+    offsets = torch.arange(tile_size, device=device)
+    local_index = offsets[:, None] * width + offsets[None, :]
+    return torch.add(corners[:, None, None], local_index, out=out)
+
+
+def extract_tiles(image: torch.Tensor, coords: List[Tuple[int, int]], tile_size: int, index: Optional[torch.Tensor] = None, out: Optional[torch.Tensor] = None) -> torch.Tensor:
+    """
+    Gathers the tiles at 'coords' from a contiguous CHW tensor into one (B, C, t, t) batch.
+    'index' is a precomputed tile_pixel_index(); 'out' a (C, B * t * t) buffer to gather into.
+    """
+    channels, _, width = image.shape
+    if index is None:
+        index = tile_pixel_index(coords, tile_size, width, image.device)
+    gathered = torch.index_select(image.view(channels, -1), 1, index.view(-1), out=out)
+    return gathered.view(channels, len(coords), tile_size, tile_size).transpose(0, 1) # (C, B, t, t) -> (B, C, t, t)
+
+
+def accumulate_tiles(
+    output: torch.Tensor,
+    weights: torch.Tensor,
+    tiles: torch.Tensor,
+    coords: List[Tuple[int, int]],
+    window: torch.Tensor,
+    index: Optional[torch.Tensor] = None,
+    scratch: Optional[torch.Tensor] = None
+):
+    """
+    Adds a batch of restored (B, C, t, t) tiles, weighted by 'window', into the CHW 'output'
+    accumulator and the window itself into the (H, W) 'weights' map, each in one scatter-add.
+    Divide output by weights once all tiles are in to get the blended image. 'tiles' is
+    weighted in place; 'scratch' is an optional (C, B * t * t) buffer for the reordered tiles.
+    """
+    channels, _, width = output.shape
+    batch, tile_size = tiles.shape[0], tiles.shape[-1]
+    if index is None:
+        index = tile_pixel_index(coords, tile_size, width, output.device)
+    if scratch is None:
+        scratch = torch.empty((channels, batch * tile_size * tile_size), dtype=output.dtype, device=output.device)
+    scratch.view(channels, batch, tile_size, tile_size).copy_(tiles.mul_(window).transpose(0, 1))
+    output.view(channels, -1).index_add_(1, index.view(-1), scratch)
+    # The reordered tiles are consumed, so the scratch rows are reused for the expanded window
+    window_per_pixel = scratch[0]
+    window_per_pixel.view(batch, tile_size, tile_size).copy_(window.expand(batch, -1, -1))
+    weights.view(-1).index_add_(0, index.view(-1), window_per_pixel)
@@ -0,0 +1,68 @@
+# backend/app/engine/warmup.py
+import os
+import time
+import torch
+from typing import Dict, Any, List
+
+
+def get_warmup_shape_buckets() -> List[int]:
+    """
+    Reads the square input sizes to warm up from WARMUP_SHAPE_BUCKETS (e.g. "256,512").
+    Uformer's four downsampling stages and 8x8 windows need sizes that are multiples of 128,
+    so any other value is skipped with a warning.
+    """
+    raw_value = os.getenv("WARMUP_SHAPE_BUCKETS", "256")
+    shape_buckets = []
+    for token in raw_value.split(","):
+        token = token.strip()
+        if not token:
+            continue
+        try:
+            size = int(token)
+        except ValueError:
+            print(f"[WARMUP] Ignoring invalid shape bucket '{token}'.")
+            continue
+        if size <= 0 or size % 128 != 0:
+            print(f"[WARMUP] Ignoring shape bucket {size}: must be a positive multiple of 128.")
+            continue
+        shape_buckets.append(size)
+    return sorted(set(shape_buckets))
+
+
+def warmup_model(model: torch.nn.Module, model_key: str, device: torch.device, shape_buckets: List[int], iterations: int = 1) -> Dict[str, float]:
+    """
+    Runs synthetic forward passes through a single model at every shape bucket so that
+    allocator growth, kernel selection and weight page-faults happen before real traffic.
+    Returns the wall time (seconds) spent per bucket.
+    """
+    timings = {}
+    for size in shape_buckets:
+        dummy_input = torch.rand(1, 3, size, size, device=device)
+        start_time = time.perf_counter()
+        with torch.no_grad():
+            for _ in range(iterations):
+                model(dummy_input)
+        if device.type == 'cuda':
+            torch.cuda.synchronize(device)
+        timings[str(size)] = round(time.perf_counter() - start_time, 3)
+        print(f"[WARMUP] Model '{model_key}' warmed at {size}x{size} in {timings[str(size)]}s.")
+    return timings
+
+
+def warmup_loaded_models(models: Dict[str, Any], model_keys: List[str]) -> Dict[str, Any]:
+    """
+    Warms up every model in 'model_keys' that is currently loaded in the shared state.
+    This is blocking and is meant to be run in a worker thread during startup.
+    """
+    device = models["device"]
+    shape_buckets = get_warmup_shape_buckets()
+    iterations = max(1, int(os.getenv("WARMUP_ITERATIONS", 1)))
+    report = {"shape_buckets": shape_buckets, "models": {}}
+
+    for model_key in model_keys:
+        model = models.get(model_key)
+        if model is None:
+            continue
+        report["models"][model_key] = warmup_model(model, model_key, device, shape_buckets, iterations)
+
+    return report
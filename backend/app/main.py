@@ -2,19 +2,32 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, JSONResponse
 from contextlib import asynccontextmanager
 import os
 import torch
 from dotenv import load_dotenv
 import asyncio
+import time
 
 # Import the endpoint router to call its function directly
 from app.api.endpoints import cache_management
 
 # Import the model loading dependency AND the app_models dictionary
-from app.api.dependencies import load_models, app_models, unload_all_models_from_memory 
-from app.api.endpoints import image_file_processing, video_file_processing, live_stream_processing, cache_management
+from app.api.dependencies import load_models, app_models, unload_all_models_from_memory, model_definitions_dict, model_registry
+from app.engine.model_registry import build_model
+from app.api.endpoints import image_file_processing, video_file_processing, live_stream_processing, cache_management, engine_management
+from app.engine.warmup import warmup_loaded_models
+from app.engine.thread_tuner import InferenceJobGate, tune_cpu_threading
+from app.engine.autotuner import ExecutionAutotuner
+from app.engine.leases import ModelLeaseManager
+from app.engine.lanes import build_execution_lanes
+from app.engine.residency import ModelResidencyManager
+from app.engine.buffer_pool import TensorBufferPool
+from app.engine.input_cache import DecodedInputCache
+from app.engine.result_cache import ResultCache
+from app.engine.single_flight import SingleFlight
+from app.engine.artifact_writer import ArtifactWriter
 
 # Load environment variables from .env file
 load_dotenv()
@@ -38,6 +51,69 @@ async def periodic_cache_cleanup_task():
             print(f"[AUTO_CLEANUP] Error during scheduled cleanup: {e}")
 
 
+async def periodic_residency_task(residency: ModelResidencyManager):
+    """A periodic task that unloads idle models and preloads predicted ones."""
+    interval_seconds = float(os.getenv("RESIDENCY_CHECK_INTERVAL_SECONDS", 60))
+    print(f"[RESIDENCY] Task started. Idle TTL {residency.idle_ttl_seconds}s, checking every {interval_seconds}s.")
+
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await asyncio.to_thread(residency.run_cycle)
+        except Exception as e:
+            print(f"[RESIDENCY] Error during residency check: {e}")
+
+
+def _pick_calibration_model():
+    """
+    Returns the cheapest loaded model. If nothing is loaded yet (on-demand mode), builds an
+    untrained instance of the fastest registered model; its compute cost is the same.
+    """
+    loaded = [app_models[k] for k in model_definitions_dict if k in app_models]
+    if loaded:
+        return min(loaded, key=lambda m: sum(p.numel() for p in m.parameters()))
+    if not model_definitions_dict:
+        return None
+    speed_tiers = model_registry["speed_tiers"]
+    fastest_spec = min((info['spec'] for info in model_definitions_dict.values()), key=lambda spec: speed_tiers.index(spec['speed_tier']))
+    return build_model(fastest_spec).eval()
+
+
+async def startup_readiness_task(run_thread_tuning: bool, run_warmup: bool, run_execution_tuning: bool = False):
+    """
+    Calibrates CPU threading, runs synthetic forwards for every loaded model and tunes their
+    missing execution configs in a worker thread, then marks the replica as ready. Until this
+    finishes, /ready reports not-ready.
+    """
+    readiness = app_models["readiness"]
+    start_time = time.time()
+    try:
+        if run_thread_tuning:
+            calibration_model = _pick_calibration_model()
+            if calibration_model is not None:
+                readiness["phase"] = "calibrating_threads"
+                await asyncio.to_thread(tune_cpu_threading, app_models, calibration_model)
+
+        if run_warmup:
+            readiness["phase"] = "warming_up"
+            model_keys = [k for k in model_definitions_dict.keys() if k in app_models]
+            readiness["warmup"] = await asyncio.to_thread(warmup_loaded_models, app_models, model_keys)
+
+        if run_execution_tuning:
+            readiness["phase"] = "tuning_execution"
+            autotuner = app_models["autotuner"]
+            for model_key in [k for k in model_definitions_dict.keys() if k in app_models]:
+                await asyncio.to_thread(autotuner.tune_missing, model_key, app_models[model_key], app_models["device"])
+
+        readiness["phase"] = "ready"
+        readiness["ready"] = True
+        print(f"[WARMUP] Startup preparation finished in {time.time() - start_time:.2f}s. Replica is ready.")
+    except Exception as e:
+        readiness["phase"] = "warmup_failed"
+        readiness["error"] = str(e)
+        print(f"[WARMUP] ERROR: Startup preparation failed, replica stays not-ready: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """
@@ -52,10 +128,20 @@ async def lifespan(app: FastAPI):
     print(f"Using device: {device}")
     app_models["device"] = device # Store device in shared state
     app_models["tasks_db"] = {} # Initialize shared dictionary for background task status
-    app_models["models_in_use"] = {} # Initialize reference counter for models in use
+    app_models["model_leases"] = ModelLeaseManager() # Thread-safe reference counting for models in use
     app_models["tracker_by_path"] = {} # Main tracker for result file metadata
     app_models["path_by_task_id"] = {} # Secondary index for task_id -> path lookups
     app_models["in_progress_uploads"] = {} # Tracks raw uploads being used by active tasks
+    app_models["readiness"] = {"ready": False, "phase": "loading_models", "warmup": {}} # Gates /ready until warmup finishes
+    # Default threading until the CPU autotuner (if enabled) installs a calibrated configuration
+    app_models["thread_config"] = {"threads_per_job": torch.get_num_threads(), "concurrent_jobs": None, "source": "default"}
+    app_models["inference_gate"] = InferenceJobGate(torch.get_num_threads())
+    app_models["autotuner"] = ExecutionAutotuner() # Per (model, shape bucket) attention backend / tile / batch choices
+    app_models["buffer_pool"] = TensorBufferPool() # Frame and tile-batch buffers reused across frames, sessions and jobs
+    app_models["decoded_input_cache"] = DecodedInputCache() # Content-hash keyed decoded / RAW-developed uploads
+    app_models["result_cache"] = ResultCache() # Content-addressed index of finished result files
+    app_models["single_flight"] = SingleFlight() # Coalesces identical image/video jobs that are in progress
+    app_models["artifact_writer"] = ArtifactWriter() # Background writes of upload copies and debug inputs
 
     # Determine model loading strategy from environment variable
     load_all_on_startup = os.getenv("LOAD_ALL_MODELS_ON_STARTUP", "True").lower() == "true"
@@ -70,14 +156,45 @@ async def lifespan(app: FastAPI):
             print(f"FATAL ERROR: Failed to load one or more Uformer models on startup: {e}")
             # Clear any partially loaded models to indicate a failed state
             for key in list(app_models.keys()):
-                if key not in ['device', 'load_all_on_startup', 'tasks_db']:
+                if key in model_definitions_dict:
                     del app_models[key]
     else:
         print("Models will be loaded on demand. Initial VRAM usage low.")
         # Pre-populate model definitions so they are ready for on-demand loading
         # This will save a bit of overhead compared to defining them every time.
         await load_models(device, app_models=app_models, load_definitions_only=True)
-        print(f"Model definitions loaded successfully. Ready for on-demand loading: {list(k for k in app_models.keys() if k not in ['device', 'load_all_on_startup', 'tasks_db', 'models_in_use', 'tracker_by_path', 'path_by_task_id'])}")
+        print(f"Model definitions loaded successfully. Ready for on-demand loading: {list(model_definitions_dict.keys())}")
+
+    # --- Build the per-model execution lanes (worker pools, optionally pinned to CPU cores) ---
+    try:
+        app_models["execution_lanes"] = build_execution_lanes(model_registry)
+    except (ValueError, KeyError) as e:
+        print(f"[LANES] Invalid execution lane configuration, using a single default lane: {e}")
+        app_models["execution_lanes"] = build_execution_lanes({**model_registry, "execution_lanes": []})
+
+    # --- Calibrate CPU threading and warm up loaded models before reporting ready ---
+    warmup_task = None
+    run_thread_tuning = device.type == 'cpu' and os.getenv("ENABLE_THREAD_AUTOTUNE", "True").lower() == "true"
+    run_warmup = os.getenv("ENABLE_STARTUP_WARMUP", "True").lower() == "true"
+    run_execution_tuning = os.getenv("AUTOTUNE_ON_STARTUP", "True").lower() == "true"
+    if load_all_on_startup and not any(k in app_models for k in model_definitions_dict):
+        app_models["readiness"]["phase"] = "model_load_failed"
+        print("[WARMUP] No models were loaded, replica will stay not-ready.")
+    elif run_thread_tuning or run_warmup or run_execution_tuning:
+        warmup_task = asyncio.create_task(startup_readiness_task(run_thread_tuning, run_warmup, run_execution_tuning))
+    else:
+        app_models["readiness"].update({"ready": True, "phase": "ready"})
+        print("[WARMUP] Startup warmup and thread autotuning are disabled.")
+
+    # --- Schedule the model residency policy (idle unloading, predictive preloading) ---
+    # With LOAD_ALL_MODELS_ON_STARTUP every model is meant to stay resident, so it only runs on demand.
+    residency_task = None
+    if not load_all_on_startup and os.getenv("ENABLE_MODEL_RESIDENCY", "True").lower() == "true":
+        app_models["residency"] = ModelResidencyManager(app_models, model_definitions_dict)
+        app_models["model_leases"].usage_listener = app_models["residency"]
+        residency_task = asyncio.create_task(periodic_residency_task(app_models["residency"]))
+    else:
+        print("[RESIDENCY] Model residency policy is disabled.")
 
     # --- Schedule the automatic cleanup task if enabled ---
     if os.getenv("ENABLE_AUTOMATIC_CACHE_CLEANUP", "False").lower() == "true":
@@ -88,12 +205,21 @@ async def lifespan(app: FastAPI):
 
     yield # Application is running
 
+    if warmup_task and not warmup_task.done():
+        warmup_task.cancel()
+    if residency_task:
+        residency_task.cancel()
+
     # --- Cancel the cleanup task on shutdown ---
     if cleanup_task:
         cleanup_task.cancel()
         print("[AUTO_CLEANUP] Automatic cache cleanup task stopped.")
 
     print("FastAPI application shutdown...")
+    if "execution_lanes" in app_models:
+        app_models["execution_lanes"].shutdown()
+    if "artifact_writer" in app_models:
+        app_models["artifact_writer"].shutdown()
     if app_models:
         # On shutdown, ensure all models are cleared from memory
         unload_all_models_from_memory(app_models)
@@ -136,6 +262,7 @@ app.include_router(live_stream_processing.router, tags=["live_stream_processing"
 app.include_router(video_file_processing.router, tags=["video_file_processing"])
 app.include_router(image_file_processing.router, tags=["image_file_processing"])
 app.include_router(cache_management.router, tags=["cache_management"])
+app.include_router(engine_management.router, tags=["engine_management"])
 
 
 @app.get("/health", tags=["healthcheck"])
@@ -147,6 +274,16 @@ async def health_check():
     else:
         return {"status": "error", "models_loaded": False, "detail": "Uformer models failed to load.", "device": str(app_models.get("device", "N/A"))}
 
+@app.get("/ready", tags=["healthcheck"])
+async def readiness_check():
+    """
+    Readiness probe for load balancers. Returns 503 until every loaded model has been
+    warmed up, so traffic only reaches replicas that will not pay first-request costs.
+    """
+    readiness = app_models.get("readiness", {"ready": False, "phase": "starting"})
+    status_code = 200 if readiness.get("ready") else 503
+    return JSONResponse(status_code=status_code, content=readiness)
+
 @app.get("/")
 async def read_root():
     return {"message": "Welcome to NocturaVision Uformer API! Visit /docs for API documentation."}
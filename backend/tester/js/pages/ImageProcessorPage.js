@@ -148,6 +148,14 @@ const ImageProcessorPage = {
                         break;
                     case 'processing':
                         statusEl.textContent = `Processing... ${data.progress || 0}%`;
+                        // Show the fast preview until the full-quality result replaces it
+                        if (data.preview_result_path) {
+                            if (!processedImage.src.endsWith(data.preview_result_path)) {
+                                processedImage.src = `${config.API_BASE_URL}${data.preview_result_path}`;
+                                processedImage.classList.remove('hidden');
+                            }
+                            statusEl.textContent = `Preview ready. Processing full quality... ${data.progress || 0}%`;
+                        }
                         break;
                     default:
                         statusEl.textContent = data.message || 'Task is pending...';
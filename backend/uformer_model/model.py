@@ -8,6 +8,10 @@ from einops.layers.torch import Rearrange
 import math
 import numpy as np
 import time
+import threading
+import contextvars
+from contextlib import contextmanager
+from collections import OrderedDict
 from torch import einsum
 
 
@@ -491,10 +495,15 @@ class WindowAttention(nn.Module):
         self.proj_drop = nn.Dropout(proj_drop)
 
         self.softmax = nn.Softmax(dim=-1)
+        # 'reference' keeps the explicit softmax(QK^T)V path, 'fused' uses F.scaled_dot_product_attention.
+        # set_attention_backend() sets the model-wide default; attention_backend() overrides it per call.
+        self.attention_backend = 'reference'
 
     def forward(self, x, attn_kv=None, mask=None):
         B_, N, C = x.shape
         q, k, v = self.qkv(x,attn_kv)
+        if (_ATTENTION_BACKEND_OVERRIDE.get() or self.attention_backend) == 'fused':
+            return self.fused_forward(q, k, v, B_, N, C, mask)
         q = q * self.scale
         attn = (q @ k.transpose(-2, -1))
 
@@ -522,6 +531,31 @@ class WindowAttention(nn.Module):
         x = self.proj_drop(x)
         return x
 
+    def fused_forward(self, q, k, v, B_, N, C, mask=None):
+        # Same math as the reference path, with the bias and shift mask folded into one additive attn_mask
+        relative_position_bias = self.relative_position_bias_table[self.relative_position_index.view(-1)].view(
+            self.win_size[0] * self.win_size[1], self.win_size[0] * self.win_size[1], -1)  # Wh*Ww,Wh*Ww,nH
+        relative_position_bias = relative_position_bias.permute(2, 0, 1).contiguous()  # nH, Wh*Ww, Wh*Ww
+        ratio = k.size(-2)//relative_position_bias.size(-1)
+        relative_position_bias = repeat(relative_position_bias, 'nH l c -> nH l (c d)', d = ratio)
+        dropout_p = self.attn_drop.p if self.training else 0.
+
+        if mask is not None:
+            nW = mask.shape[0]
+            mask = repeat(mask, 'nW m n -> nW m (n d)',d = ratio)
+            attn_mask = (relative_position_bias.unsqueeze(0) + mask.unsqueeze(1)).unsqueeze(0)  # 1, nW, nH, N, N*ratio
+            q = q.reshape(B_ // nW, nW, self.num_heads, N, -1)
+            k = k.reshape(B_ // nW, nW, self.num_heads, k.size(-2), -1)
+            v = v.reshape(B_ // nW, nW, self.num_heads, v.size(-2), -1)
+        else:
+            attn_mask = relative_position_bias.unsqueeze(0)  # 1, nH, N, N*ratio
+
+        x = F.scaled_dot_product_attention(q, k, v, attn_mask=attn_mask, dropout_p=dropout_p, scale=self.scale)
+        x = x.reshape(B_, self.num_heads, N, -1).transpose(1, 2).reshape(B_, N, C)
+        x = self.proj(x)
+        x = self.proj_drop(x)
+        return x
+
     def extra_repr(self) -> str:
         return f'dim={self.dim}, win_size={self.win_size}, num_heads={self.num_heads}'
 
@@ -726,6 +760,43 @@ def window_reverse(windows, win_size, H, W, dilation_rate=1):
         x = x.permute(0, 1, 3, 2, 4, 5).contiguous().view(B, H, W, -1)
     return x
 
+# The SW-MSA shift mask only depends on the feature map size, window and shift, and is
+# broadcast over the batch inside WindowAttention (nW, N, N), so one copy serves every
+# block, every tile batch size and every forward at that resolution.
+_SHIFT_MASK_CACHE_SIZE = 16
+_shift_mask_cache = OrderedDict()
+_shift_mask_cache_lock = threading.Lock()
+
+def get_shift_attn_mask(H, W, win_size, shift_size, device, dtype):
+    key = (H, W, win_size, shift_size, device, dtype)
+    with _shift_mask_cache_lock:
+        if key in _shift_mask_cache:
+            _shift_mask_cache.move_to_end(key)
+            return _shift_mask_cache[key]
+
+    shift_mask = torch.zeros((1, H, W, 1), device=device, dtype=dtype)
+    h_slices = (slice(0, -win_size),
+                slice(-win_size, -shift_size),
+                slice(-shift_size, None))
+    w_slices = (slice(0, -win_size),
+                slice(-win_size, -shift_size),
+                slice(-shift_size, None))
+    cnt = 0
+    for h in h_slices:
+        for w in w_slices:
+            shift_mask[:, h, w, :] = cnt
+            cnt += 1
+    shift_mask_windows = window_partition(shift_mask, win_size)  # nW, win_size, win_size, 1
+    shift_mask_windows = shift_mask_windows.view(-1, win_size * win_size) # nW, win_size*win_size
+    shift_attn_mask = shift_mask_windows.unsqueeze(1) - shift_mask_windows.unsqueeze(2) # nW, win_size*win_size, win_size*win_size
+    shift_attn_mask = shift_attn_mask.masked_fill(shift_attn_mask != 0, float(-100.0)).masked_fill(shift_attn_mask == 0, float(0.0))
+
+    with _shift_mask_cache_lock:
+        _shift_mask_cache[key] = shift_attn_mask
+        while len(_shift_mask_cache) > _SHIFT_MASK_CACHE_SIZE:
+            _shift_mask_cache.popitem(last=False)
+    return shift_attn_mask
+
 #########################################
 # Downsample Block
 class Downsample(nn.Module):
@@ -923,23 +994,8 @@ class LeWinTransformerBlock(nn.Module):
 
         ## shift mask
         if self.shift_size > 0:
-            # calculate attention mask for SW-MSA
-            shift_mask = torch.zeros((1, H, W, 1)).type_as(x)
-            h_slices = (slice(0, -self.win_size),
-                        slice(-self.win_size, -self.shift_size),
-                        slice(-self.shift_size, None))
-            w_slices = (slice(0, -self.win_size),
-                        slice(-self.win_size, -self.shift_size),
-                        slice(-self.shift_size, None))
-            cnt = 0
-            for h in h_slices:
-                for w in w_slices:
-                    shift_mask[:, h, w, :] = cnt
-                    cnt += 1
-            shift_mask_windows = window_partition(shift_mask, self.win_size)  # nW, win_size, win_size, 1
-            shift_mask_windows = shift_mask_windows.view(-1, self.win_size * self.win_size) # nW, win_size*win_size
-            shift_attn_mask = shift_mask_windows.unsqueeze(1) - shift_mask_windows.unsqueeze(2) # nW, win_size*win_size, win_size*win_size
-            shift_attn_mask = shift_attn_mask.masked_fill(shift_attn_mask != 0, float(-100.0)).masked_fill(shift_attn_mask == 0, float(0.0))
+            # attention mask for SW-MSA, shared by the whole batch (and cached across forwards)
+            shift_attn_mask = get_shift_attn_mask(H, W, self.win_size, self.shift_size, x.device, x.dtype)
             attn_mask = attn_mask + shift_attn_mask if attn_mask is not None else shift_attn_mask
 
 
@@ -1354,6 +1410,32 @@ class Uformer(nn.Module):
         return flops
 
 
+def set_attention_backend(model, backend):
+    """Switches every WindowAttention in 'model' to the 'reference' or 'fused' attention path."""
+    if backend not in ('reference', 'fused'):
+        raise ValueError(f"Unknown attention backend: {backend}")
+    for module in model.modules():
+        if isinstance(module, WindowAttention):
+            module.attention_backend = backend
+
+
+# Per-call attention backend. A context variable is local to the thread (or task) running the
+# forward, so jobs sharing one model instance can use different backends at the same time.
+_ATTENTION_BACKEND_OVERRIDE = contextvars.ContextVar('attention_backend_override', default=None)
+
+
+@contextmanager
+def attention_backend(backend):
+    """Runs the forwards inside the block with the 'reference' or 'fused' attention path, without modifying any model."""
+    if backend not in ('reference', 'fused'):
+        raise ValueError(f"Unknown attention backend: {backend}")
+    token = _ATTENTION_BACKEND_OVERRIDE.set(backend)
+    try:
+        yield
+    finally:
+        _ATTENTION_BACKEND_OVERRIDE.reset(token)
+
+
 if __name__ == "__main__":
     input_size = 256
     arch = Uformer